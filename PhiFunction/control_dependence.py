@@ -0,0 +1,222 @@
+"""
+Post-dominance and control dependence.
+
+Block Y post-dominates block X if every path from X to the end of the
+program goes through Y. A program ends when it falls off its last block, and
+loops that never terminate have no way out; to give every block a place in
+the post-dominance tree, the reversed CFG is rooted at a virtual exit node,
+which follows the last block, every block without successors, and one block
+of each region that cannot reach the end. The tree is then computed with the
+same dominator algorithm used for the dominance tree.
+
+Block Y is control dependent on block X if X ends with a branch that decides
+whether Y runs: one successor of X always leads to Y, and the other can
+avoid it. Following "The Program Dependence Graph and Its Use in
+Optimization" (Ferrante, Ottenstein and Warren), the control dependences are
+found by walking up the post-dominance tree from the target of every edge
+X -> Z until the immediate post-dominator of X.
+"""
+import parser
+from ssa_form import immediate_dominators
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class PostDominanceGraph:
+    """
+    The post-dominance tree of the CFG built by 'parser.to_basic_blocks'.
+    Blocks are referred to by their indices; the virtual exit has index
+    'len(basic_blocks)', and is the immediate post-dominator of the blocks
+    that can leave the program.
+
+    Example:
+        >>> program = [
+        ...     '{"a": 0, "b": 3}',
+        ...     'bt a 3',
+        ...     'x = add a b',
+        ...     'y = add x b',
+        ...     'z = mul a b',
+        ... ]
+        >>> prog, env = parser.build_cfg(program)
+        >>> pdg = PostDominanceGraph(parser.to_basic_blocks(prog))
+        >>> pdg.post_dominance_graph()
+        {3: {2}, 2: {0, 1}, 0: set(), 1: set()}
+        >>> pdg.immediate_post_dominator(0), pdg.immediate_post_dominator(2)
+        (2, None)
+        >>> pdg.post_dominates(2, 0), pdg.post_dominates(1, 0)
+        (True, False)
+    """
+
+    def __init__(s, basic_blocks: List[parser.BasicBlock]):
+        s.bbs = basic_blocks
+        s.exit = len(basic_blocks)
+        s.exits = s._exit_blocks()
+        s.immediate_domain: Dict[int, Set[int]] = dict()
+        s.post_dominators: Dict[int, Set[int]] = dict()
+        for index in list(range(len(s.bbs))) + [s.exit]:
+            s.immediate_domain[index] = set()
+            s.post_dominators[index] = set()
+        idoms = immediate_dominators(s.reversed_flow_graph(), s.exit)
+        for (node, idom) in idoms.items():
+            s.immediate_domain[idom].add(node)
+            s.post_dominators[node].add(idom)
+
+    def reversed_flow_graph(s) -> Dict[int, List[int]]:
+        """
+        Maps every node to its predecessors, and the virtual exit to the
+        blocks that reach it.
+        """
+        rfg = dict()
+        for bb in s.bbs:
+            rfg[bb.index] = [prev.index for prev in bb.PREVS]
+        rfg[s.exit] = sorted(s.exits)
+        return rfg
+
+    def _exit_blocks(s) -> Set[int]:
+        """
+        Returns the blocks linked to the virtual exit: the last block, which
+        falls off the program, blocks without successors, and the last block
+        of each region that cannot reach any of these.
+        """
+        if len(s.bbs) == 0:
+            return set()
+        exits = set([s.bbs[-1].index])
+        exits |= set([bb.index for bb in s.bbs if len(bb.NEXTS) == 0])
+        reaches = set()
+        worklist = list(exits)
+        while True:
+            while len(worklist) > 0:
+                index = worklist.pop()
+                if index in reaches:
+                    continue
+                reaches.add(index)
+                worklist += [prev.index for prev in s.bbs[index].PREVS]
+            stuck = [bb.index for bb in s.bbs if bb.index not in reaches]
+            if len(stuck) == 0:
+                return exits
+            exits.add(max(stuck))
+            worklist = [max(stuck)]
+
+    def get_immediate_domain_indices(s, index: int) -> Set[int]:
+        return s.immediate_domain[index]
+
+    def get_post_dominator_indices(s, index: int) -> Set[int]:
+        return s.post_dominators[index]
+
+    def get_NEXTS_indices(s, index: int) -> Set[int]:
+        return set([bb.index for bb in s.bbs[index].NEXTS])
+
+    def get_PREVS_indices(s, index: int) -> Set[int]:
+        return set([bb.index for bb in s.bbs[index].PREVS])
+
+    def _post_dominance_graph(s, root: int, pdg: dict):
+        children = s.immediate_domain[root]
+        pdg[root] = children
+        for child in children:
+            s._post_dominance_graph(child, pdg)
+
+    def post_dominance_graph(s, root: Optional[int] = None) -> dict:
+        pdg = dict()
+        s._post_dominance_graph(s.exit if root is None else root, pdg)
+        return pdg
+
+    def immediate_post_dominator(s, index: int) -> Optional[int]:
+        """
+        Returns the index of the immediate post-dominator of a block, or None
+        if the block is only post-dominated by the virtual exit.
+        """
+        ipdom = min(s.post_dominators[index], default=None)
+        return None if ipdom == s.exit else ipdom
+
+    def post_dominates(s, post_dominator: int, index: int) -> bool:
+        """
+        Tells if block 'post_dominator' post-dominates block 'index'. Every
+        block post-dominates itself.
+        """
+        while index is not None:
+            if index == post_dominator:
+                return True
+            index = s.immediate_post_dominator(index)
+        return False
+
+
+class ControlDependenceGraph:
+    """
+    The control dependence graph of the CFG built by 'parser.to_basic_blocks'.
+    A dependence is a pair (block, outcome): the block that ends with the
+    deciding branch, and the value of the branch condition that leads to the
+    dependent block. Blocks that always run, once the program starts, have
+    no control dependences.
+
+    Example:
+        >>> program = [
+        ...     '{"zero": 0, "one": 1, "five": 5, "true": true}',
+        ...     'a = add zero one',
+        ...     'jump = geq a zero',
+        ...     'bt jump 5',
+        ...     'a = add a one',
+        ...     'bt true 10',
+        ...     'a = add a one',
+        ...     'jump = geq a five',
+        ...     'bt jump 10',
+        ...     'a = add a one',
+        ...     'bt true 5',
+        ...     'end = add zero zero',
+        ... ]
+        >>> prog, env = parser.build_cfg(program)
+        >>> cdg = ControlDependenceGraph(parser.to_basic_blocks(prog))
+        >>> for i in range(5):
+        ...     print(i, sorted(cdg.get_control_dependences(i)))
+        0 []
+        1 [(0, False)]
+        2 [(0, True), (1, False), (3, True)]
+        3 [(2, False)]
+        4 []
+        >>> sorted(cdg.get_dependent_indices(2))
+        [3]
+        >>> sorted(cdg.post_dominance_frontier(2))
+        [0, 1, 3]
+    """
+
+    def __init__(s, basic_blocks: List[parser.BasicBlock]):
+        s.bbs = basic_blocks
+        s.pdg = PostDominanceGraph(basic_blocks)
+        s.dependences: Dict[int, Set[Tuple[int, bool]]] = dict()
+        s.dependents: Dict[int, Set[int]] = dict()
+        for bb in s.bbs:
+            s.dependences[bb.index] = set()
+            s.dependents[bb.index] = set()
+        for bb in s.bbs:
+            if len(bb.NEXTS) < 2:
+                continue
+            # the fall-through successor comes first, the jump target last
+            for (nxt, outcome) in zip(bb.NEXTS, [False, True]):
+                s._add_dependences(bb.index, nxt.index, outcome)
+
+    def _add_dependences(s, branch: int, target: int, outcome: bool):
+        stop = min(s.pdg.post_dominators[branch], default=s.pdg.exit)
+        runner = target
+        while runner != stop and runner != s.pdg.exit:
+            s.dependences[runner].add((branch, outcome))
+            s.dependents[branch].add(runner)
+            runner = min(s.pdg.post_dominators[runner], default=s.pdg.exit)
+
+    def get_control_dependences(s, index: int) -> Set[Tuple[int, bool]]:
+        return s.dependences[index]
+
+    def get_control_dependence_indices(s, index: int) -> Set[int]:
+        return set([branch for (branch, _) in s.dependences[index]])
+
+    def get_dependent_indices(s, index: int) -> Set[int]:
+        """
+        Returns the blocks whose execution depends on the branch that ends
+        block 'index'.
+        """
+        return s.dependents[index]
+
+    def post_dominance_frontier(s, index: int) -> Set[int]:
+        """
+        Returns the blocks that have a successor post-dominated by block
+        'index', without being strictly post-dominated by it. These are the
+        blocks on which 'index' is control dependent.
+        """
+        return s.get_control_dependence_indices(index)
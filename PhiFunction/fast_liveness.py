@@ -0,0 +1,186 @@
+"""
+Fast liveness checking for programs in SSA form.
+
+Liveness sets are usually computed by solving a data-flow problem over the
+whole program. In SSA form, a question such as "is 'v' alive at the entry of
+block 'q'?" can be answered directly, with the algorithm of "Fast Liveness
+Checking for SSA-Form Programs" (Boissinot et al.). Besides the definition
+and the uses of each variable, it only needs sets that depend on the shape
+of the control flow graph, computed once:
+
+- R(q): the blocks reachable from q in the reduced graph, which is the CFG
+  without its back edges;
+- T(q): q, plus T(t) for every back edge s -> t such that R(q) contains s,
+  but not t: the headers of the loops that enclose q;
+- the dominance tree, numbered so that dominance is an interval check.
+
+'v' is alive at the entry of 'q' if the block that defines 'v' strictly
+dominates 'q', and some block 't' of T(q), also strictly dominated by that
+definition, reaches a use of 'v' in R(t). Sets of blocks are integers, with
+one bit per block. A phi-function reads its sources at the end of the
+corresponding predecessors, and the variables of the environment are
+defined before the entry block. The check needs a program in strict SSA
+form, where each variable has one definition, which dominates its uses, and
+a reducible CFG, where back edges are the edges whose targets dominate their
+sources.
+"""
+import lang
+import parser
+from loops import LoopForest
+from ssa_form import PhiFunction
+from typing import Dict, List, Optional
+
+
+class LivenessChecker:
+    """
+    Answers liveness queries about the blocks of a program in SSA form.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'count = add zero one',
+        ...     'sum = add zero zero',
+        ...     'sum = add sum count',
+        ...     'count = add count one',
+        ...     'repeat = geq five count',
+        ...     'bt repeat 2',
+        ...     'end = add zero sum',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> checker = LivenessChecker(parser.to_basic_blocks(prog), env)
+        >>> [checker.is_live_in('five_0', q) for q in range(3)]
+        [True, True, False]
+        >>> [checker.is_live_in('sum_2', q) for q in range(3)]
+        [False, False, True]
+        >>> [checker.is_live_out('sum_2', q) for q in range(3)]
+        [False, True, False]
+        >>> checker.is_live_in('sum_1', 1), checker.is_live_out('sum_0', 0)
+        (False, True)
+    """
+    def __init__(s, basic_blocks: List[parser.BasicBlock], env: lang.Env):
+        s.basic_blocks = basic_blocks
+        forest = LoopForest(basic_blocks)
+        if any([not loop.reducible for loop in forest.loops]):
+            raise ValueError('the control flow graph is not reducible')
+        # definitions and uses of every variable
+        s.defs: Dict[str, Optional[int]] = dict()
+        s.uses: Dict[str, int] = dict()
+        for var in env.definitions():
+            s.defs[var] = None
+        for bb in basic_blocks:
+            for inst in bb.instructions:
+                for var in inst.definition():
+                    s.defs[var] = bb.index
+                if type(inst) is PhiFunction:
+                    for (var, pred) in zip(inst.srcs, inst.blocks):
+                        s.uses[var] = s.uses.get(var, 0) | (1 << pred)
+                else:
+                    for var in inst.uses():
+                        s.uses[var] = s.uses.get(var, 0) | (1 << bb.index)
+        s._number_dominance_tree(forest.idoms)
+        s._compute_reachability(forest.back_edges())
+
+    def _number_dominance_tree(s, idoms: Dict[int, int]):
+        """
+        Numbers the dominance tree in preorder, so that 'a' dominates 'b'
+        if the number of 'b' is between the number of 'a' and the number of
+        its last descendant.
+        """
+        children = dict([(bb.index, []) for bb in s.basic_blocks])
+        for (index, idom) in sorted(idoms.items()):
+            children[idom].append(index)
+        s.pre: Dict[int, int] = dict()
+        s.last: Dict[int, int] = dict()
+        stack = [(0, iter(children[0]))] if len(s.basic_blocks) > 0 else []
+        s.pre[0] = 0
+        while len(stack) > 0:
+            (node, successors) = stack[-1]
+            child = next(successors, None)
+            if child is None:
+                stack.pop()
+                s.last[node] = len(s.pre) - 1
+            else:
+                s.pre[child] = len(s.pre)
+                stack.append((child, iter(children[child])))
+
+    def _compute_reachability(s, back_edges: List[tuple]):
+        """
+        Computes R and T for every block reachable from the entry, as
+        bitsets. The reduced graph is acyclic, so R follows from a
+        post-order traversal of it.
+        """
+        back = set(back_edges)
+        reduced = dict([(bb.index, [nxt.index for nxt in bb.NEXTS
+                                    if (bb.index, nxt.index) not in back])
+                        for bb in s.basic_blocks if bb.index in s.pre])
+        s.R: Dict[int, int] = dict()
+        for root in reduced:
+            stack = [(root, iter(reduced[root]))] if root not in s.R else []
+            while len(stack) > 0:
+                (node, successors) = stack[-1]
+                nxt = next(successors, None)
+                if nxt is None:
+                    stack.pop()
+                    bits = 1 << node
+                    for succ in reduced[node]:
+                        bits |= s.R[succ]
+                    s.R[node] = bits
+                elif nxt not in s.R:
+                    stack.append((nxt, iter(reduced[nxt])))
+        s.T: Dict[int, int] = dict()
+        for q in reduced:
+            targets = 1 << q
+            worklist = [q]
+            while len(worklist) > 0:
+                t = worklist.pop()
+                for (tail, head) in back_edges:
+                    if s.R[t] >> tail & 1 and not s.R[t] >> head & 1 and \
+                            not targets >> head & 1:
+                        targets |= 1 << head
+                        worklist.append(head)
+            s.T[q] = targets
+
+    def _strictly_dominates(s, a: Optional[int], b: int) -> bool:
+        if b not in s.pre:
+            return False
+        if a is None:
+            return True
+        return a != b and a in s.pre and \
+            s.pre[a] <= s.pre[b] <= s.last[a]
+
+    def is_live_in(s, var: str, q: int) -> bool:
+        """
+        Tells if 'var' is alive at the entry of the block 'q'. The
+        phi-functions of 'q' read their sources at the end of its
+        predecessors, so their reads do not count.
+        """
+        if var not in s.defs:
+            return False
+        d = s.defs[var]
+        uses = s.uses.get(var, 0)
+        if not s._strictly_dominates(d, q) or uses == 0:
+            return False
+        targets = s.T[q]
+        while targets:
+            low = targets & -targets
+            t = low.bit_length() - 1
+            targets ^= low
+            if s._strictly_dominates(d, t) and s.R[t] & uses:
+                return True
+        return False
+
+    def is_live_out(s, var: str, q: int) -> bool:
+        """
+        Tells if 'var' is alive at the exit of the block 'q'.
+        """
+        if q not in s.pre:
+            return False
+        for nxt in s.basic_blocks[q].NEXTS:
+            if s.is_live_in(var, nxt.index):
+                return True
+            for inst in nxt.instructions:
+                if type(inst) is PhiFunction and \
+                        (var, q) in zip(inst.srcs, inst.blocks):
+                    return True
+        return False
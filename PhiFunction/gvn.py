@@ -0,0 +1,139 @@
+"""
+Dominator-based global value numbering.
+
+In SSA form a variable never changes value, so two instructions that apply
+the same operator to the same variables compute the same value. This pass
+follows the dominator-based value numbering of "Value Numbering" (Briggs,
+Cooper and Simpson): the dominance tree is traversed from the root, and a
+hash table maps each expression to the first variable that holds it. The
+table of a block inherits the entries of its immediate dominator, so an
+expression is only reused where its first computation dominates. Because
+'add' and 'mul' are commutative, their operands are sorted before hashing.
+
+A redundant instruction is removed, and its uses read the variable that
+holds the value instead. Variables of the environment that hold the same
+constant share a value number, and so do phi-functions whose sources all
+have the same value number. A block keeps a copy if all of its instructions
+would be removed, so that the shape of the CFG does not change.
+"""
+import lang
+import parser
+from ssa_form import DominanceGraph, PhiFunction, Copy, linearize, rename_uses
+from typing import Dict, List, Optional
+
+COMMUTATIVE = [lang.Add, lang.Mul]
+
+
+def expression_key(inst: lang.Inst) -> Optional[tuple]:
+    """
+    Returns the key of the expression computed by a binary operation, or None
+    for other instructions.
+
+    Example:
+        >>> expression_key(lang.Add('x', 'b', 'a'))
+        ('Add', 'a', 'b')
+        >>> expression_key(lang.Lth('x', 'b', 'a'))
+        ('Lth', 'b', 'a')
+    """
+    if not isinstance(inst, lang.BinOp):
+        return None
+    operands = [inst.src0, inst.src1]
+    if type(inst) in COMMUTATIVE:
+        operands.sort()
+    return (type(inst).__name__, *operands)
+
+
+def value_numbering(program: List[lang.Inst], env: lang.Env,
+                    bbs: List[parser.BasicBlock] = None,
+                    dg: DominanceGraph = None) -> (List[lang.Inst], lang.Env):
+    """
+    Removes the instructions of a program in SSA form that recompute a value
+    already available. 'bbs' and 'dg' are the basic blocks of the program
+    and their dominance graph, if they are at hand; the blocks are edited in
+    place.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> from driver import print_program
+        >>> prog, env = parser.build_cfg([
+        ...     '{"a": 1, "b": 2, "one": 1, "t": true}',
+        ...     'x = add a b',
+        ...     'bt t 4',
+        ...     'y = mul a b',
+        ...     'v = add y one',
+        ...     'z = add b a',
+        ...     'w = mul b a',
+        ...     'u = add w a',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> prog, env = value_numbering(prog, env)
+        >>> print_program(prog)
+        0: x_0 = add a_0 b_0
+        1: bt t_0 4
+        2: y_0 = mul a_0 b_0
+        3: v_0 = add y_0 a_0
+        4: w_0 = mul b_0 a_0
+        5: u_0 = add w_0 a_0
+
+    'z' is the value of 'x' with the operands swapped, and 'one' holds the
+    same constant as 'a'. The product in the second block is kept, because
+    the first block does not dominate it.
+    """
+    if bbs is None:
+        bbs = parser.to_basic_blocks(program)
+    if dg is None:
+        dg = DominanceGraph(bbs, env)
+        dg.compute_dominance_graph()
+    names: Dict[str, str] = dict()
+    constants = dict()
+    for var in sorted(env.definitions()):
+        value = env.get(var)
+        key = ('const', type(value).__name__, value)
+        if constants.setdefault(key, var) != var:
+            names[var] = constants[key]
+
+    def visit(index: int, table: dict):
+        table = dict(table)
+        bb = bbs[index]
+        kept = []
+        removed = []
+        for inst in bb.instructions:
+            rename_uses(inst, names)
+            if type(inst) is Copy:
+                names[inst.dst] = inst.src
+                removed.append(inst)
+                continue
+            if type(inst) is PhiFunction:
+                key = ('phi', index, *zip(inst.blocks, inst.srcs))
+                if len(set(inst.srcs)) == 1:
+                    names[inst.dst] = inst.srcs[0]
+                    removed.append(inst)
+                    continue
+            else:
+                key = expression_key(inst)
+            if key is None:
+                kept.append(inst)
+            elif key in table:
+                names[inst.dst] = table[key]
+                removed.append(inst)
+            else:
+                table[key] = inst.dst
+                kept.append(inst)
+        if len(kept) == 0:
+            last = removed[-1]
+            kept = [Copy(last.dst, names[last.dst])]
+            del names[last.dst]
+        bb.instructions = kept
+        for child in sorted(dg.get_immediate_domain_indices(index)):
+            visit(child, table)
+
+    visit(bbs[0].index, dict())
+    # sources of phi-functions that come through back edges are only known
+    # once the whole dominance tree has been visited
+    for var in names.keys():
+        while names[var] in names:
+            names[var] = names[names[var]]
+    for bb in bbs:
+        for inst in bb.instructions:
+            rename_uses(inst, names)
+    return linearize(bbs), env
@@ -0,0 +1,281 @@
+"""
+Induction variables and closed-form evaluation of loops.
+
+This module handles simple loops: loops made of a single block, which ends
+with a branch back to itself. In SSA form, the header of such a loop holds
+one phi-function for each variable updated by the loop. In the k-th
+iteration of the loop, counting from zero:
+
+- a basic induction variable is a phi-function 'i = phi(i0, i1)' such that
+  'i1' is 'i' plus a constant step, so 'i = i0 + step * k';
+- a derived induction variable is a sum of induction variables and
+  constants, or an induction variable times a constant.
+
+If the branch of the loop compares two induction variables with known
+initial values, the number of iterations of the loop is known before it
+runs. If, besides, every phi-function of the loop is a basic induction
+variable, the loop can be replaced by straight-line code: each phi-function
+receives its value in the last iteration directly, and the body of the loop
+runs once, without the branch back.
+"""
+import lang
+import parser
+from loops import LoopForest
+from sccp import propagate_constants, is_constant
+from ssa_form import PhiFunction, linearize, new_version, root_name
+from typing import Dict, List, Optional
+
+
+class InductionVariable:
+    """
+    A variable whose value in the k-th iteration of a loop is
+    'init + step * k'. 'init' is None if it is not known before the program
+    runs.
+    """
+    def __init__(s, var: str, init: Optional[int], step: int, basic: bool):
+        s.var = var
+        s.init = init
+        s.step = step
+        s.basic = basic
+
+    def __repr__(s):
+        init = '?' if s.init is None else s.init
+        return f'{s.var} = {init} + {s.step}k'
+
+
+def _is_int(value) -> bool:
+    return is_constant(value) and type(value) is int
+
+
+def _linear_forms(bb: parser.BasicBlock, values: dict) -> Dict[str, tuple]:
+    """
+    Writes the variables defined in the loop 'bb' as linear combinations of
+    its phi-functions: each form is a pair (coefficients, constant), where
+    'coefficients' maps phi-functions to integers.
+    """
+    defined = bb.definitions()
+    forms = dict()
+    for phi in [inst for inst in bb.instructions
+                if type(inst) is PhiFunction]:
+        forms[phi.dst] = ({phi.dst: 1}, 0)
+
+    def form_of(var):
+        if var in forms:
+            return forms[var]
+        if var not in defined and _is_int(values.get(var)):
+            return (dict(), values[var])
+        return None
+
+    for inst in bb.instructions:
+        if type(inst) not in [lang.Add, lang.Mul]:
+            continue
+        a = form_of(inst.src0)
+        b = form_of(inst.src1)
+        if a is None or b is None:
+            continue
+        if type(inst) is lang.Add:
+            coefficients = dict(a[0])
+            for (phi, coefficient) in b[0].items():
+                coefficients[phi] = coefficients.get(phi, 0) + coefficient
+            forms[inst.dst] = (coefficients, a[1] + b[1])
+        elif len(a[0]) == 0 or len(b[0]) == 0:
+            (scale, form) = (a[1], b) if len(a[0]) == 0 else (b[1], a)
+            coefficients = dict([(phi, scale * coefficient)
+                                 for (phi, coefficient) in form[0].items()])
+            forms[inst.dst] = (coefficients, scale * form[1])
+    return forms
+
+
+def induction_variables(bb: parser.BasicBlock, values: dict) -> \
+        Dict[str, InductionVariable]:
+    """
+    Finds the induction variables of a loop made of the single block 'bb'.
+    'values' maps variables to their values in the lattice of
+    'sccp.propagate_constants'.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "two": 2, "five": 5}',
+        ...     'i = add zero one',
+        ...     'i = add i two',
+        ...     'j = mul i two',
+        ...     'k = add j one',
+        ...     'c = lth i five',
+        ...     'bt c 1',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> values, _ = propagate_constants(bbs, env)
+        >>> ivs = induction_variables(bbs[1], values)
+        >>> [ivs[var] for var in sorted(ivs.keys())]
+        [i_1 = 1 + 2k, i_2 = 3 + 2k, j_0 = 6 + 4k, k_0 = 7 + 4k]
+        >>> [ivs[var].basic for var in sorted(ivs.keys())]
+        [True, False, False, False]
+    """
+    forms = _linear_forms(bb, values)
+    ivs = dict()
+    for phi in [inst for inst in bb.instructions
+                if type(inst) is PhiFunction]:
+        if set(phi.blocks) != set([bb.index]) and \
+                len(set([src for (src, pred) in zip(phi.srcs, phi.blocks)
+                         if pred != bb.index])) == 1 and \
+                len(set([src for (src, pred) in zip(phi.srcs, phi.blocks)
+                         if pred == bb.index])) == 1:
+            init = phi.srcs[[b != bb.index for b in phi.blocks].index(True)]
+            latch = phi.srcs[phi.blocks.index(bb.index)]
+            form = forms.get(latch)
+            if form is not None and form[0] == {phi.dst: 1}:
+                init = values.get(init)
+                init = init if _is_int(init) else None
+                ivs[phi.dst] = InductionVariable(phi.dst, init, form[1], True)
+    for (var, (coefficients, constant)) in forms.items():
+        if var in ivs or not all([phi in ivs for phi in coefficients]):
+            continue
+        inits = [ivs[phi].init for phi in coefficients]
+        init = None if None in inits else \
+            constant + sum([c * ivs[phi].init
+                            for (phi, c) in coefficients.items()])
+        step = sum([c * ivs[phi].step for (phi, c) in coefficients.items()])
+        ivs[var] = InductionVariable(var, init, step, False)
+    return ivs
+
+
+def trip_count(bb: parser.BasicBlock, ivs: Dict[str, InductionVariable],
+               values: dict) -> Optional[int]:
+    """
+    Returns how many times the body of the loop 'bb' runs, or None if this
+    number is not known before the program runs, or if the loop never ends.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "two": 2, "five": 5}',
+        ...     'i = add zero one',
+        ...     'i = add i two',
+        ...     'c = lth i five',
+        ...     'bt c 1',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> values, _ = propagate_constants(bbs, env)
+        >>> trip_count(bbs[1], induction_variables(bbs[1], values), values)
+        2
+    """
+    branch = bb.instructions[-1]
+    cond = [inst for inst in bb.instructions
+            if type(inst) in [lang.Lth, lang.Geq] and inst.dst == branch.cond]
+    if len(cond) != 1:
+        return None
+
+    def linear(var):
+        if var in ivs:
+            return (ivs[var].init, ivs[var].step)
+        if var not in bb.definitions() and _is_int(values.get(var)):
+            return (values[var], 0)
+        return (None, 0)
+
+    (a0, a1) = linear(cond[0].src0)
+    (b0, b1) = linear(cond[0].src1)
+    if a0 is None or b0 is None:
+        return None
+    # the loop goes on while 'a - b = d0 + d1 * k' is negative (lth), or
+    # not negative (geq); find the first iteration k where it stops
+    (d0, d1) = (a0 - b0, a1 - b1)
+    if type(cond[0]) is lang.Lth:
+        if d0 >= 0:
+            return 1
+        if d1 <= 0:
+            return None
+        return (-d0 + d1 - 1) // d1 + 1
+    if d0 < 0:
+        return 1
+    if d1 >= 0:
+        return None
+    return d0 // -d1 + 2
+
+
+def _replace_loop(bb: parser.BasicBlock, ivs: Dict[str, InductionVariable],
+                  count: int, env: lang.Env, taken: set):
+    """
+    Replaces the phi-functions of the loop 'bb' with their values in its
+    last iteration, and removes the branch back into 'bb'.
+    """
+    instructions = []
+    for inst in bb.instructions:
+        if type(inst) is not PhiFunction:
+            instructions.append(inst)
+            continue
+        init = inst.srcs[[b != bb.index for b in inst.blocks].index(True)]
+        delta = new_version(f'{root_name(inst.dst)}_delta', taken)
+        taken.add(delta)
+        env.set(delta, ivs[inst.dst].step * (count - 1))
+        instructions.append(lang.Add(inst.dst, init, delta))
+    bb.instructions = instructions[:-1]
+    bb.NEXTS = [nxt for nxt in bb.NEXTS if nxt is not bb]
+    bb.PREVS = [prev for prev in bb.PREVS if prev is not bb]
+
+
+def evaluate_loops(program: List[lang.Inst], env: lang.Env) -> \
+        (List[lang.Inst], lang.Env):
+    """
+    Replaces the simple loops of a program in SSA form, whose phi-functions
+    are all basic induction variables, and whose trip count is known, with
+    straight-line code.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> from driver import print_program
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'count = add zero one',
+        ...     'sum = add zero zero',
+        ...     'sum = add sum one',
+        ...     'sum = add sum one',
+        ...     'count = add count one',
+        ...     'repeat = geq five count',
+        ...     'bt repeat 2',
+        ...     'end = add zero zero',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> prog, env = evaluate_loops(prog, env)
+        >>> print_program(prog)
+        0: count_0 = add zero_0 one_0
+        1: sum_0 = add zero_0 zero_0
+        2: sum_1 = add sum_0 sum_delta_0
+        3: count_1 = add count_0 count_delta_0
+        4: sum_2 = add sum_1 one_0
+        5: sum_3 = add sum_2 one_0
+        6: count_2 = add count_1 one_0
+        7: repeat_0 = geq five_0 count_2
+        8: end_0 = add zero_0 zero_0
+        >>> env.get('sum_delta_0'), env.get('count_delta_0')
+        (8, 4)
+    """
+    while True:
+        bbs = parser.to_basic_blocks(program)
+        values, _ = propagate_constants(bbs, env)
+        forest = LoopForest(bbs)
+        taken = set(env.definitions())
+        for bb in bbs:
+            taken |= bb.definitions() | bb.uses()
+        replaced = False
+        for loop in forest.loops:
+            bb = bbs[loop.header]
+            if loop.blocks != set([bb.index]) or len(bb.NEXTS) != 2 or \
+                    type(bb.instructions[-1]) is not lang.Bt:
+                continue
+            ivs = induction_variables(bb, values)
+            phis = [inst for inst in bb.instructions
+                    if type(inst) is PhiFunction]
+            if not all([phi.dst in ivs and ivs[phi.dst].basic
+                        for phi in phis]):
+                continue
+            count = trip_count(bb, ivs, values)
+            if count is None:
+                continue
+            _replace_loop(bb, ivs, count, env, taken)
+            replaced = True
+        program = linearize(bbs)
+        if not replaced:
+            return program, env
@@ -0,0 +1,253 @@
+"""
+Loop-invariant code motion.
+
+A binary operation inside a loop is invariant if each of its operands is
+defined outside the loop, or by another invariant instruction. On programs in
+SSA form such an instruction computes the same value in every iteration, so
+it can run once, before the loop starts. This pass moves invariant
+instructions into a preheader: a new block placed right before the loop
+header, which receives every edge that enters the loop from outside.
+
+An instruction is only moved if its block dominates every exit of the loop,
+or if its value is not used outside the loop. Instructions of this language
+cannot fail, so the second condition is enough to run them even when the
+loop would not. Loops are processed from the innermost outward, so that an
+instruction can leave several loops. Irreducible loops have no single
+header, and are left alone.
+"""
+import lang
+import parser
+from loops import Loop, LoopForest
+from ssa_form import DominanceGraph, PhiFunction, linearize, new_version
+from ssa_form import root_name
+from typing import List
+
+
+def invariant_instructions(bbs: List[parser.BasicBlock], loop: Loop) -> \
+        List[lang.Inst]:
+    """
+    Returns the invariant binary operations of a loop, in an order where each
+    instruction comes after the invariant instructions that it uses.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "two": 2, "five": 5}',
+        ...     'i = add zero zero',
+        ...     'step = add one one',
+        ...     'big = mul step two',
+        ...     'i = add i big',
+        ...     'c = lth i five',
+        ...     'bt c 1',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> loop = LoopForest(bbs).loop_of(1)
+        >>> [inst.dst for inst in invariant_instructions(bbs, loop)]
+        ['step_0', 'big_0']
+    """
+    defined_in_loop = set()
+    for index in loop.blocks:
+        defined_in_loop |= bbs[index].definitions()
+    invariant = []
+    invariant_vars = set()
+    changed = True
+    while changed:
+        changed = False
+        for index in sorted(loop.blocks):
+            for inst in bbs[index].instructions:
+                if not isinstance(inst, lang.BinOp) or inst in invariant:
+                    continue
+                if all([var not in defined_in_loop or var in invariant_vars
+                        for var in inst.uses()]):
+                    invariant.append(inst)
+                    invariant_vars.add(inst.dst)
+                    changed = True
+    return invariant
+
+
+def _safe_to_hoist(inst: lang.Inst, bbs: List[parser.BasicBlock],
+                   loop: Loop, dg: DominanceGraph) -> bool:
+    if all([dg.dominates(inst.block, tail) for (tail, _) in loop.exits]):
+        return True
+    for bb in bbs:
+        if bb.index in loop.blocks:
+            continue
+        if any([inst.dst in other.uses() for other in bb.instructions]):
+            return False
+    return True
+
+
+def hoistable_instructions(bbs: List[parser.BasicBlock], loop: Loop,
+                           dg: DominanceGraph) -> List[lang.Inst]:
+    """
+    Returns the invariant instructions of a loop that can be moved to its
+    preheader. An instruction that would leave its block empty stays, and so
+    do the instructions that depend on an instruction that stays.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> from driver import print_program
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'i = add zero zero',
+        ...     'i = add i one',
+        ...     'c = lth i five',
+        ...     'bt c 6',
+        ...     'v = lth one one',
+        ...     'w = geq v zero',
+        ...     'd = lth i five',
+        ...     'bt d 1',
+        ...     'r = add v zero',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> loop = LoopForest(bbs).loop_of(1)
+        >>> dg = DominanceGraph(bbs, env)
+        >>> dg.compute_dominance_graph()
+        >>> [inst.dst for inst in hoistable_instructions(bbs, loop, dg)]
+        ['i_1', 'c_0', 'd_0']
+
+    'v' only runs when 'c' is false, and it is used after the loop, so it
+    stays in the loop. 'w' reads it, so it stays too, although it is not
+    used after the loop.
+    """
+    invariant = invariant_instructions(bbs, loop)
+    candidates = [inst for inst in invariant
+                  if _safe_to_hoist(inst, bbs, loop, dg)]
+    unsafe = set([inst.dst for inst in invariant if inst not in candidates])
+    while True:
+        staying = set(unsafe)
+        for index in loop.blocks:
+            instructions = bbs[index].instructions
+            if all([inst in candidates for inst in instructions]):
+                staying.add(instructions[-1].dst)
+        hoisted = []
+        for inst in candidates:
+            if inst.dst in staying or inst.uses() & staying:
+                staying.add(inst.dst)
+            else:
+                hoisted.append(inst)
+        if len(hoisted) == len(candidates):
+            return hoisted
+        candidates = hoisted
+
+
+def _insert_preheader(bbs: List[parser.BasicBlock], loop: Loop,
+                      hoisted: List[lang.Inst], env: lang.Env) -> \
+        List[parser.BasicBlock]:
+    """
+    Places the instructions in 'hoisted' in a new block that every edge from
+    outside the loop goes through before reaching its header. Returns the
+    new layout of the blocks, or None if the preheader cannot be placed
+    before the header, because the header is the fall-through successor of a
+    block of the loop.
+    """
+    header = bbs[loop.header]
+    position = bbs.index(header)
+    if position > 0 and bbs[position-1].index in loop.blocks:
+        before = bbs[position-1]
+        falls_through = type(before.instructions[-1]) is not lang.Bt or \
+            len(before.NEXTS) == 2
+        if falls_through and before.NEXTS[0] is header:
+            return None
+    outside = [prev for prev in header.PREVS
+               if prev.index not in loop.blocks]
+    preheader = parser.BasicBlock([], max([bb.index for bb in bbs]) + 1)
+
+    # the phi-functions of the header get a single source from outside
+    taken = env.definitions()
+    for bb in bbs:
+        taken = taken | bb.definitions() | bb.uses()
+    for phi in [inst for inst in header.instructions
+                if type(inst) is PhiFunction]:
+        pairs = [(src, pred) for (src, pred) in zip(phi.srcs, phi.blocks)
+                 if pred in [prev.index for prev in outside]]
+        if len(pairs) == 0:
+            continue
+        elif len(set([src for (src, _) in pairs])) == 1:
+            src = pairs[0][0]
+        else:
+            src = new_version(root_name(phi.dst), taken)
+            taken = taken | set([src])
+            merge = PhiFunction(src, pairs)
+            merge.srcs = [var for (var, _) in pairs]
+            preheader.instructions.append(merge)
+        srcs = [(s, b) for (s, b) in zip(phi.srcs, phi.blocks)
+                if b in loop.blocks] + [(src, preheader.index)]
+        phi.srcs = [s for (s, _) in srcs]
+        phi.blocks = [b for (_, b) in srcs]
+    preheader.instructions += hoisted
+
+    for prev in outside:
+        prev.NEXTS = [preheader if nxt is header else nxt
+                      for nxt in prev.NEXTS]
+        preheader.add_previous(prev)
+    header.PREVS = [prev for prev in header.PREVS
+                    if prev.index in loop.blocks] + [preheader]
+    preheader.add_next(header)
+    return bbs[:position] + [preheader] + bbs[position:]
+
+
+def hoist_invariants(program: List[lang.Inst], env: lang.Env,
+                     bbs: List[parser.BasicBlock] = None,
+                     forest: LoopForest = None,
+                     dg: DominanceGraph = None) -> (List[lang.Inst], lang.Env):
+    """
+    Moves the loop-invariant instructions of a program in SSA form out of
+    its loops. 'bbs', 'forest' and 'dg' are the basic blocks of the program,
+    its loops and its dominance graph, if they are at hand. They are used
+    until the first loop changes, and then built again for the new program.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> from driver import print_program
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "two": 2, "five": 5}',
+        ...     'i = add zero zero',
+        ...     'step = add one one',
+        ...     'big = mul step two',
+        ...     'i = add i big',
+        ...     'c = lth i five',
+        ...     'bt c 1',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> prog, env = hoist_invariants(prog, env)
+        >>> print_program(prog)
+        0: i_0 = add zero_0 zero_0
+        1: step_0 = add one_0 one_0
+        2: big_0 = mul step_0 two_0
+        3: i_1 = phi(['i_0', 'i_2'])
+        4: i_2 = add i_1 big_0
+        5: c_0 = lth i_2 five_0
+        6: bt c_0 3
+
+    The loop now runs three instructions per iteration, instead of five.
+    """
+    done = set()
+    while True:
+        if bbs is None:
+            bbs = parser.to_basic_blocks(program)
+            (forest, dg) = (None, None)
+        if forest is None:
+            forest = LoopForest(bbs)
+        loops = [loop for loop in forest.loops if loop.reducible and
+                 id(bbs[loop.header].instructions[0]) not in done]
+        if len(loops) == 0:
+            return program, env
+        loop = max(loops, key=lambda loop: loop.depth)
+        done.add(id(bbs[loop.header].instructions[0]))
+        if dg is None:
+            dg = DominanceGraph(bbs, env)
+            dg.compute_dominance_graph()
+        hoisted = hoistable_instructions(bbs, loop, dg)
+        if len(hoisted) == 0:
+            continue
+        layout = _insert_preheader(bbs, loop, hoisted, env)
+        if layout is None:
+            continue
+        for index in loop.blocks:
+            bbs[index].instructions = [inst for inst in bbs[index].instructions
+                                       if inst not in hoisted]
+        program = linearize(layout)
+        bbs = None
@@ -0,0 +1,314 @@
+"""
+Loop detection on the control flow graph.
+
+A back edge is an edge whose target dominates its source. The natural loop
+of a back edge tail -> head is the head plus every block that reaches the
+tail without going through the head. Natural loops only describe reducible
+loops, that is, loops entered through a single block. To also deal with
+loops that have several entries, this module builds the loop nesting forest
+of "Nesting of Reducible and Irreducible Loops" (Havlak), with the fix from
+"On Loops, Dominators, and Dominance Frontiers" (Ramalingam): each loop is
+identified by a header, loops nest inside each other, and a loop that is
+entered through blocks other than its header is marked as irreducible.
+
+The forest of a CFG is computed once and kept on its entry block; the
+function 'loop_forest' recomputes it only if the edges of the CFG change.
+"""
+import parser
+from ssa_form import immediate_dominators
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class Loop:
+    """
+    A loop in the nesting forest. 'blocks' contains the indices of every
+    basic block in the loop, including the blocks of nested loops.
+    """
+
+    def __init__(s, header: int, blocks: Set[int], reducible: bool):
+        s.header = header
+        s.blocks = blocks
+        s.reducible = reducible
+        s.parent: Optional['Loop'] = None
+        s.children: List['Loop'] = []
+        s.depth = 1
+        s.latches: Set[int] = set()
+        s.exits: Set[Tuple[int, int]] = set()
+
+    def __contains__(s, index: int) -> bool:
+        return index in s.blocks
+
+    def __repr__(s):
+        return f'Loop({s.header}, {sorted(s.blocks)})'
+
+
+def natural_loop(basic_blocks: List[parser.BasicBlock], tail: int,
+                 head: int) -> Set[int]:
+    """
+    Returns the indices of the blocks in the natural loop of the edge
+    tail -> head.
+
+    Example:
+        >>> program = [
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'count = add zero one',
+        ...     'count = add count one',
+        ...     'repeat = geq five count',
+        ...     'bt repeat 1',
+        ...     'end = add zero zero',
+        ... ]
+        >>> prog, env = parser.build_cfg(program)
+        >>> sorted(natural_loop(parser.to_basic_blocks(prog), 1, 1))
+        [1]
+    """
+    blocks = set([head, tail])
+    worklist = [tail] if tail != head else []
+    while len(worklist) > 0:
+        bb = basic_blocks[worklist.pop()]
+        for prev in bb.PREVS:
+            if prev.index not in blocks:
+                blocks.add(prev.index)
+                worklist.append(prev.index)
+    return blocks
+
+
+class LoopForest:
+    """
+    The loop nesting forest of a CFG, given as the output of
+    'parser.to_basic_blocks'.
+
+    Example:
+        >>> program = [
+        ...     '{"zero": 0, "one": 1, "three": 3}',
+        ...     'i = add zero zero',
+        ...     'j = add zero zero',
+        ...     'j = add j one',
+        ...     'more_j = lth j three',
+        ...     'bt more_j 2',
+        ...     'i = add i one',
+        ...     'more_i = lth i three',
+        ...     'bt more_i 1',
+        ...     'end = add zero zero',
+        ... ]
+        >>> prog, env = parser.build_cfg(program)
+        >>> forest = LoopForest(parser.to_basic_blocks(prog))
+        >>> forest.loops
+        [Loop(1, [1, 2, 3]), Loop(2, [2])]
+        >>> forest.back_edges()
+        [(2, 2), (3, 1)]
+        >>> [forest.depth(i) for i in range(5)]
+        [0, 1, 2, 1, 0]
+        >>> forest.header_of(3), forest.header_of(2), forest.header_of(4)
+        (1, 2, None)
+        >>> sorted(forest.loop_of(2).parent.exits)
+        [(3, 4)]
+    """
+
+    def __init__(s, basic_blocks: List[parser.BasicBlock]):
+        s.basic_blocks = basic_blocks
+        s.loops: List[Loop] = []
+        s.roots: List[Loop] = []
+        s.innermost: Dict[int, Loop] = dict()
+        s.idoms = immediate_dominators(s.flow_graph(), 0) \
+            if len(basic_blocks) > 0 else dict()
+        s._compute_forest()
+
+    def flow_graph(s) -> Dict[int, List[int]]:
+        return {bb.index: [nxt.index for nxt in bb.NEXTS]
+                for bb in s.basic_blocks}
+
+    def _dfs(s) -> Tuple[List[int], Dict[int, int], Dict[int, int]]:
+        """
+        Numbers the blocks reachable from the entry in depth-first preorder.
+        Returns the blocks in preorder, the number of each block, and the
+        number of the last descendant of each block in the DFS tree.
+        """
+        order = [0]
+        number = {0: 0}
+        last = dict()
+        stack = [(0, iter(s.basic_blocks[0].NEXTS))]
+        while len(stack) > 0:
+            (node, successors) = stack[-1]
+            nxt = next(successors, None)
+            if nxt is None:
+                stack.pop()
+                last[node] = len(order) - 1
+            elif nxt.index not in number:
+                number[nxt.index] = len(order)
+                order.append(nxt.index)
+                stack.append((nxt.index, iter(nxt.NEXTS)))
+        return order, number, last
+
+    def _compute_forest(s):
+        if len(s.basic_blocks) == 0:
+            return
+        order, number, last = s._dfs()
+
+        def is_ancestor(w, v):
+            return number[w] <= number[v] <= last[w]
+
+        back_preds = {w: [] for w in order}
+        non_back_preds = {w: set() for w in order}
+        for w in order:
+            for prev in s.basic_blocks[w].PREVS:
+                v = prev.index
+                if v not in number:
+                    continue
+                if is_ancestor(w, v):
+                    back_preds[w].append(v)
+                else:
+                    non_back_preds[w].add(v)
+
+        # union-find over the blocks, to collapse the loops already found
+        rep = {w: w for w in order}
+
+        def find(w):
+            while rep[w] != w:
+                rep[w] = rep[rep[w]]
+                w = rep[w]
+            return w
+
+        # visit the blocks in reverse preorder, so that inner loops are
+        # collapsed into their headers before the outer loops are built
+        members: Dict[int, List[int]] = dict()
+        reducible: Dict[int, bool] = dict()
+        for w in reversed(order):
+            pool = []
+            is_loop = False
+            for v in back_preds[w]:
+                is_loop = True
+                if v != w and find(v) not in pool:
+                    pool.append(find(v))
+            worklist = list(pool)
+            irreducible = False
+            while len(worklist) > 0:
+                x = worklist.pop()
+                for y in non_back_preds[x]:
+                    y = find(y)
+                    if not is_ancestor(w, y):
+                        # the loop of 'w' is entered through 'x'
+                        irreducible = True
+                        non_back_preds[w].add(y)
+                    elif y not in pool and y != w:
+                        pool.append(y)
+                        worklist.append(y)
+            if is_loop:
+                members[w] = pool
+                reducible[w] = not irreducible
+            for x in pool:
+                rep[x] = w
+
+        # build the loops, outermost first
+        def build(header: int, parent: Optional[Loop]) -> Loop:
+            loop = Loop(header, set([header]), reducible[header])
+            loop.parent = parent
+            loop.depth = parent.depth + 1 if parent else 1
+            s.loops.append(loop)
+            s.innermost[header] = loop
+            for x in sorted(members[header], key=lambda x: number[x]):
+                if x in members:
+                    child = build(x, loop)
+                    loop.children.append(child)
+                    loop.blocks |= child.blocks
+                else:
+                    loop.blocks.add(x)
+                    s.innermost[x] = loop
+            return loop
+
+        roots = [w for w in order if w in members and find(w) == w]
+        for w in roots:
+            s.roots.append(build(w, None))
+        for loop in s.loops:
+            for prev in s.basic_blocks[loop.header].PREVS:
+                if prev.index in loop.blocks:
+                    loop.latches.add(prev.index)
+            for index in loop.blocks:
+                for nxt in s.basic_blocks[index].NEXTS:
+                    if nxt.index not in loop.blocks:
+                        loop.exits.add((index, nxt.index))
+
+    def dominates(s, dominator: int, index: int) -> bool:
+        while index != dominator and index in s.idoms:
+            index = s.idoms[index]
+        return index == dominator
+
+    def back_edges(s) -> List[Tuple[int, int]]:
+        """
+        Returns the edges tail -> head such that head dominates tail. Loops
+        that are not reducible are entered through several blocks, and
+        their retreating edges are not back edges.
+        """
+        edges = []
+        for bb in s.basic_blocks:
+            if bb.index != 0 and bb.index not in s.idoms:
+                continue
+            for nxt in bb.NEXTS:
+                if s.dominates(nxt.index, bb.index):
+                    edges.append((bb.index, nxt.index))
+        return sorted(edges)
+
+    def natural_loops(s) -> Dict[int, Set[int]]:
+        """
+        Maps the head of every back edge to its natural loop. Back edges
+        that share a head share a loop.
+        """
+        loops: Dict[int, Set[int]] = dict()
+        for (tail, head) in s.back_edges():
+            body = natural_loop(s.basic_blocks, tail, head)
+            loops[head] = loops.get(head, set()) | body
+        return loops
+
+    def loop_of(s, index: int) -> Optional[Loop]:
+        """
+        Returns the innermost loop that contains the block 'index', if any.
+        """
+        return s.innermost.get(index)
+
+    def header_of(s, index: int) -> Optional[int]:
+        loop = s.loop_of(index)
+        return loop.header if loop else None
+
+    def is_header(s, index: int) -> bool:
+        loop = s.loop_of(index)
+        return loop is not None and loop.header == index
+
+    def depth(s, index: int) -> int:
+        """
+        Returns the number of loops that contain the block 'index'.
+        """
+        loop = s.loop_of(index)
+        return loop.depth if loop else 0
+
+
+def _shape(basic_blocks: List[parser.BasicBlock]) -> tuple:
+    return tuple(tuple(nxt.index for nxt in bb.NEXTS) for bb in basic_blocks)
+
+
+def loop_forest(basic_blocks: List[parser.BasicBlock]) -> LoopForest:
+    """
+    Returns the loop nesting forest of a CFG. The forest is cached on the
+    entry block, and is computed again only if the edges have changed.
+
+    Example:
+        >>> program = [
+        ...     '{"zero": 0, "one": 1, "true": true}',
+        ...     'bt one 2',
+        ...     'a = add zero one',
+        ...     'b = add zero one',
+        ...     'bt true 1',
+        ... ]
+        >>> prog, env = parser.build_cfg(program)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> forest = loop_forest(bbs)
+        >>> forest.loops, forest.loops[0].reducible, forest.back_edges()
+        ([Loop(1, [1, 2])], False, [])
+        >>> loop_forest(bbs) is forest
+        True
+    """
+    entry = basic_blocks[0]
+    shape = _shape(basic_blocks)
+    cached = getattr(entry, 'loop_forest', None)
+    if cached is None or cached[0] != shape or \
+            cached[1].basic_blocks is not basic_blocks:
+        entry.loop_forest = (shape, LoopForest(basic_blocks))
+    return entry.loop_forest[1]
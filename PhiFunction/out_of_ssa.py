@@ -0,0 +1,409 @@
+"""
+Translation out of Static Single Assignment form.
+
+Programs produced by 'to_ssa' contain phi-functions, which can only be
+evaluated with the help of the environment stack. This module replaces every
+phi-function with copies placed on the incoming edges of its basic block, so
+that the resulting program runs on the ordinary interpreter. The translation
+follows "Revisiting Out-of-SSA Translation for Correctness, Code Quality, and
+Efficiency" (Boissinot et al.):
+
+1. All the phi-functions at the head of a block are read simultaneously, so
+   the copies that feed them on one edge form a parallel copy.
+2. Critical edges (edges that leave a block ending in a branch, and reach a
+   block with several predecessors) are split, so that the copies run only
+   when control flows through that edge. This avoids the lost-copy problem.
+3. Each parallel copy is sequentialized, using a temporary variable to break
+   cycles. This avoids the swap problem.
+4. Optionally, variables related by copies are coalesced if their live ranges
+   do not interfere, and the copies between them are removed.
+"""
+import lang
+import parser
+from ssa_form import PhiFunction, Copy, linearize
+from ssa_form import rename_uses, rename_definition
+from typing import Dict, List, Set, Tuple
+
+
+def fresh_name(base: str, taken: Set[str]) -> str:
+    """
+    Returns a variable name derived from 'base' that is not in 'taken'.
+
+    Example:
+        >>> fresh_name('tmp', {'a', 'b'})
+        'tmp'
+        >>> fresh_name('tmp', {'tmp', 'tmp_1'})
+        'tmp_2'
+    """
+    name = base
+    count = 0
+    while name in taken:
+        count += 1
+        name = f'{base}_{count}'
+    return name
+
+
+def sequentialize(copies: List[Tuple[str, str]], temp: str) \
+        -> List[Tuple[str, str]]:
+    """
+    Orders the parallel copy 'copies', a list of (dst, src) pairs with
+    distinct destinations, into a list of sequential copies with the same
+    effect. Cycles are broken with the variable 'temp'.
+
+    Example:
+        >>> sequentialize([('a', 'b'), ('c', 'a')], 't')
+        [('c', 'a'), ('a', 'b')]
+        >>> sequentialize([('a', 'b'), ('b', 'a')], 't')
+        [('t', 'b'), ('b', 'a'), ('a', 't')]
+        >>> sequentialize([('a', 'a'), ('b', 'a'), ('c', 'a')], 't')
+        [('c', 'a'), ('b', 'c')]
+    """
+    copies = [(dst, src) for (dst, src) in copies if dst != src]
+    location = dict()
+    pred = dict()
+    for (dst, src) in copies:
+        location[dst] = None
+    for (dst, src) in copies:
+        location[src] = src
+        pred[dst] = src
+    ready = [dst for (dst, src) in copies if location[dst] is None]
+    todo = [dst for (dst, src) in copies]
+    sequence = []
+    while len(todo) > 0:
+        while len(ready) > 0:
+            dst = ready.pop()
+            src = pred[dst]
+            current = location[src]
+            sequence.append((dst, current))
+            location[src] = dst
+            if src == current and src in pred:
+                ready.append(src)
+        dst = todo.pop()
+        if location[dst] == dst:
+            # 'dst' still holds a value that is needed: it is part of a cycle
+            sequence.append((temp, dst))
+            location[dst] = temp
+            ready.append(dst)
+    return sequence
+
+
+def variables(program: List[lang.Inst]) -> Set[str]:
+    vs = set()
+    for inst in program:
+        vs = vs | inst.definition() | inst.uses()
+    return vs
+
+
+def liveness(program: List[lang.Inst]) -> \
+        (List[Set[str]], List[Set[str]]):
+    """
+    Computes the variables that are alive at the entry and at the exit of
+    each instruction of a program without phi-functions.
+
+    Example:
+        >>> prog, env = parser.build_cfg([
+        ...     '{"a": 1, "b": 2}',
+        ...     'x = add a b',
+        ...     'y = add x a',
+        ... ])
+        >>> live_in, live_out = liveness(prog)
+        >>> sorted(live_in[0]), sorted(live_out[0]), sorted(live_out[1])
+        (['a', 'b'], ['a', 'x'], [])
+    """
+    live_in = [set() for inst in program]
+    live_out = [set() for inst in program]
+    changed = True
+    while changed:
+        changed = False
+        for inst in reversed(program):
+            out = set()
+            for nxt in inst.NEXTS:
+                if nxt is not None:
+                    out = out | live_in[nxt.index]
+            _in = (out - inst.definition()) | inst.uses()
+            if out != live_out[inst.index] or _in != live_in[inst.index]:
+                live_out[inst.index] = out
+                live_in[inst.index] = _in
+                changed = True
+    return live_in, live_out
+
+
+def interference_graph(program: List[lang.Inst], env: lang.Env) \
+        -> Dict[str, Set[str]]:
+    """
+    Two variables interfere if one of them is defined at a point where the
+    other is alive, unless the definition is a copy of the other. Variables
+    bound in the environment are defined together, before the first
+    instruction.
+
+    Example:
+        >>> prog, env = parser.build_cfg([
+        ...     '{"a": 1, "b": 2}',
+        ...     'x = add a b',
+        ...     'y = add x a',
+        ... ])
+        >>> graph = interference_graph(prog, env)
+        >>> sorted(graph['x']), sorted(graph['b']), sorted(graph['y'])
+        (['a'], ['a'], [])
+    """
+    graph = dict()
+    for var in variables(program) | env.definitions():
+        graph[var] = set()
+
+    def interfere(a, b):
+        if a != b:
+            graph[a].add(b)
+            graph[b].add(a)
+
+    live_in, live_out = liveness(program)
+    for inst in program:
+        for d in inst.definition():
+            for v in live_out[inst.index]:
+                if type(inst) is Copy and v == inst.src:
+                    continue
+                interfere(d, v)
+    entry_defs = env.definitions()
+    entry_live = live_in[0] if len(program) > 0 else set()
+    for d in entry_defs:
+        for v in entry_defs | entry_live:
+            interfere(d, v)
+    return graph
+
+
+def coalesce(program: List[lang.Inst], env: lang.Env) -> Dict[str, str]:
+    """
+    Merges the source and the destination of each copy whenever they do not
+    interfere. Returns a map from the variables that disappeared to the
+    variables that replace them. Variables bound in the environment are never
+    replaced.
+    """
+    graph = interference_graph(program, env)
+    env_vars = env.definitions()
+    representative = dict()
+
+    def find(var):
+        while var in representative:
+            var = representative[var]
+        return var
+
+    for inst in program:
+        if type(inst) is not Copy:
+            continue
+        dst = find(inst.dst)
+        src = find(inst.src)
+        if dst == src or src in graph[dst]:
+            continue
+        if dst in env_vars and src in env_vars:
+            continue
+        (keep, gone) = (dst, src) if dst in env_vars else (src, dst)
+        representative[gone] = keep
+        for neighbour in graph[gone]:
+            graph[neighbour].discard(gone)
+            graph[neighbour].add(keep)
+        graph[keep] = graph[keep] | graph[gone]
+        del graph[gone]
+
+    names = dict()
+    for var in representative.keys():
+        names[var] = find(var)
+    return names
+
+
+def _split_edge(pred: parser.BasicBlock, bb: parser.BasicBlock,
+                copies: List[lang.Inst], jump_var: str,
+                layout: List[parser.BasicBlock]) -> parser.BasicBlock:
+    """
+    Places 'copies' in a new block on the edge 'pred' -> 'bb', where 'pred'
+    ends with a branch. If the edge is the fall-through of 'pred', the new
+    block is inserted in the layout between 'pred' and 'bb', and None is
+    returned. Otherwise the new block ends with a jump into 'bb' on the
+    always-true variable 'jump_var', and it is returned to the caller, which
+    must find a place for it in the layout.
+    """
+    new_bb = parser.BasicBlock(copies, -1)
+    new_bb.add_previous(pred)
+    bb.PREVS = [new_bb if ps is pred else ps for ps in bb.PREVS]
+    falls_through = len(pred.NEXTS) == 2 and pred.NEXTS[0] is bb
+    if falls_through:
+        # If 'pred' also jumps to 'bb', both edges go through the new block.
+        pred.NEXTS = [new_bb if nxt is bb else nxt for nxt in pred.NEXTS]
+        new_bb.add_next(bb)
+        layout.insert(layout.index(pred) + 1, new_bb)
+        return None
+    pred.NEXTS[-1] = new_bb
+    new_bb.instructions.append(lang.Bt(jump_var))
+    new_bb.add_next(bb)
+    return new_bb
+
+
+def _place_jump_blocks(jump_bbs: List[parser.BasicBlock], jump_var: str,
+                       layout: List[parser.BasicBlock]) -> \
+        List[parser.BasicBlock]:
+    """
+    Places blocks that end with unconditional jumps at the beginning of the
+    layout, behind a jump to the entry block, and returns the new layout.
+    Placing them at the end of the layout would not work, because the program
+    finishes when control falls off its last instruction.
+    """
+    if len(jump_bbs) == 0:
+        return layout
+    entry = layout[0]
+    prologue = parser.BasicBlock([lang.Bt(jump_var)], -1)
+    prologue.add_next(entry)
+    entry.add_previous(prologue)
+    return [prologue] + jump_bbs + layout
+
+
+def _remove_empty_blocks(layout: List[parser.BasicBlock]):
+    """
+    Removes blocks that lost all their instructions. Such blocks only come
+    from split edges, so they have a single successor that follows them in
+    the layout.
+    """
+    for bb in [bb for bb in layout if len(bb.instructions) == 0]:
+        nxt = bb.NEXTS[0]
+        for pred in bb.PREVS:
+            pred.NEXTS = [nxt if n is bb else n for n in pred.NEXTS]
+        nxt.PREVS = [p for p in nxt.PREVS if p is not bb] + bb.PREVS
+        layout.remove(bb)
+
+
+def _remove_empty_jump_blocks(jump_bbs: List[parser.BasicBlock]) -> \
+        List[parser.BasicBlock]:
+    """
+    Bypasses the blocks, created on split edges, that lost all their copies
+    and only jump to their successor. Returns the blocks that remain.
+    """
+    remaining = []
+    for bb in jump_bbs:
+        if len(bb.instructions) > 1:
+            remaining.append(bb)
+            continue
+        nxt = bb.NEXTS[-1]
+        pred = bb.PREVS[0]
+        pred.NEXTS[-1] = nxt
+        nxt.PREVS = [pred if p is bb else p for p in nxt.PREVS]
+    return remaining
+
+
+def out_of_ssa(program: List[lang.Inst], env: lang.Env,
+               coalescing: bool = True) -> (List[lang.Inst], lang.Env):
+    """
+    Replaces the phi-functions of an SSA program with copies.
+
+    In the program below, the loop swaps 'a' and 'b' three times:
+
+        >>> from solution import to_ssa
+        >>> lines = [
+        ...     '{"zero": 0, "one": 1, "two": 2, "three": 3}',
+        ...     'a = add zero one',
+        ...     'b = add zero two',
+        ...     'i = add zero zero',
+        ...     't = add a zero',
+        ...     'a = add b zero',
+        ...     'b = add t zero',
+        ...     'i = add i one',
+        ...     'c = lth i three',
+        ...     'bt c 3',
+        ...     'end = add zero zero',
+        ... ]
+        >>> prog, env = parser.build_cfg(lines)
+        >>> prog, env = to_ssa(prog, env)
+        >>> prog, env = out_of_ssa(prog, env, coalescing=False)
+        >>> [inst.index for inst in prog if type(inst) is PhiFunction]
+        []
+
+    The back edge of the loop is critical, so its copies move into a new
+    block, placed after a jump over it at the beginning of the program:
+
+        >>> for inst in prog[:5]:
+        ...     print(inst.index, type(inst).__name__, inst.definition())
+        0 Bt set()
+        1 Copy {'a_1'}
+        2 Copy {'b_1'}
+        3 Copy {'i_1'}
+        4 Bt set()
+        >>> prog[16].jump_to, prog[4].jump_to
+        (1, 11)
+
+    The result runs on the ordinary interpreter:
+
+        >>> inst = prog[0]
+        >>> while inst is not None:
+        ...     inst.eval(env)
+        ...     inst = inst.get_next()
+        >>> env.get('a_2'), env.get('b_2'), env.get('i_2')
+        (2, 1, 3)
+
+    With coalescing, all the copies disappear, and so does the new block:
+
+        >>> prog, env = parser.build_cfg(lines)
+        >>> prog, env = to_ssa(prog, env)
+        >>> prog, env = out_of_ssa(prog, env)
+        >>> len(prog)
+        10
+        >>> print(prog[3].dst, prog[3].src0, prog[4].dst, prog[4].src0)
+        t_0 a_0 a_0 b_0
+        >>> inst = prog[0]
+        >>> while inst is not None:
+        ...     inst.eval(env)
+        ...     inst = inst.get_next()
+        >>> env.get('a_0'), env.get('b_0'), env.get('i_0')
+        (2, 1, 3)
+    """
+    bbs = parser.to_basic_blocks(program)
+    taken = variables(program) | env.definitions()
+    temp = fresh_name('tmp', taken)
+    jump_var = fresh_name('true', taken | set([temp]))
+    layout = list(bbs)
+    jump_bbs = []
+    for bb in bbs:
+        phis = [inst for inst in bb.instructions
+                if type(inst) is PhiFunction]
+        if len(phis) == 0:
+            continue
+        bb.instructions = bb.instructions[len(phis):]
+        preds = []
+        for pred in bb.PREVS:
+            if pred not in preds:
+                preds.append(pred)
+        for pred in preds:
+            parallel_copy = dict()
+            for phi in phis:
+                for i in range(len(phi.blocks)):
+                    if phi.blocks[i] == pred.index:
+                        parallel_copy[phi.dst] = phi.srcs[i]
+            copies = [Copy(dst, src) for (dst, src)
+                      in sequentialize(list(parallel_copy.items()), temp)]
+            if len(copies) == 0:
+                continue
+            if type(pred.instructions[-1]) is not lang.Bt:
+                pred.instructions += copies
+                continue
+            jump_bb = _split_edge(pred, bb, copies, jump_var, layout)
+            if jump_bb is not None:
+                jump_bbs.append(jump_bb)
+    if not coalescing:
+        if len(jump_bbs) > 0:
+            env.set(jump_var, True)
+        return linearize(_place_jump_blocks(jump_bbs, jump_var, layout)), env
+
+    # Interference is computed on the sequential program, including the jump
+    # blocks. They are removed from the layout again afterwards, because the
+    # ones that lost all their copies are not needed anymore.
+    entry = layout[0]
+    program = linearize(_place_jump_blocks(jump_bbs, jump_var, layout))
+    if len(jump_bbs) > 0:
+        entry.PREVS.pop()
+    names = coalesce(program, env)
+    for bb in layout + jump_bbs:
+        for inst in bb.instructions:
+            rename_uses(inst, names)
+            rename_definition(inst, names)
+        bb.instructions = [inst for inst in bb.instructions
+                           if type(inst) is not Copy or inst.dst != inst.src]
+    _remove_empty_blocks(layout)
+    jump_bbs = _remove_empty_jump_blocks(jump_bbs)
+    if len(jump_bbs) > 0:
+        env.set(jump_var, True)
+    return linearize(_place_jump_blocks(jump_bbs, jump_var, layout)), env
@@ -180,7 +180,8 @@ def to_basic_blocks(program):
     # find leaders
     for i in range(len(program)):
         if type(program[i]) is lang.Bt:
-            leaders.add(i+1)
+            if i+1 < len(program):
+                leaders.add(i+1)
             leaders.add(program[i].jump_to)
     bb_map = dict()
     leaders = list(leaders)
@@ -194,17 +195,21 @@ def to_basic_blocks(program):
         else:
             end = leaders[i+1]
             bb = BasicBlock(program[begin:end], i)
+        for inst in bb.instructions:
+            inst.block = i
         bb_map[leaders[i]] = bb
         bbs.append(bb)
 
-    # chain basic blocks
-    for i in range(len(leaders)-1):
+    # chain basic blocks: the fall-through successor always comes first, and
+    # the target of a branch always comes last in NEXTS.
+    for i in range(len(leaders)):
         current_bb = bbs[i]
         last_inst = current_bb.instructions[-1]
-        continue_target_leader = leaders[i+1]
-        continue_target = bb_map[continue_target_leader]
-        current_bb.add_next(continue_target)
-        bb_map[continue_target_leader].add_previous(current_bb)
+        if i < len(leaders)-1:
+            continue_target_leader = leaders[i+1]
+            continue_target = bb_map[continue_target_leader]
+            current_bb.add_next(continue_target)
+            bb_map[continue_target_leader].add_previous(current_bb)
 
         if type(last_inst) is not lang.Bt:
             continue
@@ -0,0 +1,302 @@
+"""
+Partial evaluation of programs against part of their environment.
+
+Given the values of some of the variables in the environment header, the
+partial evaluator runs the program as far as these values allow, and emits a
+residual program that only performs the remaining work. Variables whose
+current values are known are "static", the others are "dynamic":
+
+- an instruction with static operands is evaluated, and its destination
+  becomes static; other instructions are emitted, and their destinations
+  become dynamic;
+- a branch on a static condition is followed, which unrolls loops whose
+  control is static; a branch on a dynamic condition is emitted, and both
+  paths are evaluated.
+
+The residual program is built from specialized copies of the program points
+where control flow joins, one for each combination of static values that
+reaches that point (see "Partial Evaluation and Automatic Program
+Generation", by Jones, Gomard and Sestoft). Control flow that reaches a copy
+already emitted jumps to it, so loops with dynamic control stay loops.
+Static values read by residual instructions are bound to fresh variables in
+the environment of the residual program.
+
+Unrolling can make the residual program much larger than the original, or
+never stop. If the residual program grows past a budget, the original
+program is returned, with the static bindings in its environment. A loop
+with static control may also run forever without emitting any code: after a
+number of static steps, the evaluator binds the static values in the
+residual program, and emits the rest of the program as dynamic code.
+"""
+import json
+import lang
+import parser
+from out_of_ssa import fresh_name
+from typing import List, Set
+
+
+class _Residual:
+    """
+    The residual program under construction. Instructions are kept as
+    tuples, and jump targets as the program points that they lead to, until
+    the positions of these points are known.
+    """
+    def __init__(s, taken: Set[str]):
+        s.code = []
+        s.labels = dict()
+        s.pool = dict()
+        s.taken = set(taken)
+
+    def constant(s, value) -> str:
+        key = (type(value).__name__, value)
+        if key not in s.pool:
+            s.pool[key] = fresh_name('const', s.taken)
+            s.taken.add(s.pool[key])
+        return s.pool[key]
+
+    def bind(s, var: str, value):
+        """
+        Emits an instruction that gives the static 'value' to 'var'.
+        """
+        zero = s.constant(0)
+        if type(value) is bool:
+            op = 'geq' if value else 'lth'
+            s.code.append(('op', op, var, zero, zero))
+        else:
+            s.code.append(('op', 'add', var, s.constant(value), zero))
+
+    def lines(s, env: dict) -> List[str]:
+        """
+        Returns the residual program in the textual format of .lang files.
+        Paths that leave the program jump to its end, where a branch that is
+        never taken stands as the last instruction.
+        """
+        code = s.code
+        if len(code) > 0 and code[-1][0] == 'exit':
+            code = code[:-1]
+        exits = [entry for entry in code if entry[0] == 'exit']
+        if len(exits) > 0 or len(code) == 0 or \
+                max(s.labels.values()) >= len(code):
+            code = code + [('stop',)]
+        true = s.constant(True) if len(exits) > 0 or \
+            any([entry[0] == 'jump' for entry in code]) else None
+        false = s.constant(False) if code[-1][0] == 'stop' else None
+        env = dict(env)
+        for ((_, value), var) in s.pool.items():
+            env[var] = value
+        lines = [json.dumps(env)]
+        for entry in code:
+            if entry[0] == 'op':
+                (_, op, dst, src0, src1) = entry
+                lines.append(f'{dst} = {op} {src0} {src1}')
+            elif entry[0] == 'bt':
+                lines.append(f'bt {entry[1]} {s.labels[entry[2]]}')
+            elif entry[0] == 'jump':
+                lines.append(f'bt {true} {s.labels[entry[1]]}')
+            elif entry[0] == 'exit':
+                lines.append(f'bt {true} {len(code)-1}')
+            else:
+                lines.append(f'bt {false} {len(code)-1}')
+        return lines
+
+
+def _key(pc: int, static: dict) -> tuple:
+    # 'True == 1' in Python, so the type of each value is part of the key
+    return (pc, frozenset([(var, type(value).__name__, value)
+                           for (var, value) in static.items()]))
+
+
+def partial_evaluate(program: List[lang.Inst], env: lang.Env, known: dict,
+                     observable: Set[str] = set(), budget: int = 100,
+                     steps: int = 10000) -> (List[lang.Inst], lang.Env):
+    """
+    Specializes a program to the bindings in 'known', which replace the
+    values of these variables in the environment. The variables in
+    'observable' hold their final values when the residual program ends.
+    The residual program has at most 'budget' instructions, and the
+    evaluator runs at most 'steps' instructions with static values.
+
+    Example:
+        >>> from driver import print_program
+        >>> lines = [
+        ...     '{"zero": 0, "one": 1, "three": 3, "x": 10}',
+        ...     'count = add zero zero',
+        ...     'acc = add x zero',
+        ...     'acc = add acc x',
+        ...     'count = add count one',
+        ...     'more = lth count three',
+        ...     'bt more 2',
+        ... ]
+        >>> prog, env = parser.build_cfg(lines)
+        >>> known = {'zero': 0, 'one': 1, 'three': 3}
+        >>> prog, env = partial_evaluate(prog, env, known, {'acc', 'count'})
+        >>> print_program(prog)
+        0: acc = add x const
+        1: acc = add acc x
+        2: acc = add acc x
+        3: acc = add acc x
+        4: count = add const_1 const
+        >>> env.get('x'), env.get('const'), env.get('const_1')
+        (10, 0, 3)
+
+    If the loop is controlled by 'x', the evaluator unrolls it while 'count'
+    is static, without ever reaching the end of the loop. Once the budget
+    runs out, the original program is returned:
+
+        >>> lines[5] = 'more = lth count x'
+        >>> prog, env = parser.build_cfg(lines)
+        >>> prog, env = partial_evaluate(prog, env, known, {'acc', 'count'})
+        >>> print_program(prog)
+        0: count = add zero zero
+        1: acc = add x zero
+        2: acc = add acc x
+        3: count = add count one
+        4: more = lth count x
+        5: bt more 2
+        >>> env.get('zero'), env.get('one')
+        (0, 1)
+
+    A branch on a dynamic condition splits the evaluation in two paths:
+
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "x": true}',
+        ...     'a = add one one',
+        ...     'bt x 3',
+        ...     'a = add a x',
+        ...     'b = mul a one',
+        ... ])
+        >>> prog, env = partial_evaluate(prog, env, {'zero': 0, 'one': 1})
+        >>> print_program(prog)
+        0: bt x 4
+        1: a = add const x
+        2: b = mul a const_1
+        3: bt const_2 4
+        4: bt const_3 4
+
+    A loop that static values control may never end. Once the evaluator has
+    run out of steps, the static values become dynamic, and the loop is
+    emitted:
+
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "t": true}',
+        ...     'i = add zero zero',
+        ...     'i = add i one',
+        ...     'bt t 1',
+        ... ])
+        >>> known = {'zero': 0, 'one': 1, 't': True}
+        >>> prog, env = partial_evaluate(prog, env, known, steps=20)
+        >>> print_program(prog)
+        0: i = add const_1 const
+        1: one = add const_2 const
+        2: t = geq const const
+        3: zero = add const const
+        4: bt t 6
+        5: bt const_3 8
+        6: i = add i one
+        7: bt t 6
+        8: bt const_4 8
+        >>> env.get('const_1')
+        10
+
+    A path that waits for evaluation may also run out of steps. Its static
+    values are then bound where the branch to it lands:
+
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "x": true}',
+        ...     'bt x 3',
+        ...     'a = add one one',
+        ...     'a = add a one',
+        ...     'b = add one zero',
+        ... ])
+        >>> known = {'zero': 0, 'one': 1}
+        >>> prog, env = partial_evaluate(prog, env, known, steps=2)
+        >>> print_program(prog)
+        0: bt x 6
+        1: a = add const_1 const
+        2: one = add const_2 const
+        3: zero = add const const
+        4: b = add one zero
+        5: bt const_3 9
+        6: one = add const_2 const
+        7: zero = add const const
+        8: bt const_3 4
+        9: bt const_4 9
+    """
+    leaders = set([0])
+    taken = set(env.definitions())
+    for inst in program:
+        taken |= inst.definition() | inst.uses()
+        if type(inst) is lang.Bt:
+            leaders.add(inst.jump_to)
+            leaders.add(inst.index + 1)
+    static = dict(known)
+    residual = _Residual(taken)
+    pending = [(0, static)]
+
+    def operand(var: str, static: dict) -> str:
+        return residual.constant(static[var]) if var in static else var
+
+    while len(pending) > 0:
+        (pc, static) = pending.pop()
+        if _key(pc, static) in residual.labels:
+            continue
+        while True:
+            if len(residual.code) > budget:
+                return _give_up(program, env, known)
+            if steps <= 0 and len(static) > 0:
+                # Branches may already jump to this point with the static
+                # values that are about to be dropped.
+                if pc in leaders:
+                    key = _key(pc, static)
+                    if key in residual.labels:
+                        residual.code.append(('jump', key))
+                        break
+                    residual.labels[key] = len(residual.code)
+                for var in sorted(static):
+                    residual.bind(var, static[var])
+                static = dict()
+            if pc >= len(program):
+                for var in sorted(observable & static.keys()):
+                    residual.bind(var, static[var])
+                residual.code.append(('exit',))
+                break
+            if pc in leaders:
+                key = _key(pc, static)
+                if key in residual.labels:
+                    residual.code.append(('jump', key))
+                    break
+                residual.labels[key] = len(residual.code)
+            inst = program[pc]
+            if type(inst) is lang.Bt:
+                if inst.cond in static:
+                    pc = inst.jump_to if static[inst.cond] else pc + 1
+                    steps -= 1
+                    continue
+                target = _key(inst.jump_to, static)
+                residual.code.append(('bt', inst.cond, target))
+                pending.append((inst.jump_to, dict(static)))
+            elif inst.uses() <= static.keys():
+                values = lang.Env()
+                for var in inst.uses():
+                    values.set(var, static[var])
+                inst.eval(values)
+                static[inst.dst] = values.get(inst.dst)
+                steps -= 1
+            else:
+                op = parser.rev_match_instruction[type(inst)]
+                residual.code.append(('op', op, inst.dst,
+                                      operand(inst.src0, static),
+                                      operand(inst.src1, static)))
+                static.pop(inst.dst, None)
+            pc += 1
+
+    dynamic = dict([(var, env.get(var)) for var in env.definitions()
+                    if var not in known])
+    return parser.build_cfg(residual.lines(dynamic))
+
+
+def _give_up(program: List[lang.Inst], env: lang.Env, known: dict) -> \
+        (List[lang.Inst], lang.Env):
+    for (var, value) in known.items():
+        env.set(var, value)
+    return program, env
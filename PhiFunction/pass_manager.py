@@ -0,0 +1,358 @@
+"""
+Pass manager.
+
+Each pass of this package builds the analyses that it needs from scratch:
+basic blocks, dominance, J-edges, loops and so on. The pass manager keeps the
+analyses of a program in a cache, so that a pipeline of passes computes each
+one only when the program has changed since the last time it was computed.
+
+- An analysis is a function that takes a program and the pass manager, and
+  returns a result. It may ask the pass manager for other analyses.
+- A transformation is a pass with the usual signature, which takes a list of
+  instructions and an environment, and returns a new list and environment.
+  A transformation that can reuse analyses takes the program and the pass
+  manager instead, and asks for them. It declares the analyses that it
+  preserves: the ones whose results remain correct for the program that it
+  returns.
+
+After a transformation runs, the cached analyses that it does not preserve
+are dropped, unless the program did not change at all. Basic blocks hold the
+instructions of the program, and transformations edit them in place, so no
+transformation preserves them. An analysis whose result refers to the blocks,
+such as the dominance graph, is preserved only through its 'rebind' function,
+which points the result to the blocks of the new program. The pass manager
+also records how many times each pass ran and how long it took.
+"""
+import time
+import lang
+import parser
+from gvn import value_numbering
+from induction import evaluate_loops
+from licm import hoist_invariants
+from loops import LoopForest
+from out_of_ssa import liveness, out_of_ssa
+from sccp import sccp
+from simplify_cfg import simplify_cfg
+from solution import DJGraph, to_ssa
+from typing import Callable, Dict, Iterable, List, Set
+
+
+class Program:
+    """
+    A program, its environment, and the analyses computed for it so far.
+    """
+    def __init__(s, instructions: List[lang.Inst], env: lang.Env):
+        s.instructions = instructions
+        s.env = env
+        s.analyses = dict()
+
+
+def _fingerprint(program: Program) -> tuple:
+    """
+    Summarizes the instructions and the bindings of a program, ignoring the
+    links between instructions, which are derived from the other fields.
+    """
+    instructions = tuple([
+        (type(inst).__name__,
+         tuple(sorted([(key, repr(value))
+                       for (key, value) in vars(inst).items()
+                       if key not in ['NEXTS', 'PREVS', 'block']])))
+        for inst in program.instructions])
+    env = tuple(sorted([(var, repr(program.env.get(var)))
+                        for var in program.env.definitions()]))
+    return (instructions, env)
+
+
+class PassManager:
+    """
+    Runs transformations on programs, and caches the analyses that they ask
+    for.
+
+    Example:
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'i = add zero zero',
+        ...     'i = add i one',
+        ...     'c = lth i five',
+        ...     'bt c 1',
+        ... ])
+        >>> program = Program(prog, env)
+        >>> manager = PassManager()
+        >>> manager.register_analysis('blocks', lambda p, m:
+        ...     parser.to_basic_blocks(p.instructions))
+        >>> manager.register_analysis('size', lambda p, m:
+        ...     len(m.get(p, 'blocks')))
+        >>> manager.register_transformation('ssa', to_ssa)
+        >>> manager.get(program, 'size')
+        2
+        >>> manager.get(program, 'size')
+        2
+        >>> manager.count('blocks'), manager.count('size')
+        (1, 1)
+
+    A transformation that changes the program drops the analyses that it
+    does not preserve:
+
+        >>> program = manager.run(program, ['ssa'])
+        >>> sorted(program.analyses.keys())
+        []
+        >>> manager.get(program, 'size')
+        2
+        >>> manager.count('blocks'), manager.count('ssa')
+        (2, 1)
+    """
+    def __init__(s):
+        s.analyses: Dict[str, Callable] = dict()
+        s.rebinders: Dict[str, Callable] = dict()
+        s.transformations: Dict[str, Callable] = dict()
+        s.preserved: Dict[str, Set[str]] = dict()
+        s.timings: Dict[str, List[float]] = dict()
+
+    def register_analysis(s, name: str, compute: Callable,
+                          rebind: Callable = None):
+        """
+        Registers an analysis. If its result refers to basic blocks, a
+        transformation may preserve it only if 'rebind' is given: it takes
+        the result, the program and the pass manager, and points the result
+        to the blocks of the transformed program.
+        """
+        s.analyses[name] = compute
+        if rebind is not None:
+            s.rebinders[name] = rebind
+
+    def register_transformation(s, name: str, run: Callable,
+                                preserves: Iterable[str] = (),
+                                with_analyses: bool = False):
+        """
+        Registers a transformation. If 'with_analyses' is set, 'run' takes
+        the Program and the pass manager, instead of its instructions and
+        environment, so that it can reuse the cached analyses.
+        """
+        if with_analyses:
+            s.transformations[name] = run
+        else:
+            s.transformations[name] = lambda program, manager: \
+                run(program.instructions, program.env)
+        s.preserved[name] = set(preserves)
+
+    def _time(s, name: str, start: float):
+        s.timings.setdefault(name, []).append(time.perf_counter() - start)
+
+    def get(s, program: Program, name: str):
+        """
+        Returns the result of the analysis 'name' for 'program', computing it
+        only if it is not in the cache.
+        """
+        if name not in program.analyses:
+            start = time.perf_counter()
+            program.analyses[name] = s.analyses[name](program, s)
+            s._time(name, start)
+        return program.analyses[name]
+
+    def invalidate(s, program: Program, preserved: Set[str] = set()):
+        program.analyses = dict([(name, result) for (name, result)
+                                 in program.analyses.items()
+                                 if name in preserved])
+
+    def run(s, program: Program, names: Iterable[str]) -> Program:
+        """
+        Applies the transformations in 'names' to 'program', in order.
+        """
+        for name in names:
+            before = _fingerprint(program)
+            start = time.perf_counter()
+            program.instructions, program.env = \
+                s.transformations[name](program, s)
+            s._time(name, start)
+            if _fingerprint(program) != before:
+                s.invalidate(program, s.preserved[name])
+                for analysis in list(program.analyses.keys()):
+                    if analysis in s.rebinders:
+                        s.rebinders[analysis](program.analyses[analysis],
+                                              program, s)
+        return program
+
+    def count(s, name: str) -> int:
+        """
+        Returns how many times the pass 'name' has run.
+        """
+        return len(s.timings.get(name, []))
+
+    def report(s) -> str:
+        """
+        Returns a table with the number of runs and the total time, in
+        seconds, of each pass, with the slowest passes first.
+        """
+        rows = sorted(s.timings.items(), key=lambda row: -sum(row[1]))
+        return '\n'.join([f'{name:<20}{len(times):>6}{sum(times):>12.6f}'
+                          for (name, times) in rows])
+
+
+def reaching_definitions(program: List[lang.Inst]) -> \
+        (List[Set[int]], List[Set[int]]):
+    """
+    Computes the indices of the instructions whose definitions reach the
+    entry and the exit of each instruction of a program.
+
+    Example:
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'i = add zero zero',
+        ...     'i = add i one',
+        ...     'c = lth i five',
+        ...     'bt c 1',
+        ... ])
+        >>> reach_in, reach_out = reaching_definitions(prog)
+        >>> sorted(reach_in[1]), sorted(reach_out[1])
+        ([0, 1, 2], [1, 2])
+    """
+    prevs = [[] for inst in program]
+    for inst in program:
+        for nxt in inst.NEXTS:
+            if nxt is not None and inst.index not in prevs[nxt.index]:
+                prevs[nxt.index].append(inst.index)
+    defs = dict()
+    for inst in program:
+        for var in inst.definition():
+            defs.setdefault(var, set()).add(inst.index)
+    reach_in = [set() for inst in program]
+    reach_out = [set() for inst in program]
+    changed = True
+    while changed:
+        changed = False
+        for inst in program:
+            _in = set()
+            for prev in prevs[inst.index]:
+                _in = _in | reach_out[prev]
+            out = _in
+            for var in inst.definition():
+                out = (out - defs[var]) | set([inst.index])
+            if out != reach_out[inst.index] or _in != reach_in[inst.index]:
+                reach_out[inst.index] = out
+                reach_in[inst.index] = _in
+                changed = True
+    return reach_in, reach_out
+
+
+def _dominators(program: Program, manager: PassManager) -> DJGraph:
+    dj_graph = DJGraph(manager.get(program, 'blocks'), program.env)
+    dj_graph.compute_dominance_graph()
+    return dj_graph
+
+
+def _rebind_dominators(dj_graph: DJGraph, program: Program,
+                       manager: PassManager):
+    dj_graph.bbs = manager.get(program, 'blocks')
+    dj_graph.env = program.env
+
+
+def _rebind_loops(forest: LoopForest, program: Program,
+                  manager: PassManager):
+    forest.basic_blocks = manager.get(program, 'blocks')
+
+
+def _frontiers(program: Program, manager: PassManager) -> \
+        Dict[int, Set[int]]:
+    dj_graph = manager.get(program, 'dominators')
+    dj_graph.compute_j_edges()
+    dj_graph.compute_dominance_frontiers()
+    return dj_graph.dominance_frontier
+
+
+def _sccp(program: Program, manager: PassManager) -> \
+        (List[lang.Inst], lang.Env):
+    return sccp(program.instructions, program.env,
+                manager.get(program, 'blocks'))
+
+
+def _value_numbering(program: Program, manager: PassManager) -> \
+        (List[lang.Inst], lang.Env):
+    return value_numbering(program.instructions, program.env,
+                           manager.get(program, 'blocks'),
+                           manager.get(program, 'dominators'))
+
+
+def _hoist_invariants(program: Program, manager: PassManager) -> \
+        (List[lang.Inst], lang.Env):
+    forest = manager.get(program, 'loops')
+    dj_graph = None
+    if len(forest.loops) > 0:
+        dj_graph = manager.get(program, 'dominators')
+    return hoist_invariants(program.instructions, program.env,
+                            manager.get(program, 'blocks'), forest, dj_graph)
+
+
+# Passes that do not change the control flow graph keep the analyses that
+# only depend on its shape: the results of these analyses refer to blocks by
+# their indices, which do not change either, and the dominance graph and the
+# loop forest are pointed to the new blocks.
+CFG_ANALYSES = ['dominators', 'frontiers', 'loops']
+
+
+def default_pass_manager() -> PassManager:
+    """
+    Returns a pass manager with the analyses and the transformations of this
+    package.
+
+    Example:
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'i = add zero zero',
+        ...     'i = add i one',
+        ...     'j = add i one',
+        ...     'k = add one i',
+        ...     'c = lth j five',
+        ...     'bt c 1',
+        ... ])
+        >>> manager = default_pass_manager()
+        >>> program = Program(prog, env)
+        >>> manager.get(program, 'frontiers')
+        {0: set(), 1: {1}}
+        >>> manager.get(program, 'loops').back_edges()
+        [(1, 1)]
+        >>> program = manager.run(program, ['ssa', 'gvn'])
+        >>> sorted(program.analyses.keys())
+        ['blocks', 'dominators', 'frontiers', 'loops']
+        >>> blocks = manager.get(program, 'blocks')
+        >>> manager.get(program, 'dominators').bbs is blocks
+        True
+        >>> blocks[1].instructions[0] in program.instructions
+        True
+        >>> program = manager.run(program, ['sccp'])
+        >>> sorted(program.analyses.keys())
+        ['blocks', 'dominators', 'frontiers', 'loops']
+        >>> program = manager.run(program, ['out_of_ssa'])
+        >>> sorted(program.analyses.keys())
+        []
+        >>> manager.count('blocks'), manager.count('dominators')
+        (3, 1)
+
+    'ssa' and 'gvn' keep the dominance graph and the loops, which now refer
+    to the blocks of the new program, so the blocks are built again, but the
+    dominance graph is not. 'gvn' and 'sccp' read the blocks and the
+    dominance graph from the cache. 'sccp' may change the control flow
+    graph, but it finds nothing to fold here, so the analyses stay in the
+    cache.
+    """
+    manager = PassManager()
+    manager.register_analysis('blocks', lambda program, manager:
+                              parser.to_basic_blocks(program.instructions))
+    manager.register_analysis('dominators', _dominators, _rebind_dominators)
+    manager.register_analysis('frontiers', _frontiers)
+    manager.register_analysis('loops', lambda program, manager:
+                              LoopForest(manager.get(program, 'blocks')),
+                              _rebind_loops)
+    manager.register_analysis('liveness', lambda program, manager:
+                              liveness(program.instructions))
+    manager.register_analysis('reaching_definitions', lambda program, manager:
+                              reaching_definitions(program.instructions))
+    manager.register_transformation('simplify_cfg', simplify_cfg)
+    manager.register_transformation('ssa', to_ssa, CFG_ANALYSES)
+    manager.register_transformation('sccp', _sccp, with_analyses=True)
+    manager.register_transformation('gvn', _value_numbering, CFG_ANALYSES,
+                                    with_analyses=True)
+    manager.register_transformation('licm', _hoist_invariants,
+                                    with_analyses=True)
+    manager.register_transformation('induction', evaluate_loops)
+    manager.register_transformation('out_of_ssa', out_of_ssa)
+    return manager
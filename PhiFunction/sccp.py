@@ -0,0 +1,330 @@
+"""
+Sparse conditional constant propagation.
+
+This pass implements "Constant Propagation with Conditional Branches"
+(Wegman and Zadeck) on programs in SSA form. Every variable gets a value in
+a lattice with three levels: TOP (no value seen yet), a constant, or BOTTOM
+(more than one value). The values of the environment are the initial
+constants. Two worklists drive the analysis: one of CFG edges that became
+executable, and one of instructions whose operands changed. Phi-functions
+only read the sources that flow through executable edges, and a branch on a
+constant only makes one of its edges executable, so constants found in one
+path are not spoiled by paths that never run.
+
+The program is then rewritten:
+
+- variables with constant values are bound in the environment, and the
+  instructions that define them are removed;
+- blocks that are never reached are removed, and so are branches that are
+  never taken;
+- phi-functions that are left with a single source are replaced by it.
+
+A block keeps its last instruction if all of them would be removed, so that
+the shape of the CFG, and the predecessors seen by phi-functions, do not
+change.
+"""
+import lang
+import parser
+from ssa_form import PhiFunction, Copy, linearize, rename_uses
+from ssa_form import new_version, root_name
+from typing import Dict, List, Set, Tuple
+
+
+class LatticeValue:
+    def __init__(s, name: str):
+        s.name = name
+
+    def __repr__(s):
+        return s.name
+
+
+TOP = LatticeValue('TOP')
+BOTTOM = LatticeValue('BOTTOM')
+
+
+def is_constant(value) -> bool:
+    return value is not TOP and value is not BOTTOM
+
+
+def meet(a, b):
+    """
+    Combines two lattice values.
+
+    Example:
+        >>> meet(TOP, 3), meet(3, 3), meet(3, 4), meet(1, True)
+        (3, 3, BOTTOM, BOTTOM)
+    """
+    if a is TOP:
+        return b
+    if b is TOP:
+        return a
+    if a is BOTTOM or b is BOTTOM:
+        return BOTTOM
+    if type(a) is type(b) and a == b:
+        return a
+    return BOTTOM
+
+
+def evaluate(inst: lang.Inst, values: dict):
+    """
+    Computes the lattice value defined by a binary operation or a copy.
+
+    Example:
+        >>> evaluate(lang.Mul('a', 'b', 'c'), {'b': 2, 'c': 3})
+        6
+        >>> evaluate(lang.Lth('a', 'b', 'c'), {'b': 2, 'c': BOTTOM})
+        BOTTOM
+    """
+    if type(inst) is Copy:
+        return values.get(inst.src, BOTTOM)
+    operands = [values.get(inst.src0, BOTTOM), values.get(inst.src1, BOTTOM)]
+    if any([operand is BOTTOM for operand in operands]):
+        return BOTTOM
+    if any([operand is TOP for operand in operands]):
+        return TOP
+    env = lang.Env()
+    env.set(inst.src0, operands[0])
+    env.set(inst.src1, operands[1])
+    inst.eval(env)
+    return env.get(inst.dst)
+
+
+def _successors(bb: parser.BasicBlock, values: dict) -> \
+        List[parser.BasicBlock]:
+    """
+    Returns the successors of a block that can be reached, given the value
+    of the condition of the branch that ends it.
+    """
+    last = bb.instructions[-1]
+    if type(last) is not lang.Bt:
+        return bb.NEXTS
+    cond = values.get(last.cond, BOTTOM)
+    jump = bb.NEXTS[-1]
+    fall = bb.NEXTS[0] if len(bb.NEXTS) == 2 else None
+    if cond is TOP:
+        return []
+    elif cond is BOTTOM:
+        return [nxt for nxt in [fall, jump] if nxt is not None]
+    elif cond:
+        return [jump]
+    return [fall] if fall is not None else []
+
+
+def propagate_constants(bbs: List[parser.BasicBlock], env: lang.Env) -> \
+        Tuple[dict, Set[Tuple[int, int]]]:
+    """
+    Returns the lattice value of every variable, and the edges, given as
+    pairs of block indices, that can be executed.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "two": 2}',
+        ...     'a = add zero one',
+        ...     'c = lth a two',
+        ...     'bt c 4',
+        ...     'a = add a one',
+        ...     'b = mul a two',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> values, edges = propagate_constants(bbs, env)
+        >>> sorted(edges)
+        [(0, 2)]
+        >>> [values[var] for var in ['a_0', 'a_1', 'a_2', 'b_0']]
+        [1, TOP, 1, 2]
+    """
+    values = dict()
+    uses: Dict[str, List[lang.Inst]] = dict()
+    for bb in bbs:
+        for inst in bb.instructions:
+            for var in inst.definition():
+                values[var] = TOP
+            for var in inst.uses():
+                uses.setdefault(var, []).append(inst)
+    for var in env.definitions():
+        values[var] = env.get(var)
+    block_of = dict()
+    for bb in bbs:
+        for inst in bb.instructions:
+            block_of[id(inst)] = bb
+
+    edges = set()
+    reached = set()
+    flow_worklist = [(None, bbs[0])]
+    ssa_worklist = []
+
+    def visit(inst: lang.Inst, bb: parser.BasicBlock):
+        if type(inst) is lang.Bt:
+            if inst is bb.instructions[-1]:
+                for nxt in _successors(bb, values):
+                    flow_worklist.append((bb.index, nxt))
+            return
+        if type(inst) is PhiFunction:
+            value = TOP
+            for (src, pred) in zip(inst.srcs, inst.blocks):
+                if (pred, bb.index) in edges:
+                    value = meet(value, values.get(src, BOTTOM))
+        else:
+            value = evaluate(inst, values)
+        old = values[inst.dst]
+        value = meet(old, value)
+        if value is not old and (type(value) is not type(old) or
+                                 value != old):
+            values[inst.dst] = value
+            ssa_worklist.extend(uses.get(inst.dst, []))
+
+    while len(flow_worklist) > 0 or len(ssa_worklist) > 0:
+        while len(flow_worklist) > 0:
+            (pred, bb) = flow_worklist.pop()
+            if (pred, bb.index) in edges:
+                continue
+            if pred is not None:
+                edges.add((pred, bb.index))
+            if bb.index in reached:
+                for inst in bb.instructions:
+                    if type(inst) is PhiFunction:
+                        visit(inst, bb)
+                continue
+            reached.add(bb.index)
+            for inst in bb.instructions:
+                visit(inst, bb)
+            if type(bb.instructions[-1]) is not lang.Bt:
+                for nxt in bb.NEXTS:
+                    flow_worklist.append((bb.index, nxt))
+        while len(ssa_worklist) > 0:
+            inst = ssa_worklist.pop()
+            bb = block_of[id(inst)]
+            if bb.index in reached:
+                visit(inst, bb)
+    return values, edges
+
+
+def sccp(program: List[lang.Inst], env: lang.Env,
+         bbs: List[parser.BasicBlock] = None) -> (List[lang.Inst], lang.Env):
+    """
+    Folds the constants of a program in SSA form, and removes the code that
+    never runs. 'bbs' are the basic blocks of the program, if they are at
+    hand; they are edited in place.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> from driver import print_program
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5, "true": true}',
+        ...     'a = add zero one',
+        ...     'jump = geq a zero',
+        ...     'bt jump 5',
+        ...     'a = add a one',
+        ...     'bt true 10',
+        ...     'a = add a one',
+        ...     'jump = geq a five',
+        ...     'bt jump 10',
+        ...     'a = add a one',
+        ...     'bt true 5',
+        ...     'end = add zero zero',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> prog, env = sccp(prog, env)
+        >>> print_program(prog)
+        0: jump_0 = geq a_0 zero_0
+        1: a_2 = phi(['a_0', 'a_4'])
+        2: a_3 = add a_2 one_0
+        3: jump_1 = geq a_3 five_0
+        4: bt jump_1 7
+        5: a_4 = add a_3 one_0
+        6: bt true_0 1
+        7: end_0 = add zero_0 zero_0
+        >>> env.get('a_0')
+        1
+
+    The first block always branches to the block that follows it, so its
+    branch goes away. Every block keeps one instruction, though: the first
+    block keeps a constant assignment, and the block after the loop keeps
+    its only instruction, so that the loop still has a block to exit to.
+
+    A branch that is never taken, and that jumps to a block that never
+    runs, does not stay, even if it is the only instruction of its block:
+
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "x": 5}',
+        ...     'a = add x one',
+        ...     'bt one 3',
+        ...     'b = add a one',
+        ...     'bt zero 2',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> prog, env = sccp(prog, env)
+        >>> print_program(prog)
+        0: a_0 = add x_0 one_0
+        1: zero_1 = zero_0
+    """
+    if bbs is None:
+        bbs = parser.to_basic_blocks(program)
+    values, edges = propagate_constants(bbs, env)
+    live = [bb for bb in bbs
+            if bb.index == 0 or bb.index in [head for (_, head) in edges]]
+    names = dict()
+    for (position, bb) in enumerate(live):
+        layout_next = live[position + 1].index \
+            if position + 1 < len(live) else None
+        kept = []
+        removed = []
+        for inst in bb.instructions:
+            if type(inst) is PhiFunction:
+                pairs = [(src, pred) for (src, pred)
+                         in zip(inst.srcs, inst.blocks)
+                         if (pred, bb.index) in edges]
+                inst.srcs = [src for (src, _) in pairs]
+                inst.blocks = [pred for (_, pred) in pairs]
+            if type(inst) is lang.Bt:
+                cond = values.get(inst.cond, BOTTOM)
+                # a branch that is never taken goes away, and so does a
+                # branch always taken to the block that follows it anyway
+                if is_constant(cond) and (not cond or bb.NEXTS[-1].index ==
+                                          layout_next):
+                    removed.append(inst)
+                else:
+                    kept.append(inst)
+            elif is_constant(values[inst.dst]):
+                removed.append(inst)
+            elif type(inst) is PhiFunction and len(set(inst.srcs)) == 1:
+                removed.append(inst)
+            else:
+                kept.append(inst)
+        if len(kept) == 0:
+            # the block keeps one instruction; running a constant assignment
+            # again is cheaper than running a branch
+            plain = [inst for inst in removed
+                     if type(inst) not in [lang.Bt, PhiFunction]]
+            kept = [plain[-1] if len(plain) > 0 else removed[-1]]
+            removed.remove(kept[0])
+            if type(kept[0]) is lang.Bt and \
+                    all([(bb.index, nxt.index) not in edges
+                         for nxt in bb.NEXTS]):
+                # a branch never taken to a dead block cannot stay, as it
+                # would jump nowhere; a copy of its condition stays instead
+                taken = env.definitions() | set([
+                    var for b in bbs for inst in b.instructions
+                    for var in inst.definition()])
+                kept = [Copy(new_version(root_name(kept[0].cond), taken),
+                             kept[0].cond)]
+        for inst in removed:
+            if type(inst) is PhiFunction and \
+                    not is_constant(values[inst.dst]):
+                names[inst.dst] = inst.srcs[0]
+            elif type(inst) is not lang.Bt:
+                env.set(inst.dst, values[inst.dst])
+        bb.instructions = kept
+        bb.NEXTS = [nxt for nxt in bb.NEXTS if (bb.index, nxt.index) in edges]
+        bb.PREVS = [prev for prev in bb.PREVS
+                    if (prev.index, bb.index) in edges]
+
+    # a phi-function may be replaced by another one that was also replaced
+    for var in names.keys():
+        while names[var] in names:
+            names[var] = names[names[var]]
+    for bb in live:
+        for inst in bb.instructions:
+            rename_uses(inst, names)
+    return linearize(live), env
@@ -0,0 +1,209 @@
+"""
+Simplification of the control flow graph.
+
+The blocks built by 'parser.to_basic_blocks' often contain more structure
+than the program needs: unconditional jumps written as 'bt true X', jumps to
+blocks that only jump again, code that can never run, and chains of blocks
+that follow each other without any other way in or out. This module removes
+that structure, applying the rules below until none of them applies:
+
+1. A branch on a variable of the environment that the program never
+   redefines is constant: if the variable holds a true value, the
+   fall-through edge is removed; otherwise the branch itself is removed.
+2. A jump into a block that only jumps (or falls) into another block goes
+   directly to the latter (jump threading).
+3. A jump to the block that follows in the layout is removed.
+4. Blocks that cannot be reached from the entry are removed.
+5. A block with no instructions is removed, and its predecessors go to its
+   successor.
+6. A block is merged with the next one in the layout if it is the only
+   predecessor of the next block, which is its only successor.
+
+The result is a new, renumbered program. The rules do not know about
+phi-functions, so the simplifier must run before SSA construction.
+"""
+import lang
+import parser
+from ssa_form import PhiFunction, linearize
+from typing import Dict, List
+
+
+def constant_conditions(program: List[lang.Inst], env: lang.Env) -> \
+        Dict[str, bool]:
+    """
+    Maps the variables of the environment that the program never redefines
+    to their truth values.
+
+    Example:
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "x": 3}',
+        ...     'x = add x one',
+        ... ])
+        >>> sorted(constant_conditions(prog, env).items())
+        [('one', True), ('zero', False)]
+    """
+    defined = set()
+    for inst in program:
+        defined |= inst.definition()
+    return dict([(var, bool(env.get(var))) for var in env.definitions()
+                 if var not in defined])
+
+
+def _replace_successor(bb: parser.BasicBlock, old: parser.BasicBlock,
+                       new: parser.BasicBlock, position: int = -1):
+    bb.NEXTS[position] = new
+    old.PREVS.remove(bb)
+    new.add_previous(bb)
+
+
+def _is_unconditional(bb: parser.BasicBlock, consts: Dict[str, bool]) -> bool:
+    last = bb.instructions[-1] if len(bb.instructions) > 0 else None
+    return type(last) is lang.Bt and consts.get(last.cond) is True
+
+
+def _fold_branches(bbs: List[parser.BasicBlock],
+                   consts: Dict[str, bool]) -> bool:
+    changed = False
+    for bb in bbs:
+        last = bb.instructions[-1]
+        if type(last) is not lang.Bt or last.cond not in consts:
+            continue
+        if consts[last.cond] and len(bb.NEXTS) == 2:
+            fall = bb.NEXTS.pop(0)
+            fall.PREVS.remove(bb)
+            changed = True
+        elif not consts[last.cond] and len(bb.NEXTS) == 2:
+            jump = bb.NEXTS.pop()
+            jump.PREVS.remove(bb)
+            bb.instructions = bb.instructions[:-1]
+            changed = True
+    return changed
+
+
+def _forward(bb: parser.BasicBlock, consts: Dict[str, bool]) -> \
+        parser.BasicBlock:
+    """
+    Returns the first block, from 'bb' on, that does more than jumping or
+    falling into another block.
+    """
+    seen = set()
+    while bb.index not in seen:
+        seen.add(bb.index)
+        if len(bb.instructions) == 0 or len(bb.instructions) == 1 and \
+                _is_unconditional(bb, consts):
+            bb = bb.NEXTS[-1]
+        else:
+            break
+    return bb
+
+
+def _thread_jumps(bbs: List[parser.BasicBlock],
+                  consts: Dict[str, bool]) -> bool:
+    changed = False
+    for bb in bbs:
+        if type(bb.instructions[-1]) is not lang.Bt:
+            continue
+        target = bb.NEXTS[-1]
+        forward = _forward(target, consts)
+        if forward is not target:
+            _replace_successor(bb, target, forward)
+            changed = True
+    for i in range(len(bbs)-1):
+        bb = bbs[i]
+        if _is_unconditional(bb, consts) and bb.NEXTS == [bbs[i+1]]:
+            bb.instructions = bb.instructions[:-1]
+            changed = True
+    return changed
+
+
+def _remove_unreachable(bbs: List[parser.BasicBlock]) -> \
+        List[parser.BasicBlock]:
+    reachable = set([bbs[0].index])
+    worklist = [bbs[0]]
+    while len(worklist) > 0:
+        for nxt in worklist.pop().NEXTS:
+            if nxt.index not in reachable:
+                reachable.add(nxt.index)
+                worklist.append(nxt)
+    for bb in bbs:
+        bb.PREVS = [prev for prev in bb.PREVS if prev.index in reachable]
+    return [bb for bb in bbs if bb.index in reachable]
+
+
+def _remove_empty(bbs: List[parser.BasicBlock]) -> List[parser.BasicBlock]:
+    for bb in [bb for bb in bbs if len(bb.instructions) == 0]:
+        nxt = bb.NEXTS[0]
+        nxt.PREVS.remove(bb)
+        for prev in bb.PREVS:
+            prev.NEXTS = [nxt if n is bb else n for n in prev.NEXTS]
+            nxt.add_previous(prev)
+        bbs.remove(bb)
+    return bbs
+
+
+def _merge_blocks(bbs: List[parser.BasicBlock]) -> bool:
+    changed = False
+    i = 0
+    while i < len(bbs) - 1:
+        bb = bbs[i]
+        nxt = bbs[i+1]
+        if type(bb.instructions[-1]) is not lang.Bt and \
+                bb.NEXTS == [nxt] and nxt.PREVS == [bb]:
+            bb.instructions += nxt.instructions
+            bb.NEXTS = nxt.NEXTS
+            for succ in nxt.NEXTS:
+                succ.PREVS = [bb if p is nxt else p for p in succ.PREVS]
+            bbs.pop(i+1)
+            changed = True
+        else:
+            i += 1
+    return changed
+
+
+def simplify_cfg(program: List[lang.Inst], env: lang.Env) -> \
+        (List[lang.Inst], lang.Env):
+    """
+    Simplifies the control flow graph of a program, and returns it
+    renumbered.
+
+    Example:
+        >>> from driver import print_program
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "x": 3, "true": true}',
+        ...     'a = add x one',
+        ...     'bt true 3',
+        ...     'a = add a a',
+        ...     'bt zero 2',
+        ...     'c = lth a x',
+        ...     'bt c 8',
+        ...     'a = add a one',
+        ...     'bt true 9',
+        ...     'bt true 9',
+        ...     'a = mul a x',
+        ... ])
+        >>> prog, env = simplify_cfg(prog, env)
+        >>> print_program(prog)
+        0: a = add x one
+        1: c = lth a x
+        2: bt c 4
+        3: a = add a one
+        4: a = mul a x
+
+    The branch at 5 went to a block that only jumped to 'a = mul a x', and
+    the branch on 'zero' is never taken. Once 'a = add a a' and the second
+    jump to 9 are gone, as nobody reaches them, the jump at 7 leads to the
+    next block, and is removed too.
+    """
+    if any([type(inst) is PhiFunction for inst in program]):
+        raise ValueError("The CFG must be simplified before SSA construction")
+    consts = constant_conditions(program, env)
+    bbs = parser.to_basic_blocks(program)
+    changed = True
+    while changed:
+        size = len(bbs)
+        changed = _fold_branches(bbs, consts)
+        bbs = _remove_empty(bbs)
+        changed = _thread_jumps(bbs, consts) or changed
+        bbs = _remove_empty(_remove_unreachable(bbs))
+        changed = _merge_blocks(bbs) or changed or len(bbs) != size
+    return linearize(bbs), env
@@ -1,5 +1,6 @@
 from ssa_form import DominanceGraph, PhiFunction
-from typing import List
+from ssa_form import root_name, rename_uses
+from typing import Dict, List, Set
 import lang
 import parser
 
@@ -67,6 +68,9 @@ class DJGraph(DominanceGraph):
         for bb in s.bbs:
             s.j_edge_in[bb.index] = []
             s.j_edge_out[bb.index] = []
+        s.users = None
+        s.changed: Set[int] = set()
+        s.numbered = True
 
     def compute_j_edges(s):
         """
@@ -81,6 +85,9 @@ class DJGraph(DominanceGraph):
         Representing J-edges from the side of the receiver falls in accordance
         with how J-edges are utilized when computing Dominance Frontiers.
         """
+        for bb in s.bbs:
+            s.j_edge_in[bb.index] = []
+            s.j_edge_out[bb.index] = []
         for bb in s.bbs:
             nxts = bb.NEXTS
             for nxt in nxts:
@@ -120,12 +127,12 @@ class DJGraph(DominanceGraph):
                 s._insert_phi(used_var, s.bbs[phi_node_index])
 
     def _insert_phi(s, var, bb):
-        preds = [(var, ps.index)
-                 for ps in bb.PREVS
-                 if var in ps.definitions()]
-        if len(preds) <= 1:
+        defining_preds = [ps for ps in bb.PREVS if var in ps.definitions()]
+        if len(defining_preds) <= 1:
             return
 
+        # the phi-function has one source per incoming edge
+        preds = [(var, ps.index) for ps in bb.PREVS]
         phi = PhiFunction(var, preds)
         # update instruction chain
         leader = bb.instructions[0]
@@ -139,9 +146,718 @@ class DJGraph(DominanceGraph):
         leader.PREVS = [phi]
         bb.instructions = [phi] + bb.instructions
 
+    # The methods below edit a program that is already in SSA form, and
+    # repair the form locally, instead of building it again with 'to_ssa'.
+    # Instructions given to them are written in terms of the original
+    # variables, e.g., 'x = add a b' rather than 'x_3 = add a_1 b_0'.
+    #
+    # The first edit indexes the program: the last version of each variable,
+    # the instructions that define each variable, and the ones that use each
+    # version. Edits keep the index up to date, so that repairing a variable
+    # only visits its own definitions and uses. Edits also patch the links
+    # between blocks, and between instructions, in place; the instructions
+    # are numbered again the next time that 'prog' is read.
 
-def to_ssa(program: List[lang.Inst], env: lang.Env) -> \
-        (List[lang.Inst], lang.Env):
+    @property
+    def prog(s) -> List[lang.Inst]:
+        if not s.numbered:
+            s._prog = [inst for bb in s.bbs for inst in bb.instructions]
+            for (i, inst) in enumerate(s._prog):
+                inst.index = i
+            for bb in s.bbs:
+                last_inst = bb.instructions[-1]
+                if type(last_inst) is lang.Bt and len(bb.NEXTS) > 0:
+                    last_inst.jump_to = bb.NEXTS[-1].instructions[0].index
+            s.numbered = True
+        return s._prog
+
+    @prog.setter
+    def prog(s, prog: List[lang.Inst]):
+        s._prog = prog
+        s.numbered = True
+
+    def insert_definition(s, inst: lang.Inst, index: int, position: int):
+        """
+        Inserts 'inst' at 'position' among the instructions of block 'index'.
+        The instruction defines a new version of its destination, and uses the
+        versions of its sources that reach 'position'. Phi-functions are
+        inserted wherever the new version meets other versions.
+        """
+        s._index()
+        bb = s.bbs[index]
+        first = len(s._phis(bb))
+        last = len(bb.instructions)
+        if type(bb.instructions[-1]) is lang.Bt:
+            last -= 1
+        if position < first or position > last:
+            raise ValueError(f"Cannot insert at position {position} of "
+                             f"block {index}")
+        root = root_name(inst.dst)
+        inst.dst = s._new_version(root)
+        inst.block = index
+        bb.instructions.insert(position, inst)
+        s._record(inst)
+        s.changed.add(index)
+        for var in set([root]) | set([root_name(u) for u in inst.uses()]):
+            s.repair_variable(var)
+        s._relink()
+
+    def remove_definition(s, inst: lang.Inst):
+        """
+        Removes the definition 'inst' from the program. Its uses read, from
+        then on, the version that reached 'inst'.
+        """
+        s._index()
+        bb = s.bbs[inst.block]
+        if len(bb.instructions) - len(s._phis(bb)) == 1:
+            raise ValueError(f"Cannot remove the last instruction of "
+                             f"block {bb.index}")
+        bb.instructions.remove(inst)
+        s._forget(inst)
+        s.changed.add(bb.index)
+        s.repair_variable(root_name(inst.dst))
+        s._relink()
+
+    def add_edge(s, tail: int, head: int, cond: str):
+        """
+        Adds the CFG edge 'tail' -> 'head', by ending block 'tail' with a
+        branch to 'head' on the variable 'cond'. The block must not end with
+        a branch already.
+        """
+        s._index()
+        tail_bb = s.bbs[tail]
+        head_bb = s.bbs[head]
+        if type(tail_bb.instructions[-1]) is lang.Bt:
+            raise ValueError(f"Block {tail} already ends with a branch")
+        if head == s.bbs[0].index:
+            raise ValueError("The entry block cannot have phi-functions")
+        # Code that 'head' makes reachable may use any variable.
+        affected = set()
+        if not s._reachable(head):
+            affected = set(s.defs.keys()) | set(s.users.keys())
+        for phi in s._phis(head_bb):
+            s._forget(phi)
+            phi.srcs.append(root_name(phi.dst))
+            phi.blocks.append(tail)
+            s._record(phi)
+            affected.add(root_name(phi.dst))
+        branch = lang.Bt(cond)
+        branch.block = tail
+        tail_bb.instructions.append(branch)
+        s._record(branch)
+        s.changed.add(tail)
+        tail_bb.add_next(head_bb)
+        head_bb.add_previous(tail_bb)
+        affected |= s._update_cfg(tail, head)
+        for root in affected | set([root_name(cond)]):
+            s.repair_variable(root)
+        s._relink()
+
+    def remove_edge(s, tail: int, head: int):
+        """
+        Removes the CFG edge 'tail' -> 'head', by removing the branch that
+        ends block 'tail' and jumps to block 'head'.
+        """
+        s._index()
+        tail_bb = s.bbs[tail]
+        head_bb = s.bbs[head]
+        last_inst = tail_bb.instructions[-1]
+        if type(last_inst) is not lang.Bt or len(tail_bb.NEXTS) == 0 \
+                or tail_bb.NEXTS[-1] is not head_bb:
+            raise ValueError(f"Block {tail} does not branch to block {head}")
+        if len(tail_bb.instructions) - len(s._phis(tail_bb)) == 1:
+            raise ValueError(f"Cannot remove the last instruction of "
+                             f"block {tail}")
+        tail_bb.instructions.pop()
+        s._forget(last_inst)
+        s.changed |= set([tail, head])
+        tail_bb.NEXTS.pop()
+        head_bb.PREVS.remove(tail_bb)
+        for phi in s._phis(head_bb):
+            s._forget(phi)
+            i = phi.blocks.index(tail)
+            phi.srcs.pop(i)
+            phi.blocks.pop(i)
+            s._record(phi)
+        affected = s._update_cfg(tail, head)
+        for phi in s._phis(head_bb):
+            affected.add(root_name(phi.dst))
+        for root in affected:
+            s.repair_variable(root)
+        # Without the branch, the block after 'tail', or 'head', may not be
+        # a leader any more, and then it joins the block before it.
+        for index in sorted(set([tail + 1, head]), reverse=True):
+            if s._mergeable(index):
+                s._merge_blocks(index)
+        s._relink()
+
+    def repair_variable(s, root: str):
+        """
+        Restores the SSA form of the versions of the variable 'root': places
+        phi-functions at the iterated dominance frontier of the blocks that
+        define it, points every use to the version that reaches it, and
+        removes the phi-functions that became dead or redundant. Other
+        variables are not touched.
+        """
+        s._index()
+        definitions = list(s.defs.get(root, dict()).values())
+        def_blocks = set([s.bbs[0].index]) | \
+            set([inst.block for inst in definitions])
+        phi_blocks = set([inst.block for inst in definitions
+                          if type(inst) is PhiFunction])
+        frontier = set()
+        worklist = list(def_blocks)
+        while len(worklist) > 0:
+            index = worklist.pop()
+            for f in s.dominance_frontier[index]:
+                if f not in frontier:
+                    frontier.add(f)
+                    worklist.append(f)
+        for index in frontier - phi_blocks:
+            bb = s.bbs[index]
+            phi = PhiFunction(s._new_version(root),
+                              [(root, ps.index) for ps in bb.PREVS])
+            phi.srcs = [root for _ in phi.blocks]
+            phi.block = index
+            bb.instructions.insert(0, phi)
+            s._record(phi)
+            s.changed.add(index)
+        s._rename_variable(root)
+        s._prune_phis(root)
+
+    def version_at_entry(s, root: str, index: int) -> str:
+        """
+        Returns the version of variable 'root' that reaches the beginning of
+        block 'index', after its phi-functions.
+        """
+        phi = s._phi_of(root, s.bbs[index])
+        if phi is not None:
+            return phi.dst
+        idom = s.immediate_dominator(index)
+        if idom is None:
+            return f'{root}_0'
+        return s.version_at_exit(root, idom)
+
+    def version_at_exit(s, root: str, index: int) -> str:
+        """
+        Returns the version of variable 'root' that leaves block 'index'.
+        """
+        for inst in reversed(s.bbs[index].instructions):
+            for d in inst.definition():
+                if root_name(d) == root:
+                    return d
+        return s.version_at_entry(root, index)
+
+    def consistency_errors(s) -> List[str]:
+        """
+        Checks that the program is in SSA form, and returns a description of
+        each problem found. Every version must be defined once, phi-functions
+        must lead their blocks and have one source per incoming edge, and
+        each use must read the only version of its variable that can reach
+        it. The last check follows the versions of each variable through the
+        CFG, so it does not trust the dominance tree.
+        """
+        errors = []
+        defined = set()
+        for (i, inst) in enumerate(s.prog):
+            if inst.index != i:
+                errors.append(f'instruction {i} has index {inst.index}')
+        for bb in s.bbs:
+            seen_non_phi = False
+            for inst in bb.instructions:
+                for d in inst.definition():
+                    if d in defined:
+                        errors.append(f'{d} is defined more than once')
+                    defined.add(d)
+                if type(inst) is not PhiFunction:
+                    seen_non_phi = True
+                    continue
+                if seen_non_phi:
+                    errors.append(f'{inst.dst} does not lead its block')
+                if bb is s.bbs[0]:
+                    errors.append(f'{inst.dst} is in the entry block')
+                if sorted(inst.blocks) != \
+                        sorted([ps.index for ps in bb.PREVS]):
+                    errors.append(f'{inst.dst} has sources {inst.blocks}, '
+                                  f'but block {bb.index} has predecessors '
+                                  f'{[ps.index for ps in bb.PREVS]}')
+        for root in set([root_name(v) for v in s._variables()]):
+            errors += s._reaching_errors(root)
+        return errors
+
+    def _reaching_errors(s, root: str) -> List[str]:
+        def transfer(bb, current, check):
+            for inst in bb.instructions:
+                if type(inst) is not PhiFunction:
+                    for u in inst.uses():
+                        if root_name(u) == root and check \
+                                and current != set([u]):
+                            errors.append(f'{u} is used at {inst.index}, '
+                                          f'where {sorted(current)} reach')
+                for d in inst.definition():
+                    if root_name(d) == root:
+                        current = set([d])
+            return current
+
+        errors = []
+        entry = s.bbs[0].index
+        reaching_out = dict()
+        for bb in s.bbs:
+            reaching_out[bb.index] = set()
+        changed = True
+        while changed:
+            changed = False
+            for bb in s.bbs:
+                current = set([f'{root}_0']) if bb.index == entry else set()
+                for ps in bb.PREVS:
+                    current = current | reaching_out[ps.index]
+                current = transfer(bb, current, False)
+                if current != reaching_out[bb.index]:
+                    reaching_out[bb.index] = current
+                    changed = True
+        for bb in s.bbs:
+            current = set([f'{root}_0']) if bb.index == entry else set()
+            for ps in bb.PREVS:
+                current = current | reaching_out[ps.index]
+            transfer(bb, current, True)
+            phi = s._phi_of(root, bb)
+            if phi is None:
+                continue
+            for (src, pred) in zip(phi.srcs, phi.blocks):
+                if reaching_out[pred] != set([src]):
+                    errors.append(f'{phi.dst} reads {src} from block '
+                                  f'{pred}, where '
+                                  f'{sorted(reaching_out[pred])} reach')
+        return errors
+
+    def _phis(s, bb: parser.BasicBlock) -> List[PhiFunction]:
+        return [inst for inst in bb.instructions if type(inst) is PhiFunction]
+
+    def _phi_of(s, root: str, bb: parser.BasicBlock) -> PhiFunction:
+        for phi in s._phis(bb):
+            if root_name(phi.dst) == root:
+                return phi
+        return None
+
+    def _variables(s) -> Set[str]:
+        vs = set()
+        for bb in s.bbs:
+            vs = vs | bb.definitions() | bb.uses()
+        return vs
+
+    def _index(s):
+        if s.users is not None:
+            return
+        s.versions: Dict[str, int] = dict()
+        s.defs: Dict[str, Dict[str, lang.Inst]] = dict()
+        s.users: Dict[str, Dict[str, Set[lang.Inst]]] = dict()
+        for var in s.env.definitions():
+            s._take_version(var)
+        for bb in s.bbs:
+            for inst in bb.instructions:
+                inst.block = bb.index
+                s._record(inst)
+        s._index_frontiers()
+
+    def _take_version(s, var: str):
+        parts = var.rsplit('_', 1)
+        if len(parts) == 2 and parts[1].isdigit():
+            s.versions[parts[0]] = max(s.versions.get(parts[0], -1),
+                                       int(parts[1]))
+
+    def _new_version(s, root: str) -> str:
+        s.versions[root] = s.versions.get(root, -1) + 1
+        return f'{root}_{s.versions[root]}'
+
+    def _record(s, inst: lang.Inst):
+        """
+        Adds the definition and the uses of 'inst' to the index.
+        """
+        for d in inst.definition():
+            s.defs.setdefault(root_name(d), dict())[d] = inst
+            s._take_version(d)
+        for u in inst.uses():
+            s.users.setdefault(root_name(u), dict()) \
+                .setdefault(u, set()).add(inst)
+            s._take_version(u)
+
+    def _forget(s, inst: lang.Inst):
+        """
+        Removes the definition and the uses of 'inst' from the index.
+        """
+        for d in inst.definition():
+            s.defs[root_name(d)].pop(d, None)
+        for u in inst.uses():
+            s.users[root_name(u)][u].discard(inst)
+
+    def _rename(s, inst: lang.Inst, names: dict):
+        s._forget(inst)
+        rename_uses(inst, names)
+        s._record(inst)
+
+    def _rename_variable(s, root: str):
+        """
+        Walks the dominance tree, pointing each use of 'root', including the
+        sources of phi-functions, to the version that reaches it. Only the
+        blocks that define or use 'root' are scanned.
+        """
+        phis = dict()
+        blocks = set()
+        for inst in s.defs.get(root, dict()).values():
+            blocks.add(inst.block)
+            if type(inst) is PhiFunction:
+                phis[inst.block] = inst
+        for insts in s.users.get(root, dict()).values():
+            blocks |= set([inst.block for inst in insts
+                           if type(inst) is not PhiFunction])
+        stack = [(s.bbs[0].index, f'{root}_0')]
+        while len(stack) > 0:
+            (index, current) = stack.pop()
+            bb = s.bbs[index]
+            if index in blocks:
+                for inst in bb.instructions:
+                    if type(inst) is not PhiFunction:
+                        names = dict([(u, current) for u in inst.uses()
+                                      if root_name(u) == root and
+                                      u != current])
+                        if len(names) > 0:
+                            s._rename(inst, names)
+                    for d in inst.definition():
+                        if root_name(d) == root:
+                            current = d
+            for nxt in bb.NEXTS:
+                phi = phis.get(nxt.index)
+                if phi is None:
+                    continue
+                srcs = [current if block == index else src
+                        for (src, block) in zip(phi.srcs, phi.blocks)]
+                if srcs != phi.srcs:
+                    s._forget(phi)
+                    phi.srcs = srcs
+                    s._record(phi)
+            for child in s.immediate_domain[index]:
+                stack.append((child, current))
+
+    def _prune_phis(s, root: str):
+        """
+        Removes the phi-functions of 'root' that no instruction uses, and
+        replaces the ones whose sources are all the same version, or the
+        phi-function itself, by that version. Removing a phi-function may
+        let the phi-functions that read it, or that it reads, go as well.
+        """
+        definitions = s.defs.get(root, dict())
+        worklist = [inst for inst in definitions.values()
+                    if type(inst) is PhiFunction]
+        while len(worklist) > 0:
+            phi = worklist.pop()
+            if definitions.get(phi.dst) is not phi:
+                continue
+            srcs = set(phi.srcs) - set([phi.dst])
+            users = s.users.get(root, dict()).get(phi.dst, set()) - set([phi])
+            if len(srcs) == 1:
+                replacement = srcs.pop()
+                for inst in users:
+                    s._rename(inst, {phi.dst: replacement})
+                worklist += [inst for inst in users
+                             if type(inst) is PhiFunction]
+            elif len(users) > 0:
+                continue
+            s.bbs[phi.block].instructions.remove(phi)
+            s._forget(phi)
+            s.changed.add(phi.block)
+            worklist += [definitions[src] for src in phi.srcs
+                         if type(definitions.get(src)) is PhiFunction]
+
+    def _reachable(s, index: int) -> bool:
+        return index == s.bbs[0].index or \
+            s.immediate_dominator(index) is not None
+
+    def _roots_defined(s, indices: List[int]) -> Set[str]:
+        roots = set()
+        for index in indices:
+            roots |= set([root_name(d) for d in s.bbs[index].definitions()])
+        return roots
+
+    def _update_cfg(s, tail: int, head: int) -> Set[str]:
+        """
+        Updates the dominance tree, the J-edges and the dominance frontiers
+        after the edge 'tail' -> 'head' was added or removed, and returns the
+        variables defined in the blocks whose frontiers changed. Only the
+        subtree of the closest common dominator of both blocks may change,
+        besides the frontiers of the blocks that dominate it. A variable
+        needs new phi-functions only if the iterated frontier of a block
+        that defines it goes through one of the frontiers that changed.
+        """
+        if not s._reachable(tail):
+            s._update_j_edges([tail])
+            return set()
+        if not s._reachable(head):
+            # The blocks that 'head' reaches join the dominance tree, and
+            # may change the dominators of any block.
+            root = s.bbs[0].index
+            before = [bb.index for bb in s.bbs]
+            s.compute_dominance_graph()
+        else:
+            root = s.find_common_ancestor([tail, head])
+            before = list(s.dominance_graph(root).keys())
+            s.update_dominance_graph(root)
+        subtree = s.dominance_graph(root)
+        s._update_j_edges(set(before) | set(subtree.keys()))
+        for index in set(before) - set(subtree.keys()):
+            s._set_frontier(index, set())
+        blocks = s._update_frontiers(root, subtree)
+        worklist = list(blocks)
+        while len(worklist) > 0:
+            for source in s.frontier_sources.get(worklist.pop(), set()):
+                if source not in blocks:
+                    blocks.add(source)
+                    worklist.append(source)
+        return s._roots_defined(blocks)
+
+    def _update_j_edges(s, indices: Set[int]):
+        """
+        Computes again the J-edges that leave the blocks in 'indices'.
+        """
+        for index in indices:
+            for target in s.j_edge_out[index]:
+                s.j_edge_in[target] = [i for i in s.j_edge_in[target]
+                                       if i != index]
+            s.j_edge_out[index] = []
+        for index in indices:
+            bb = s.bbs[index]
+            for nxt in bb.NEXTS:
+                if index not in s.get_dominator_indices(nxt.index):
+                    s.add_j_edge(bb, nxt)
+
+    def _update_frontiers(s, root: int, subtree: dict) -> Set[int]:
+        """
+        Computes the dominance frontiers of the blocks in 'subtree', the
+        dominance tree below 'root', bottom up, and then the frontiers of the
+        blocks that dominate 'root', while they change. The frontier of a
+        block holds the targets of its J-edges, and the frontiers of its
+        children, that are not deeper than the block itself. Returns the
+        blocks whose frontiers changed.
+        """
+        changed = set()
+        for index in reversed(list(subtree.keys())):
+            if s._update_frontier(index):
+                changed.add(index)
+        for index in reversed(s.path[root][:-1]):
+            if not s._update_frontier(index):
+                break
+            changed.add(index)
+        return changed
+
+    def _update_frontier(s, index: int) -> bool:
+        level = s.level[index]
+        frontier = set([nxt for nxt in s.j_edge_out[index]
+                        if s.level[nxt] <= level])
+        for child in s.immediate_domain[index]:
+            frontier |= set([f for f in s.dominance_frontier[child]
+                             if s.level[f] <= level])
+        changed = frontier != s.dominance_frontier.get(index)
+        s._set_frontier(index, frontier)
+        return changed
+
+    def _set_frontier(s, index: int, frontier: Set[int]):
+        for f in s.dominance_frontier.get(index, set()):
+            s.frontier_sources[f].discard(index)
+        for f in frontier:
+            s.frontier_sources.setdefault(f, set()).add(index)
+        s.dominance_frontier[index] = frontier
+
+    def _index_frontiers(s):
+        """
+        Maps each block to the blocks that have it in their frontiers.
+        """
+        s.frontier_sources: Dict[int, Set[int]] = dict()
+        for (index, frontier) in s.dominance_frontier.items():
+            for f in frontier:
+                s.frontier_sources.setdefault(f, set()).add(index)
+
+    def _mergeable(s, index: int) -> bool:
+        """
+        Tells if block 'index' is not a leader: the block before it falls
+        through into it, and nothing else leads to it.
+        """
+        if index <= 0 or index >= len(s.bbs):
+            return False
+        prev_bb = s.bbs[index-1]
+        return type(prev_bb.instructions[-1]) is not lang.Bt \
+            and s.bbs[index].PREVS == [prev_bb]
+
+    def _merge_blocks(s, index: int):
+        """
+        Appends block 'index' to the block before it, which becomes the
+        immediate dominator of the blocks that 'index' dominated, and numbers
+        the blocks after it again.
+        """
+        bb = s.bbs.pop(index)
+        prev_bb = s.bbs[index-1]
+        for inst in bb.instructions:
+            inst.block = prev_bb.index
+        prev_bb.instructions += bb.instructions
+        prev_bb.NEXTS = bb.NEXTS
+        for nxt in bb.NEXTS:
+            nxt.PREVS = [prev_bb if ps is bb else ps for ps in nxt.PREVS]
+            for phi in s._phis(nxt):
+                phi.blocks = [prev_bb.index if block == index else block
+                              for block in phi.blocks]
+        children = s.immediate_domain.pop(index)
+        s.immediate_domain[prev_bb.index].discard(index)
+        s.immediate_domain[prev_bb.index] |= children
+        for child in children:
+            s.dominators[child] = set([prev_bb.index])
+            s._compute_levels(child, s.level[prev_bb.index] + 1,
+                              s.path[prev_bb.index])
+        for source in s.j_edge_in.pop(index):
+            s.j_edge_out[source] = [i for i in s.j_edge_out[source]
+                                    if i != index]
+        for target in s.j_edge_out[index]:
+            s.j_edge_in[target] = [prev_bb.index if i == index else i
+                                   for i in s.j_edge_in[target]]
+        s.j_edge_out[prev_bb.index] += s.j_edge_out.pop(index)
+        for table in [s.dominators, s.level, s.path, s.dominance_frontier]:
+            table.pop(index, None)
+        s.changed.discard(index)
+        s.changed.add(prev_bb.index)
+        s._renumber(index)
+        s._index_frontiers()
+
+    def _renumber(s, start: int):
+        """
+        Numbers the blocks from position 'start' on after their positions,
+        once the block that was at 'start' is gone. This is the only repair
+        that goes over all the blocks, as every table keyed by block changes.
+        """
+        numbers = dict([(s.bbs[i].index, i) for i in range(start, len(s.bbs))])
+        if len(numbers) == 0:
+            return
+
+        def number(index: int) -> int:
+            return numbers.get(index, index)
+
+        for bb in s.bbs[start:]:
+            bb.index = number(bb.index)
+            for inst in bb.instructions:
+                inst.block = bb.index
+        for table in [s.immediate_domain, s.dominators, s.dominance_frontier]:
+            for (index, blocks) in list(table.items()):
+                del table[index]
+                table[number(index)] = set([number(i) for i in blocks])
+        for table in [s.j_edge_in, s.j_edge_out, s.path]:
+            for (index, blocks) in list(table.items()):
+                del table[index]
+                table[number(index)] = [number(i) for i in blocks]
+        for (index, level) in list(s.level.items()):
+            del s.level[index]
+            s.level[number(index)] = level
+        for definitions in s.defs.values():
+            for inst in definitions.values():
+                if type(inst) is PhiFunction:
+                    inst.blocks = [number(i) for i in inst.blocks]
+        s.changed = set([number(i) for i in s.changed])
+
+    def _relink(s):
+        """
+        Chains again the instructions of the blocks that changed, and the
+        first and last instructions of the blocks around them.
+        """
+        borders = set()
+        for index in s.changed:
+            bb = s.bbs[index]
+            for (inst, nxt) in zip(bb.instructions, bb.instructions[1:]):
+                inst.NEXTS = [nxt]
+                nxt.PREVS = [inst]
+            borders |= set([bb] + bb.PREVS + bb.NEXTS +
+                           s.bbs[max(index-1, 0):index+2])
+        for bb in borders:
+            first_inst = bb.instructions[0]
+            first_inst.PREVS = [ps.instructions[-1] for ps in bb.PREVS]
+            last_inst = bb.instructions[-1]
+            fall = None
+            if bb.index + 1 < len(s.bbs):
+                fall = s.bbs[bb.index + 1].instructions[0]
+            if type(last_inst) is lang.Bt:
+                last_inst.NEXTS = [None, fall]
+                if len(bb.NEXTS) > 0:
+                    last_inst.set_true_dst(bb.NEXTS[-1].instructions[0])
+            else:
+                last_inst.NEXTS = [] if fall is None else [fall]
+        s.changed = set()
+        s.numbered = False
+
+
+def build_ssa_graph(program: List[lang.Inst], env: lang.Env) -> DJGraph:
+    """
+    Converts a program into SSA form, and returns the DJGraph that holds it,
+    which can be used to edit the program without leaving SSA form.
+
+        >>> program = [
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'count = add zero one',
+        ...     'sum = add zero zero',
+        ...     'sum = add sum count',
+        ...     'count = add count one',
+        ...     'repeat = geq five count',
+        ...     'bt repeat 2',
+        ...     'end = add zero zero',
+        ... ]
+        >>> prog, env = parser.build_cfg(program)
+        >>> dj_graph = build_ssa_graph(prog, env)
+        >>> dj_graph.consistency_errors()
+        []
+
+    A new definition of 'sum' before the loop is seen by the loop:
+
+        >>> dj_graph.insert_definition(lang.Add('sum', 'one', 'one'), 0, 2)
+        >>> [(i.dst, i.srcs) for i in dj_graph.prog if type(i) is PhiFunction]
+        [('sum_1', ['sum_3', 'sum_2']), ('count_1', ['count_0', 'count_2'])]
+        >>> dj_graph.consistency_errors()
+        []
+
+    Removing the definition of 'count' inside the loop makes its
+    phi-function redundant:
+
+        >>> dj_graph.remove_definition(dj_graph.prog[6])
+        >>> [(i.dst, i.srcs) for i in dj_graph.prog if type(i) is PhiFunction]
+        [('sum_1', ['sum_3', 'sum_2'])]
+        >>> [(i.dst, i.src0, i.src1) for i in dj_graph.prog[4:6]]
+        [('sum_2', 'sum_1', 'count_0'), ('repeat_0', 'five_0', 'count_0')]
+        >>> dj_graph.consistency_errors()
+        []
+
+    A use after the loop reads the version that leaves the loop:
+
+        >>> dj_graph.insert_definition(lang.Add('total', 'sum', 'zero'), 2, 0)
+        >>> total = dj_graph.prog[7]
+        >>> (total.dst, total.src0, total.src1)
+        ('total_0', 'sum_2', 'zero_0')
+
+    A new edge that skips the loop changes the dominance tree, and the use
+    after the loop now needs a phi-function:
+
+        >>> dj_graph.add_edge(0, 2, 'one')
+        >>> dj_graph.dominance_graph()
+        {0: {1, 2}, 1: set(), 2: set()}
+        >>> [(i.dst, i.srcs) for i in dj_graph.prog if type(i) is PhiFunction]
+        [('sum_1', ['sum_3', 'sum_2']), ('sum_4', ['sum_2', 'sum_3'])]
+        >>> (total.dst, total.src0, total.src1)
+        ('total_0', 'sum_4', 'zero_0')
+        >>> dj_graph.consistency_errors()
+        []
+        >>> dj_graph.remove_edge(0, 2)
+        >>> (total.dst, total.src0, total.src1)
+        ('total_0', 'sum_2', 'zero_0')
+        >>> dj_graph.consistency_errors()
+        []
+
+    The checker also finds programs that are not in SSA form:
+
+        >>> total.src0 = 'sum_1'
+        >>> dj_graph.consistency_errors()
+        ["sum_1 is used at 7, where ['sum_2'] reach"]
+    """
     bbs = parser.to_basic_blocks(program)
     dj_graph = DJGraph(bbs, env)
     dj_graph.compute_dominance_graph()
@@ -150,4 +866,10 @@ def to_ssa(program: List[lang.Inst], env: lang.Env) -> \
     dj_graph.insert_phi_functions()
     dj_graph.reindex_program()
     dj_graph.rename_variables()
+    return dj_graph
+
+
+def to_ssa(program: List[lang.Inst], env: lang.Env) -> \
+        (List[lang.Inst], lang.Env):
+    dj_graph = build_ssa_graph(program, env)
     return dj_graph.prog, dj_graph.env
@@ -0,0 +1,421 @@
+"""
+Sparse data-flow analyses on programs in SSA form.
+
+A dense analysis keeps a map from every variable to its abstract value at
+every program point, and copies the map through instructions that do not
+touch most of its variables. In SSA form, each variable has a single
+definition, so its abstract value can be attached to its name, and only
+needs to be computed again when the value of one of its operands changes.
+The def-use graph of the program tells which instructions read each name,
+and phi-functions are the only places where the values of several names
+meet. This is the sparse approach of "Efficiently Computing Static Single
+Assignment Form and the Control Dependence Graph" (Cytron et al.) and of
+"Constant Propagation with Conditional Branches" (Wegman and Zadeck), without
+the conditional part.
+
+- SparseAnalysis declares an analysis over SSA names; 'run' solves it on
+  the def-use graph, and 'run_dense' solves the same analysis with maps of
+  every name at every instruction, for comparison.
+- ConstantPropagation and IntervalPropagation are two such analyses. The
+  values of the phi-functions of blocks that are targets of jumps back in
+  the program are widened, so that interval bounds do not grow forever, and
+  narrowed afterwards.
+- 'liveness' computes live variables backwards from each use of each name,
+  up to its definition, and never visits the blocks where a name is dead.
+"""
+import lang
+import parser
+from sccp import TOP, BOTTOM, meet, evaluate
+from ssa_form import PhiFunction, Copy
+from typing import Dict, List, Set, Tuple
+
+INF = float('inf')
+
+
+class SparseAnalysis:
+    """
+    A forward analysis that maps each SSA name to an abstract value.
+    Analyses declare:
+
+    - 'top', the value of names that have not been computed yet;
+    - 'abstract', the value of a concrete value of the environment;
+    - 'meet', which combines the sources of phi-functions;
+    - 'evaluate', the value defined by a binary operation or a copy;
+    - 'widen' and 'narrow', for lattices of infinite height.
+    """
+
+    narrowing_rounds: int = 0
+
+    @classmethod
+    def top(cls):
+        raise NotImplementedError
+
+    @classmethod
+    def abstract(cls, value):
+        raise NotImplementedError
+
+    @classmethod
+    def meet(cls, a, b):
+        raise NotImplementedError
+
+    @classmethod
+    def evaluate(cls, inst: lang.Inst, values: dict):
+        raise NotImplementedError
+
+    @classmethod
+    def widen(cls, old, new):
+        return new
+
+    @classmethod
+    def narrow(cls, old, new):
+        return new
+
+    @classmethod
+    def phi(cls, inst: PhiFunction, values: dict):
+        value = cls.top()
+        for src in inst.srcs:
+            value = cls.meet(value, values.get(src, cls.top()))
+        return value
+
+    @classmethod
+    def _boundary(cls, env: lang.Env) -> dict:
+        return dict([(var, cls.abstract(env.get(var)))
+                     for var in env.definitions()])
+
+    @classmethod
+    def _headers(cls, bbs: List[parser.BasicBlock]) -> Set[int]:
+        """
+        Returns the targets of jumps back in the program. Every cycle of the
+        CFG goes through one of them, even in loops that are not reducible.
+        """
+        return set([nxt.index for bb in bbs for nxt in bb.NEXTS
+                    if nxt.index <= bb.index])
+
+    @classmethod
+    def run(cls, bbs: List[parser.BasicBlock], env: lang.Env) -> dict:
+        """
+        Solves the analysis on the def-use graph. Each instruction is
+        visited once, and then again whenever the value of one of its
+        operands changes.
+        """
+        headers = cls._headers(bbs)
+        values = cls._boundary(env)
+        users: Dict[str, List[Tuple[lang.Inst, bool]]] = dict()
+        worklist = []
+        for bb in bbs:
+            for inst in bb.instructions:
+                if type(inst) is lang.Bt:
+                    continue
+                widening = type(inst) is PhiFunction and bb.index in headers
+                for var in inst.uses():
+                    users.setdefault(var, []).append((inst, widening))
+                values[inst.dst] = cls.top()
+                worklist.append((inst, widening))
+        order = list(worklist)
+        worklist.reverse()
+        while len(worklist) > 0:
+            (inst, widening) = worklist.pop()
+            value = cls.phi(inst, values) if type(inst) is PhiFunction \
+                else cls.evaluate(inst, values)
+            if widening:
+                value = cls.widen(values[inst.dst], value)
+            if value != values[inst.dst]:
+                values[inst.dst] = value
+                worklist.extend(users.get(inst.dst, []))
+        for round in range(cls.narrowing_rounds if headers else 0):
+            changed = False
+            for (inst, widening) in order:
+                value = cls.phi(inst, values) if type(inst) is PhiFunction \
+                    else cls.evaluate(inst, values)
+                if widening:
+                    value = cls.narrow(values[inst.dst], value)
+                if value != values[inst.dst]:
+                    values[inst.dst] = value
+                    changed = True
+            if not changed:
+                break
+        return values
+
+    @classmethod
+    def _through_block(cls, bb: parser.BasicBlock, entry: Dict[int, dict],
+                       old: dict, widening: bool, narrowing: bool) -> dict:
+        """
+        Returns the map at the exit of a block, given the maps that leave
+        its predecessors. 'old' is the previous map at the exit of the
+        block, where the values of phi-functions are widened or narrowed.
+        """
+        facts = None
+        for pred in entry.values():
+            facts = dict(pred) if facts is None else dict(
+                [(var, cls.meet(facts.get(var, cls.top()),
+                                pred.get(var, cls.top())))
+                 for var in facts.keys() | pred.keys()])
+        facts = dict() if facts is None else facts
+        phis = dict()
+        for inst in bb.instructions:
+            if type(inst) is not PhiFunction:
+                break
+            value = cls.top()
+            for (src, pred) in zip(inst.srcs, inst.blocks):
+                if pred in entry:
+                    value = cls.meet(value,
+                                     entry[pred].get(src, cls.top()))
+            if widening:
+                value = cls.widen(old.get(inst.dst, cls.top()), value)
+            elif narrowing:
+                value = cls.narrow(old.get(inst.dst, cls.top()), value)
+            phis[inst.dst] = value
+        facts.update(phis)
+        for inst in bb.instructions:
+            if type(inst) not in [lang.Bt, PhiFunction]:
+                facts[inst.dst] = cls.evaluate(inst, facts)
+        return facts
+
+    @classmethod
+    def run_dense(cls, bbs: List[parser.BasicBlock], env: lang.Env) -> dict:
+        """
+        Solves the analysis with a map of every name at every instruction,
+        as the monotone framework does. Returns the value of each name at
+        the exit of the block that defines it. Widening depends on the order
+        in which values are found, so the intervals of both solvers may
+        differ in precision, though both are sound.
+        """
+        headers = cls._headers(bbs)
+        boundary = cls._boundary(env)
+        exits: Dict[int, dict] = dict()
+
+        def entry(bb: parser.BasicBlock) -> Dict[int, dict]:
+            maps = dict([(pred.index, exits[pred.index])
+                         for pred in bb.PREVS if pred.index in exits])
+            if bb.index == 0:
+                maps[-1] = boundary
+            return maps
+
+        worklist = [bbs[0]] if len(bbs) > 0 else []
+        while len(worklist) > 0:
+            bb = worklist.pop()
+            facts = cls._through_block(bb, entry(bb), exits.get(bb.index, {}),
+                                       bb.index in headers, False)
+            if facts != exits.get(bb.index):
+                exits[bb.index] = facts
+                worklist.extend(bb.NEXTS)
+        for round in range(cls.narrowing_rounds if headers else 0):
+            changed = False
+            for bb in bbs:
+                if bb.index not in exits:
+                    continue
+                facts = cls._through_block(bb, entry(bb), exits[bb.index],
+                                           False, bb.index in headers)
+                if facts != exits[bb.index]:
+                    exits[bb.index] = facts
+                    changed = True
+            if not changed:
+                break
+        values = dict(boundary)
+        for bb in bbs:
+            for inst in bb.instructions:
+                if type(inst) is not lang.Bt:
+                    values[inst.dst] = exits.get(bb.index, {}).get(
+                        inst.dst, cls.top())
+        return values
+
+
+class ConstantPropagation(SparseAnalysis):
+    """
+    Finds the names that hold constants, with the lattice of 'sccp'.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'a = add zero one',
+        ...     'i = add zero zero',
+        ...     'i = add i a',
+        ...     'b = mul a five',
+        ...     'c = lth i b',
+        ...     'bt c 2',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> values = ConstantPropagation.run(bbs, env)
+        >>> [values[var] for var in ['a_0', 'b_0', 'i_0', 'i_1', 'c_0']]
+        [1, 5, 0, BOTTOM, BOTTOM]
+        >>> ConstantPropagation.run_dense(bbs, env) == values
+        True
+    """
+
+    @classmethod
+    def top(cls):
+        return TOP
+
+    @classmethod
+    def abstract(cls, value):
+        return value
+
+    @classmethod
+    def meet(cls, a, b):
+        return meet(a, b)
+
+    @classmethod
+    def evaluate(cls, inst: lang.Inst, values: dict):
+        return evaluate(inst, values)
+
+
+def _add(a: tuple, b: tuple) -> tuple:
+    return (a[0] + b[0], a[1] + b[1])
+
+
+def _times(x: float, y: float) -> float:
+    # zero times infinity is zero for integers
+    return 0 if x == 0 or y == 0 else x * y
+
+
+def _mul(a: tuple, b: tuple) -> tuple:
+    products = [_times(x, y) for x in a for y in b]
+    return (min(products), max(products))
+
+
+def _lth(a: tuple, b: tuple) -> tuple:
+    if a[1] < b[0]:
+        return (1, 1)
+    if a[0] >= b[1]:
+        return (0, 0)
+    return (0, 1)
+
+
+def _geq(a: tuple, b: tuple) -> tuple:
+    (lo, hi) = _lth(a, b)
+    return (1 - hi, 1 - lo)
+
+
+OPERATIONS = {lang.Add: _add, lang.Mul: _mul, lang.Lth: _lth, lang.Geq: _geq}
+
+
+class IntervalPropagation(SparseAnalysis):
+    """
+    Bounds the value of each name by an interval (lo, hi). None stands for
+    names whose definitions have not been reached yet. Booleans are the
+    integers 0 and 1.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "two": 2, "ten": 10}',
+        ...     'i = add zero zero',
+        ...     'i = add i one',
+        ...     'j = mul i two',
+        ...     'c = lth i ten',
+        ...     'bt c 1',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> values = IntervalPropagation.run(bbs, env)
+        >>> [values[var] for var in ['i_0', 'i_1', 'i_2', 'j_0', 'c_0']]
+        [(0, 0), (0, inf), (1, inf), (2, inf), (0, 1)]
+        >>> IntervalPropagation.run_dense(bbs, env) == values
+        True
+
+    Without the refinement of branch conditions, nothing bounds 'i' in the
+    loop from above.
+    """
+
+    narrowing_rounds = 2
+
+    @classmethod
+    def top(cls):
+        return None
+
+    @classmethod
+    def abstract(cls, value):
+        if type(value) in [int, bool]:
+            return (int(value), int(value))
+        return (-INF, INF)
+
+    @classmethod
+    def meet(cls, a, b):
+        if a is None or b is None:
+            return b if a is None else a
+        return (min(a[0], b[0]), max(a[1], b[1]))
+
+    @classmethod
+    def evaluate(cls, inst: lang.Inst, values: dict):
+        if type(inst) is Copy:
+            return values.get(inst.src)
+        a = values.get(inst.src0)
+        b = values.get(inst.src1)
+        if a is None or b is None:
+            return None
+        return OPERATIONS[type(inst)](a, b)
+
+    @classmethod
+    def widen(cls, old, new):
+        if old is None or new is None:
+            return new
+        return (old[0] if new[0] >= old[0] else -INF,
+                old[1] if new[1] <= old[1] else INF)
+
+    @classmethod
+    def narrow(cls, old, new):
+        if old is None or new is None:
+            return new
+        return (new[0] if old[0] == -INF else old[0],
+                new[1] if old[1] == INF else old[1])
+
+
+def liveness(bbs: List[parser.BasicBlock], env: lang.Env) -> \
+        Tuple[Dict[int, Set[str]], Dict[int, Set[str]]]:
+    """
+    Returns the names that are alive at the entry and at the exit of each
+    block of a program in SSA form. A phi-function reads its sources at the
+    exit of the corresponding predecessors.
+
+    Example:
+        >>> from solution import to_ssa
+        >>> prog, env = parser.build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'i = add zero zero',
+        ...     'i = add i one',
+        ...     'c = lth i five',
+        ...     'bt c 1',
+        ...     'j = add i i',
+        ... ])
+        >>> prog, env = to_ssa(prog, env)
+        >>> live_in, live_out = liveness(parser.to_basic_blocks(prog), env)
+        >>> [sorted(live_in[i]) for i in range(3)]
+        [['five_0', 'one_0', 'zero_0'], ['five_0', 'one_0'], ['i_2']]
+        >>> [sorted(live_out[i]) for i in range(3)]
+        [['five_0', 'i_0', 'one_0'], ['five_0', 'i_2', 'one_0'], []]
+    """
+    def_block = dict([(var, None) for var in env.definitions()])
+    for bb in bbs:
+        for inst in bb.instructions:
+            for var in inst.definition():
+                def_block[var] = bb.index
+    live_in = dict([(bb.index, set()) for bb in bbs])
+    live_out = dict([(bb.index, set()) for bb in bbs])
+
+    def up_from_exit(index: int, var: str):
+        worklist = [index]
+        while len(worklist) > 0:
+            index = worklist.pop()
+            if var in live_out[index]:
+                continue
+            live_out[index].add(var)
+            if def_block.get(var) == index or var in live_in[index]:
+                continue
+            live_in[index].add(var)
+            worklist.extend([pred.index for pred in bbs[index].PREVS])
+
+    for bb in bbs:
+        for inst in bb.instructions:
+            if type(inst) is PhiFunction:
+                for (src, pred) in zip(inst.srcs, inst.blocks):
+                    up_from_exit(pred, src)
+                continue
+            for var in inst.uses():
+                if def_block.get(var) != bb.index and \
+                        var not in live_in[bb.index]:
+                    live_in[bb.index].add(var)
+                    for pred in bb.PREVS:
+                        up_from_exit(pred.index, var)
+    return live_in, live_out
@@ -1,12 +1,25 @@
 import lang
 import parser
-from typing import List, Set
+from typing import Dict, List, Set
 
 
 class PhiFunction(lang.Inst):
+    """
+    A phi-function selects one of its sources according to the edge through
+    which control reached its basic block. Phi-functions are created with
+    '(var, block_index)' pairs as sources; 'blocks' keeps, for each source,
+    the index of the predecessor block it flows from, so that the association
+    survives the renaming of sources into plain variable names.
+
+    Example:
+        >>> phi = PhiFunction('x', [('x', 0), ('x', 2)])
+        >>> phi.blocks
+        [0, 2]
+    """
     def __init__(s, dst, srcs):
         s.dst = dst
         s.srcs = srcs
+        s.blocks = [block_index for (_, block_index) in srcs]
         super().__init__()
 
     def definition(s):
@@ -15,11 +28,312 @@ class PhiFunction(lang.Inst):
     def uses(s):
         return set(s.srcs)
 
+    def source(s, pred_block: int) -> str:
+        """
+        Returns the source that flows into the phi-function when control
+        comes from the block whose index is 'pred_block'.
+
+        Example:
+            >>> phi = PhiFunction('x', [('x', 0), ('x', 2)])
+            >>> phi.srcs = ['x_0', 'x_2']
+            >>> phi.source(2)
+            'x_2'
+        """
+        return s.srcs[s.blocks.index(pred_block)]
+
     def eval(s, env):
+        """
+        Evaluates the phi-function without knowing the incoming edge, by
+        picking the source most recently bound in the environment. The
+        interpreter in this module does not use it: see 'interp'.
+        """
         first = env.get_first(s.srcs)
         env.set(s.dst, first)
 
 
+class Copy(lang.Inst):
+    """
+    A copy 'dst = src'. Copies are not part of the source language: they are
+    produced when phi-functions are replaced by moves on the edges of the CFG.
+
+    Example:
+        >>> c = Copy("a", "b")
+        >>> e = lang.Env({"b": 3})
+        >>> c.eval(e)
+        >>> e.get("a")
+        3
+    """
+    def __init__(s, dst, src):
+        s.dst = dst
+        s.src = src
+        super().__init__()
+
+    def definition(s):
+        return set([s.dst])
+
+    def uses(s):
+        return set([s.src])
+
+    def eval(s, env):
+        env.set(s.dst, env.get(s.src))
+
+
+def interp(instruction: lang.Inst, environment: lang.Env, title: str):
+    """
+    Evaluates a program in SSA form until there are no more instructions to
+    evaluate. The interpreter remembers the block of the last instruction it
+    evaluated, so that phi-functions select the source that comes from that
+    block. All the phi-functions at the head of a block read their sources
+    before any of them is written.
+
+    The two phi-functions below swap 'a' and 'b' each time the loop runs:
+
+        >>> program = [
+        ...     '{"zero": 0, "one": 1, "two": 2}',
+        ...     'a0 = add zero one',
+        ...     'b0 = add zero two',
+        ...     'i = add zero zero',
+        ...     'i = add i one',
+        ...     'c = lth i two',
+        ...     'bt c 3',
+        ... ]
+        >>> prog, env = parser.build_cfg(program)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> a = PhiFunction('a', [('a', 0), ('a', 1)])
+        >>> b = PhiFunction('b', [('b', 0), ('b', 1)])
+        >>> a.srcs, b.srcs = ['a0', 'b'], ['b0', 'a']
+        >>> bbs[1].instructions[0:0] = [a, b]
+        >>> prog = linearize(bbs)
+        >>> interp(prog[0], env, "swapped")
+        -------- swapped --------
+        c: False
+        i: 2
+        b: 1
+        a: 2
+        c: True
+        i: 1
+        b: 2
+        a: 1
+        i: 0
+        b0: 2
+        a0: 1
+        two: 2
+        one: 1
+        zero: 0
+
+    Programs without phi-functions run before being split into blocks:
+
+        >>> prog, env = parser.build_cfg(['{"one": 1}', 'x = add one one'])
+        >>> interp(prog[0], env, "plain")
+        -------- plain --------
+        x: 2
+        one: 1
+    """
+    pred_block = None
+    while instruction:
+        if type(instruction) is not PhiFunction:
+            instruction.eval(environment)
+            pred_block = getattr(instruction, 'block', None)
+            instruction = instruction.get_next()
+            continue
+        phis = []
+        while type(instruction) is PhiFunction:
+            phis.append(instruction)
+            instruction = instruction.get_next()
+        values = [environment.get(phi.source(pred_block)) for phi in phis]
+        for (phi, value) in zip(phis, values):
+            environment.set(phi.dst, value)
+    print(f'-------- {title} --------')
+    environment.dump()
+
+
+def root_name(var: str) -> str:
+    """
+    Returns the name of the original variable behind an SSA version.
+
+    Example:
+        >>> root_name('count_12'), root_name('count')
+        ('count', 'count')
+    """
+    return var.rsplit('_', 1)[0]
+
+
+def new_version(root: str, taken: Set[str]) -> str:
+    """
+    Returns the next SSA version of variable 'root' not in 'taken'.
+
+    Example:
+        >>> new_version('count', {'count_0', 'count_3', 'counter_7'})
+        'count_4'
+    """
+    latest = -1
+    for var in taken:
+        parts = var.rsplit('_', 1)
+        if parts[0] == root and len(parts) == 2 and parts[1].isdigit():
+            latest = max(latest, int(parts[1]))
+    return f'{root}_{latest+1}'
+
+
+def rename_uses(inst: lang.Inst, names: dict):
+    """
+    Replaces every variable used by 'inst' that is a key of 'names' with the
+    associated value.
+
+    Example:
+        >>> a = lang.Add("a", "b", "c")
+        >>> rename_uses(a, {"b": "x", "a": "y"})
+        >>> (a.dst, a.src0, a.src1)
+        ('a', 'x', 'c')
+    """
+    if type(inst) is PhiFunction:
+        inst.srcs = [names.get(src, src) for src in inst.srcs]
+    elif type(inst) is Copy:
+        inst.src = names.get(inst.src, inst.src)
+    elif type(inst) is lang.Bt:
+        inst.cond = names.get(inst.cond, inst.cond)
+    else:
+        inst.src0 = names.get(inst.src0, inst.src0)
+        inst.src1 = names.get(inst.src1, inst.src1)
+
+
+def rename_definition(inst: lang.Inst, names: dict):
+    """
+    Replaces the variable defined by 'inst', if it is a key of 'names'.
+    """
+    if type(inst) is not lang.Bt:
+        inst.dst = names.get(inst.dst, inst.dst)
+
+
+def linearize(bbs: List[parser.BasicBlock]) -> List[lang.Inst]:
+    """
+    Concatenates basic blocks, in the order given, back into a program.
+    Instructions are re-indexed and re-chained, and the branch that ends a
+    block jumps to the leader of the last block in its NEXTS list. Blocks are
+    renumbered after their position in 'bbs'. The predecessor indices of
+    phi-functions follow the numbering that 'parser.to_basic_blocks' gives to
+    the new program, which is also the numbering seen by the interpreter.
+
+    Example:
+        >>> program = [
+        ...     '{"zero": 0, "one": 1, "true": true}',
+        ...     'a = add zero one',
+        ...     'bt true 3',
+        ...     'a = add a one',
+        ...     'a = add a one',
+        ... ]
+        >>> prog, env = parser.build_cfg(program)
+        >>> bbs = parser.to_basic_blocks(prog)
+        >>> bbs[1].instructions.append(lang.Mul('b', 'a', 'a'))
+        >>> prog = linearize(bbs)
+        >>> [inst.index for inst in prog]
+        [0, 1, 2, 3, 4]
+        >>> prog[1].jump_to
+        4
+        >>> prog[1].NEXTS[0] is prog[4]
+        True
+    """
+    by_index = dict()
+    for bb in bbs:
+        by_index[bb.index] = bb
+    program = []
+    for bb in bbs:
+        program += bb.instructions
+    for i in range(len(program)):
+        inst = program[i]
+        inst.index = i
+        inst.PREVS = []
+        if type(inst) is lang.Bt:
+            inst.NEXTS = [None, None]
+        else:
+            inst.NEXTS = []
+    for i in range(len(program)-1):
+        program[i].add_next(program[i+1])
+        program[i+1].add_prev(program[i])
+    for i in range(len(bbs)):
+        bb = bbs[i]
+        bb.index = i
+        last_inst = bb.instructions[-1]
+        if type(last_inst) is not lang.Bt or len(bb.NEXTS) == 0:
+            continue
+        target = bb.NEXTS[-1].instructions[0]
+        last_inst.jump_to = target.index
+        last_inst.set_true_dst(target)
+        target.add_prev(last_inst)
+    parser.to_basic_blocks(program)
+    for inst in program:
+        if type(inst) is PhiFunction:
+            inst.blocks = [by_index[b].instructions[-1].block
+                           for b in inst.blocks]
+    return program
+
+
+def immediate_dominators(flow_graph: Dict[int, List[int]], root: int) \
+        -> Dict[int, int]:
+    """
+    Computes the immediate dominator of every node reachable from 'root' in
+    a graph given as a map from nodes to their successors, with the algorithm
+    in "A Simple, Fast Dominance Algorithm" (Cooper, Harvey and Kennedy). The
+    root, and nodes that it does not reach, have no immediate dominator.
+
+    Example:
+        >>> flow_graph = {0: [1, 2], 1: [3], 2: [3], 3: [1]}
+        >>> sorted(immediate_dominators(flow_graph, 0).items())
+        [(1, 0), (2, 0), (3, 0)]
+        >>> idoms = immediate_dominators({0: [1], 1: [2], 2: [1], 3: [2]}, 0)
+        >>> sorted(idoms.items())
+        [(1, 0), (2, 1)]
+    """
+    # number the nodes in reverse post-order
+    post_order = []
+    visited = set([root])
+    stack = [(root, iter(flow_graph[root]))]
+    while len(stack) > 0:
+        (node, successors) = stack[-1]
+        nxt = next(successors, None)
+        if nxt is None:
+            stack.pop()
+            post_order.append(node)
+        elif nxt not in visited:
+            visited.add(nxt)
+            stack.append((nxt, iter(flow_graph[nxt])))
+    order = list(reversed(post_order))
+    number = dict()
+    preds = dict()
+    for i in range(len(order)):
+        number[order[i]] = i
+        preds[order[i]] = []
+    for node in order:
+        for nxt in flow_graph[node]:
+            preds[nxt].append(node)
+
+    def intersect(a, b):
+        while a != b:
+            while number[a] > number[b]:
+                a = idom[a]
+            while number[b] > number[a]:
+                b = idom[b]
+        return a
+
+    idom = {root: root}
+    changed = True
+    while changed:
+        changed = False
+        for node in order[1:]:
+            new_idom = None
+            for pred in preds[node]:
+                if pred not in idom:
+                    continue
+                if new_idom is None:
+                    new_idom = pred
+                else:
+                    new_idom = intersect(pred, new_idom)
+            if idom.get(node) != new_idom:
+                idom[node] = new_idom
+                changed = True
+    del idom[root]
+    return idom
+
+
 class DominanceGraph:
     def __init__(s, basic_blocks: List[parser.BasicBlock],
                  env: lang.Env):
@@ -77,47 +391,117 @@ class DominanceGraph:
         paths = [s.path[i] for i in bb_indices]
         j = 0
         min_len = min([len(path) for path in paths])
+        if min_len == 0:
+            return 0
         for j in range(min_len):
             for i in range(1, len(paths)):
                 if paths[i-1][j] != paths[i][j]:
                     return paths[i][j-1]
-        return 0
+        return paths[0][min_len-1]
 
     def compute_dominance_graph(s):
-        # for each child c of current v:
-        # if v is the only parent of c, c dominates v
-        # if v_0, v_1, ... are parents of c, ther earliest common parent
-        # dominates c.
-        parents = [s.bbs[0]]
-        s.path[s.bbs[0].index] = [0]
-        visited = []
-        s.level[0] = 0
-        while True:
-            next_parents = []
-            for parent in parents:
-                if parent.index in visited:
-                    continue
-                visited.append(parent.index)
-                children = parent.NEXTS
-                for child in children:
-                    parents = child.PREVS
-                    s.path[child.index] = \
-                        s.path[parents[0].index] + [child.index]
-                    if len(parents) == 1:
-                        dominator_index = parent.index
-                    else:
-                        parent_indices = [bb.index for bb in parents]
-                        dominator_index = \
-                            s.find_common_ancestor(parent_indices)
-                    s.level[child.index] = s.level[dominator_index]+1
-                    s.immediate_domain[dominator_index].add(child.index)
-                    s.dominators[child.index].add(dominator_index)
-                    next_parents.append(child)
-            if len(visited) == len(s.bbs):
-                break
-            parents = next_parents
+        idoms = immediate_dominators(s.flow_graph(), s.bbs[0].index)
+        for bb in s.bbs:
+            s.immediate_domain[bb.index] = set()
+            s.dominators[bb.index] = set()
+        for (node, idom) in idoms.items():
+            s.immediate_domain[idom].add(node)
+            s.dominators[node].add(idom)
+        s._compute_levels(s.bbs[0].index, 0, [])
         s.dominance_ok = True
 
+    def _compute_levels(s, root: int, level: int, path: List[int]):
+        """
+        Sets the depth, and the path from the root of the dominance tree, of
+        every block in the subtree of 'root'.
+        """
+        stack = [(root, level, path + [root])]
+        while len(stack) > 0:
+            (index, level, path) = stack.pop()
+            s.level[index] = level
+            s.path[index] = path
+            for child in s.immediate_domain[index]:
+                stack.append((child, level+1, path + [child]))
+
+    def immediate_dominator(s, index: int) -> int:
+        """
+        Returns the index of the immediate dominator of a block, or None for
+        the entry block and for unreachable blocks.
+        """
+        s.assert_dominance_ok()
+        if len(s.dominators[index]) == 0:
+            return None
+        return min(s.dominators[index])
+
+    def dominates(s, dominator: int, index: int) -> bool:
+        """
+        Tells if block 'dominator' dominates block 'index'. Every block
+        dominates itself.
+
+            >>> program = [
+            ...     '{"zero": 0, "one": 1, "true": true}',
+            ...     'a = add zero one',
+            ...     'bt true 3',
+            ...     'a = add a one',
+            ...     'a = add a one',
+            ... ]
+            >>> prog, env = parser.build_cfg(program)
+            >>> dg = DominanceGraph(parser.to_basic_blocks(prog), env)
+            >>> dg.compute_dominance_graph()
+            >>> dg.dominates(0, 2), dg.dominates(1, 2), dg.dominates(2, 2)
+            (True, False, True)
+        """
+        while index is not None:
+            if index == dominator:
+                return True
+            index = s.immediate_dominator(index)
+        return False
+
+    def update_dominance_graph(s, root: int):
+        """
+        Recomputes the dominance tree below block 'root', after edges have
+        been added to, or removed from, the CFG. This is enough as long as
+        'root' dominates both ends of every edge that changed, because
+        dominance only changes inside the subtree of such a block. Blocks of
+        the subtree that became unreachable leave the dominance tree.
+
+            >>> program = [
+            ...     '{"zero": 0, "one": 1, "true": true}',
+            ...     'a = add zero one',
+            ...     'bt true 4',
+            ...     'a = add a one',
+            ...     'bt true 5',
+            ...     'a = add a one',
+            ...     'a = add a one',
+            ... ]
+            >>> prog, env = parser.build_cfg(program)
+            >>> bbs = parser.to_basic_blocks(prog)
+            >>> dg = DominanceGraph(bbs, env)
+            >>> dg.compute_dominance_graph()
+            >>> dg.dominance_graph()
+            {0: {1, 2, 3}, 1: set(), 2: set(), 3: set()}
+            >>> bbs[2].NEXTS.remove(bbs[3])
+            >>> bbs[3].PREVS.remove(bbs[2])
+            >>> dg.update_dominance_graph(0)
+            >>> dg.dominance_graph()
+            {0: {1, 2}, 1: {3}, 3: set(), 2: set()}
+        """
+        s.assert_dominance_ok()
+        subtree = s.dominance_graph(root)
+        flow_graph = dict()
+        for index in subtree.keys():
+            flow_graph[index] = [nxt for nxt in s.get_NEXTS_indices(index)
+                                 if nxt in subtree]
+        idoms = immediate_dominators(flow_graph, root)
+        for index in subtree.keys():
+            s.immediate_domain[index] = set()
+            if index != root:
+                s.dominators[index] = set()
+        for (node, idom) in idoms.items():
+            s.immediate_domain[idom].add(node)
+            s.dominators[node].add(idom)
+        s._compute_levels(root, s.level[root], s.path[root][:-1])
+
     def update_env(s):
         newEnv = lang.Env()
         for var in s.env.definitions():
@@ -157,13 +541,22 @@ class DominanceGraph:
             inst.dst = f'{var}_{top}'
 
         def find_latest(root_var, block_index):
-            bb = s.bbs[block_index]
-            latest = 0
-            for definition in bb.definitions():
-                root, var_index = definition.split('_')
-                if root == root_var and int(var_index) > int(latest):
-                    latest = var_index
-            return f'{root_var}_{latest}'
+            # The version that leaves a block is its last definition of the
+            # variable, or, if the block does not define it, the version that
+            # leaves its immediate dominator.
+            while True:
+                bb = s.bbs[block_index]
+                latest = None
+                for definition in bb.definitions():
+                    root, var_index = definition.rsplit('_', 1)
+                    if root == root_var and \
+                            (latest is None or int(var_index) > int(latest)):
+                        latest = var_index
+                if latest is not None:
+                    return f'{root_var}_{latest}'
+                if len(s.dominators[block_index]) == 0:
+                    return f'{root_var}_0'
+                block_index = min(s.dominators[block_index])
 
         s.update_env()
         for inst in s.prog:
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import sys
 import parser
-from ssa_form import PhiFunction
+from ssa_form import PhiFunction, Copy
 from solution import to_ssa
 
 
@@ -9,9 +9,10 @@ def print_program(program):
     for inst in program:
         print(inst.index, end=': ')
         if type(inst) is PhiFunction:
-            srcs = inst.srcs
-            srcs.sort()
+            srcs = sorted(inst.srcs)
             print(f'{inst.dst} = phi({srcs})')
+        elif type(inst) is Copy:
+            print(f'{inst.dst} = {inst.src}')
         else:
             op = parser.rev_match_instruction[type(inst)]
             if op == 'bt':
@@ -13,4 +13,4 @@ origprog, origenv = getprog("big_branch")
 parser.interp(origprog[0], origenv, "solution in original form")
 prog, env = getprog("big_branch")
 sol, solenv = solution.to_ssa(prog, env)
-parser.interp(sol[0], solenv, "solution in ssa_form")
+ssa_form.interp(sol[0], solenv, "solution in ssa_form")
@@ -0,0 +1,275 @@
+"""
+A compact representation of programs.
+
+Each lang.Inst carries a dictionary of attributes, two lists of neighbors
+and its operands as strings, so a program with millions of instructions
+takes hundreds of megabytes. A CompactProgram keeps the same program in
+columns, one 'array' of integers per field, indexed by instruction:
+
+- opcode: the position of the class of the instruction in OPCODES;
+- dst, src0, src1: the operands, interned into the list 'names', or -1. A
+  branch keeps its condition in src0, and the index it jumps to in dst;
+- next0, next1: the entries of NEXTS, or -1 where there is none (None, in
+  a branch);
+- pred_start, pred: the PREVS of each instruction, in compressed sparse
+  rows: the predecessors of i go from pred[pred_start[i]] to
+  pred[pred_start[i + 1] - 1].
+
+Reading an instruction returns an InstView, a small object, with slots
+instead of a dictionary, that reads the columns. Views have the index,
+NEXTS, PREVS, definition() and uses() of instructions, which is what the
+solvers of 'static_analysis' use, so Liveness, ReachingDefinitions and
+LazyConstraints run on compact programs as they are. Code that tells
+instructions apart by their classes, such as IntervalAnalysis or the
+expression analyses, needs the instructions themselves, which 'to_program'
+rebuilds.
+"""
+import json
+import lang
+from array import array
+from parser import is_bt, parse_binop, parse_bt, match_instruction
+from typing import Dict, List, Optional
+
+OPCODES = [lang.Add, lang.Mul, lang.Lth, lang.Geq, lang.Bt]
+BT = OPCODES.index(lang.Bt)
+
+COLUMNS = ['opcode', 'dst', 'src0', 'src1', 'next0', 'next1', 'pred_start',
+           'pred']
+
+
+def _intern(name_ids: Dict[str, int], name: str) -> int:
+    """
+    Returns the number of 'name', numbering names in the order they appear.
+    """
+    return name_ids.setdefault(name, len(name_ids))
+
+
+class InstView:
+    """
+    The instruction at position 'index' of a compact program. Views are
+    created when instructions are read, so two views of the same instruction
+    are equal, but not the same object.
+    """
+    __slots__ = ['program', 'index']
+
+    def __init__(s, program: 'CompactProgram', index: int):
+        s.program = program
+        s.index = index
+
+    def _name(s, column: array) -> Optional[str]:
+        name = column[s.index]
+        return None if name < 0 else s.program.names[name]
+
+    @property
+    def kind(s) -> type:
+        """
+        The class of the instruction, e.g., lang.Add.
+        """
+        return OPCODES[s.program.opcode[s.index]]
+
+    @property
+    def dst(s) -> Optional[str]:
+        return None if s.kind is lang.Bt else s._name(s.program.dst)
+
+    @property
+    def src0(s) -> Optional[str]:
+        return s._name(s.program.src0)
+
+    @property
+    def src1(s) -> Optional[str]:
+        return s._name(s.program.src1)
+
+    @property
+    def cond(s) -> Optional[str]:
+        return s._name(s.program.src0) if s.kind is lang.Bt else None
+
+    @property
+    def jump_to(s) -> Optional[int]:
+        return s.program.dst[s.index] if s.kind is lang.Bt else None
+
+    @property
+    def NEXTS(s) -> List[Optional['InstView']]:
+        nexts = [s.program.next0[s.index], s.program.next1[s.index]]
+        if s.kind is lang.Bt:
+            return [None if i < 0 else s.program[i] for i in nexts]
+        return [s.program[i] for i in nexts if i >= 0]
+
+    @property
+    def PREVS(s) -> List['InstView']:
+        p = s.program
+        return [p[p.pred[k]]
+                for k in range(p.pred_start[s.index],
+                               p.pred_start[s.index + 1])]
+
+    def definition(s) -> set:
+        return set() if s.kind is lang.Bt else set([s.dst])
+
+    def uses(s) -> set:
+        if s.kind is lang.Bt:
+            return set([s.cond])
+        return set([s.src0, s.src1])
+
+    def __eq__(s, o) -> bool:
+        return type(o) is InstView and s.program is o.program and \
+            s.index == o.index
+
+    def __hash__(s) -> int:
+        return hash((id(s.program), s.index))
+
+
+class CompactProgram:
+    """
+    A program kept in columns of integers.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> lines = [
+        ...     '{"a": 1, "b": 2, "t": true}',
+        ...     'x = add a b',
+        ...     'bt t 3',
+        ...     'x = mul x a',
+        ...     'y = lth x b',
+        ... ]
+        >>> compact, env = build_compact_cfg(lines)
+        >>> len(compact), compact.names
+        (4, ['x', 'a', 'b', 't', 'y'])
+        >>> list(compact.next0), list(compact.next1), list(compact.pred)
+        ([1, 3, 3, -1], [-1, 2, -1, -1], [0, 1, 2, 1])
+        >>> inst = compact[3]
+        >>> inst.kind is lang.Lth, inst.dst, inst.uses() == {'x', 'b'}
+        (True, 'y', True)
+        >>> [prev.index for prev in inst.PREVS], compact[1].jump_to
+        ([2, 1], 3)
+
+    The solvers of 'static_analysis' take compact programs:
+
+        >>> from static_analysis import Liveness, ReachingDefinitions
+        >>> program, env = build_cfg(lines)
+        >>> Liveness.run(compact, env) == Liveness.run(program, env)
+        True
+        >>> reaching = ReachingDefinitions.run(compact, env)
+        >>> reaching == ReachingDefinitions.run(program, env)
+        True
+
+    The instructions can be rebuilt from the columns, and back:
+
+        >>> rebuilt = compact.to_program()
+        >>> [type(inst).__name__ for inst in rebuilt]
+        ['Add', 'Bt', 'Mul', 'Lth']
+        >>> rebuilt[1].NEXTS == [rebuilt[3], rebuilt[2]]
+        True
+        >>> again = CompactProgram.from_program(rebuilt)
+        >>> all([list(getattr(again, name)) == list(getattr(compact, name))
+        ...      for name in COLUMNS])
+        True
+    """
+    def __init__(s, names: List[str], columns: Dict[str, array]):
+        s.names = names
+        for name in COLUMNS:
+            setattr(s, name, columns[name])
+
+    @classmethod
+    def from_program(cls, program: List[lang.Inst]) -> 'CompactProgram':
+        """
+        Packs the instructions of a program into columns.
+        """
+        name_ids: Dict[str, int] = dict()
+        columns = dict([(name, array('i')) for name in COLUMNS])
+        columns['opcode'] = array('b')
+        columns['pred_start'].append(0)
+        for inst in program:
+            columns['opcode'].append(OPCODES.index(type(inst)))
+            if type(inst) is lang.Bt:
+                (dst, src0, src1) = (inst.jump_to,
+                                     _intern(name_ids, inst.cond), -1)
+            else:
+                (dst, src0, src1) = [_intern(name_ids, name) for name in
+                                     [inst.dst, inst.src0, inst.src1]]
+            columns['dst'].append(dst)
+            columns['src0'].append(src0)
+            columns['src1'].append(src1)
+            nexts = [-1 if nxt is None else nxt.index for nxt in inst.NEXTS]
+            nexts += [-1] * (2 - len(nexts))
+            columns['next0'].append(nexts[0])
+            columns['next1'].append(nexts[1])
+            columns['pred'].extend([prev.index for prev in inst.PREVS])
+            columns['pred_start'].append(len(columns['pred']))
+        return cls(list(name_ids), columns)
+
+    def __len__(s) -> int:
+        return len(s.opcode)
+
+    def __getitem__(s, index: int) -> InstView:
+        return InstView(s, range(len(s.opcode))[index])
+
+    def __iter__(s):
+        return (InstView(s, i) for i in range(len(s.opcode)))
+
+    def to_program(s) -> List[lang.Inst]:
+        """
+        Rebuilds the instructions of the program, linked as the columns say.
+        """
+        program = []
+        for view in s:
+            if view.kind is lang.Bt:
+                inst = lang.Bt(view.cond)
+                inst.jump_to = view.jump_to
+            else:
+                inst = view.kind(view.dst, view.src0, view.src1)
+            inst.index = view.index
+            program.append(inst)
+        for inst in program:
+            nexts = [s.next0[inst.index], s.next1[inst.index]]
+            if type(inst) is lang.Bt:
+                inst.NEXTS = [None if i < 0 else program[i] for i in nexts]
+            else:
+                inst.NEXTS = [program[i] for i in nexts if i >= 0]
+            inst.PREVS = [program[s.pred[k]]
+                          for k in range(s.pred_start[inst.index],
+                                         s.pred_start[inst.index + 1])]
+        return program
+
+
+def build_compact_cfg(lines: List[str]) -> (CompactProgram, lang.Env):
+    """
+    Parses a program into columns, like parser.build_cfg, but without
+    creating its instructions.
+    """
+    program = lines[1:]
+    name_ids: Dict[str, int] = dict()
+    columns = dict([(name, array('i')) for name in COLUMNS])
+    columns['opcode'] = array('b')
+    jumps = dict()
+    for (i, line) in enumerate(program):
+        if is_bt(line):
+            (cond, jump_to) = parse_bt(line)
+            (opcode, dst, src0, src1) = (BT, jump_to,
+                                         _intern(name_ids, cond), -1)
+            jumps.setdefault(jump_to, []).append(i)
+        else:
+            (dst, opcode, src0, src1) = parse_binop(line)
+            opcode = OPCODES.index(match_instruction[opcode])
+            (dst, src0, src1) = [_intern(name_ids, name)
+                                 for name in [dst, src0, src1]]
+        columns['opcode'].append(opcode)
+        columns['dst'].append(dst)
+        columns['src0'].append(src0)
+        columns['src1'].append(src1)
+    # each instruction falls through into the next one, and a branch also
+    # jumps to its target, which build_cfg links after the fall-throughs
+    for i in range(len(program)):
+        fall = i + 1 if i + 1 < len(program) else -1
+        if columns['opcode'][i] == BT:
+            columns['next0'].append(columns['dst'][i])
+            columns['next1'].append(fall)
+        else:
+            columns['next0'].append(fall)
+            columns['next1'].append(-1)
+    columns['pred_start'].append(0)
+    for i in range(len(program)):
+        columns['pred'].extend(([i - 1] if i > 0 else []) + jumps.get(i, []))
+        columns['pred_start'].append(len(columns['pred']))
+    environment = lang.Env()
+    for (k, v) in json.loads(lines[0]).items():
+        environment.set(k, v)
+    return (CompactProgram(list(name_ids), columns), environment)
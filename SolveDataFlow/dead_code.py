@@ -0,0 +1,122 @@
+"""
+Dead code elimination.
+
+An instruction 'v = E' is dead if 'v' is not alive right after it: no path
+from that point reads the value that the instruction produces. Removing a
+dead instruction can kill the instructions that computed its operands, so the
+pass runs the liveness analysis again, until no instruction is removed.
+
+A program ends when it falls off its last instruction; the variables that the
+caller reads afterwards must be given as 'observable'. Branches are never
+removed, and keep their conditions alive.
+"""
+import lang
+from static_analysis import Liveness
+from typing import List, Set
+
+
+def relink(program: List[lang.Inst]) -> List[lang.Inst]:
+    """
+    Re-indexes and re-chains a program after instructions have been removed
+    from it. The true successor of each branch must be an instruction of the
+    original program: if it was removed, the branch jumps to the first
+    instruction that follows it and remains; if none remains, the branch
+    leaves the program.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"t": true, "x": 1}',
+        ...     'bt t 2',
+        ...     'a = add x x',
+        ...     'b = add x x',
+        ...     'c = add x x',
+        ... ])
+        >>> program = relink([program[0], program[3]])
+        >>> [inst.index for inst in program], program[0].jump_to
+        ([0, 1], 1)
+        >>> program[0].NEXTS == [program[1], program[1]]
+        True
+    """
+    kept = set([id(inst) for inst in program])
+    targets = []
+    for inst in program:
+        if type(inst) is not lang.Bt:
+            targets.append(None)
+            continue
+        target = inst.NEXTS[0]
+        while target is not None and id(target) not in kept:
+            target = target.NEXTS[-1] if type(target) is lang.Bt \
+                else target.get_next()
+        targets.append(target)
+    for i in range(len(program)):
+        inst = program[i]
+        inst.index = i
+        inst.PREVS = []
+        inst.NEXTS = [None, None] if type(inst) is lang.Bt else []
+    for i in range(len(program)-1):
+        program[i].add_next(program[i+1])
+        program[i+1].add_prev(program[i])
+    for (inst, target) in zip(program, targets):
+        if type(inst) is not lang.Bt:
+            continue
+        inst.set_true_dst(target)
+        if target is None:
+            inst.jump_to = len(program)
+        else:
+            inst.jump_to = target.index
+            target.add_prev(inst)
+    return program
+
+
+def _live_variables(program: List[lang.Inst], env: lang.Env,
+                    observable: Set[str]) -> List[Set[str]]:
+    """
+    Returns the variables alive after each instruction of the program.
+    """
+    result = Liveness.with_exit(observable).run(program, env)
+    return [result.get_out(inst.index) for inst in program]
+
+
+def eliminate_dead_code(program: List[lang.Inst], env: lang.Env,
+                        observable: Set[str] = set()) -> List[lang.Inst]:
+    """
+    Removes the instructions whose results are never used, and returns the
+    program that remains. The instructions are updated in place.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"zero": 0, "one": 1, "five": 5}',
+        ...     'count = add zero one',
+        ...     'sum = add zero zero',
+        ...     'sum = add sum count',
+        ...     'count = add count one',
+        ...     'repeat = geq five count',
+        ...     'bt repeat 2',
+        ...     'tmp = add sum one',
+        ...     'avg = mul tmp one',
+        ...     'end = add zero zero',
+        ... ])
+        >>> program = eliminate_dead_code(program, env, {'sum'})
+        >>> [sorted(inst.definition()) for inst in program]
+        [['count'], ['sum'], ['sum'], ['count'], ['repeat'], []]
+        >>> program[5].jump_to, program[5].NEXTS[0] is program[2]
+        (2, True)
+
+    The first round removes 'avg' and 'end'; 'tmp' only dies in the second
+    round, once 'avg' is gone. Values that only feed each other around a
+    loop keep each other alive:
+
+        >>> program = eliminate_dead_code(program, env)
+        >>> len(program)
+        6
+    """
+    while len(program) > 0:
+        live = _live_variables(program, env, observable)
+        remaining = [inst for (inst, out) in zip(program, live)
+                     if not inst.definition() or inst.definition() & out]
+        if len(remaining) == len(program):
+            break
+        program = relink(remaining)
+    return program
@@ -0,0 +1,212 @@
+"""
+Def-use and use-def chains.
+
+The result of the ReachingDefinitions analysis tells which definitions reach
+each instruction, as sets of pairs (index, variable). Finding which
+definitions reach one use, or which uses one definition feeds, means scanning
+these sets. This module builds, once, an index of the chains of a program,
+that answers both questions in time proportional to the size of the answer.
+
+Definitions and uses are sites: pairs (index, variable), where the variables
+of the environment are defined at index -1. Sites are numbered in program
+order, and variables are interned into integers. The chains are kept in
+compressed sparse rows (CSR): the chains of site i are the entries of a flat
+array from start[i] to start[i + 1]. Every array is an 'array' of integers,
+so the index takes memory proportional to the number of sites and chains,
+and can be saved to, and loaded from, a JSON file.
+"""
+import json
+import lang
+from array import array
+from static_analysis import ConstraintEnv, ReachingDefinitions
+from typing import Dict, List, Optional, Tuple
+
+Site = Tuple[int, str]
+
+ARRAYS = ['def_start', 'def_var', 'def_index', 'use_start', 'use_var',
+          'use_index', 'ud_start', 'ud', 'du_start', 'du']
+
+
+def _csr(rows: List[List[int]]) -> (array, array):
+    """
+    Packs a list of rows into an array of offsets and an array of entries.
+
+    Example:
+        >>> start, entries = _csr([[4, 2], [], [7]])
+        >>> list(start), list(entries)
+        ([0, 2, 2, 3], [4, 2, 7])
+    """
+    start = array('l', [0])
+    entries = array('l')
+    for row in rows:
+        entries.extend(row)
+        start.append(len(entries))
+    return start, entries
+
+
+class DefUseChains:
+    """
+    An index of the def-use and use-def chains of a program.
+
+    - def_start[i + 1] .. def_start[i + 2] are the definitions of
+      instruction i (i = -1 for the environment); def_var and def_index
+      hold the variable and the instruction of each definition;
+    - use_start[i] .. use_start[i + 1] are the uses of instruction i;
+      use_var and use_index hold the variable and the instruction of each
+      use;
+    - ud_start and ud map each use to the definitions that reach it;
+    - du_start and du map each definition to the uses that it reaches.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"a": 1, "b": 2, "t": true}',
+        ...     'x = add a b',
+        ...     'bt t 3',
+        ...     'x = add x a',
+        ...     'y = add x b',
+        ... ])
+        >>> chains = DefUseChains.build(program, env)
+        >>> chains.use_def(3, 'x')
+        [(0, 'x'), (2, 'x')]
+        >>> chains.def_use(0, 'x')
+        [(2, 'x'), (3, 'x')]
+        >>> chains.def_use(-1, 'a'), len(chains)
+        ([(0, 'a'), (2, 'a')], 8)
+        >>> chains.use_def(3, 'y'), chains.def_use(3, 'y')
+        ([], [])
+    """
+    def __init__(s, variables: List[str], arrays: Dict[str, array]):
+        s.variables = variables
+        s.var_ids = dict([(var, i) for (i, var) in enumerate(variables)])
+        for name in ARRAYS:
+            setattr(s, name, arrays[name])
+
+    @classmethod
+    def build(cls, program: List[lang.Inst], env: lang.Env,
+              result: Optional[ConstraintEnv] = None) -> 'DefUseChains':
+        """
+        Builds the index of a program from its reaching definitions, which
+        are computed if 'result' is not given.
+        """
+        if result is None:
+            result = ReachingDefinitions.run(program, env)
+        variables = set(env.definitions())
+        for inst in program:
+            variables |= inst.definition() | inst.uses()
+        variables = sorted(variables)
+        var_ids = dict([(var, i) for (i, var) in enumerate(variables)])
+        # definitions, in program order
+        def_ids = dict()
+        def_rows = [sorted(env.definitions())] + \
+            [sorted(inst.definition()) for inst in program]
+        for (i, row) in enumerate(def_rows):
+            for var in row:
+                def_ids[(i - 1, var)] = len(def_ids)
+        def_start, def_var = _csr([[var_ids[var] for var in row]
+                                   for row in def_rows])
+        def_index = array('l', [i - 1 for (i, row) in enumerate(def_rows)
+                                for var in row])
+        # uses, and the definitions that reach each one of them
+        use_rows = [sorted(inst.uses()) for inst in program]
+        use_start, use_var = _csr([[var_ids[var] for var in row]
+                                   for row in use_rows])
+        use_index = array('l', [i for (i, row) in enumerate(use_rows)
+                                for var in row])
+        ud_rows = []
+        for inst in program:
+            reaching = dict()
+            for (index, var) in result.get_in(inst.index):
+                reaching.setdefault(var, []).append(def_ids[(index, var)])
+            for var in use_rows[inst.index]:
+                ud_rows.append(sorted(reaching.get(var, [])))
+        ud_start, ud = _csr(ud_rows)
+        # the def-use chains are the use-def chains, transposed
+        du_rows = [[] for site in def_ids]
+        for (use, row) in enumerate(ud_rows):
+            for definition in row:
+                du_rows[definition].append(use)
+        du_start, du = _csr(du_rows)
+        return cls(variables, {
+            'def_start': def_start, 'def_var': def_var,
+            'def_index': def_index, 'use_start': use_start,
+            'use_var': use_var, 'use_index': use_index,
+            'ud_start': ud_start, 'ud': ud,
+            'du_start': du_start, 'du': du})
+
+    def __len__(s) -> int:
+        return len(s.ud)
+
+    def _find(s, start: array, sites: array, index: int, var: str) -> int:
+        """
+        Returns the number of the site of 'var' at 'index', or -1.
+        """
+        var_id = s.var_ids.get(var, -1)
+        if index < 0 or index + 1 >= len(start):
+            return -1
+        for site in range(start[index], start[index + 1]):
+            if sites[site] == var_id:
+                return site
+        return -1
+
+    def _def_site(s, site: int) -> Site:
+        return (s.def_index[site], s.variables[s.def_var[site]])
+
+    def _use_site(s, site: int) -> Site:
+        return (s.use_index[site], s.variables[s.use_var[site]])
+
+    def use_def(s, index: int, var: str) -> List[Site]:
+        """
+        Returns the definitions that reach the use of 'var' at instruction
+        'index'.
+        """
+        use = s._find(s.use_start, s.use_var, index, var)
+        if use < 0:
+            return []
+        return [s._def_site(s.ud[i])
+                for i in range(s.ud_start[use], s.ud_start[use + 1])]
+
+    def def_use(s, index: int, var: str) -> List[Site]:
+        """
+        Returns the uses reached by the definition of 'var' at instruction
+        'index', or in the environment, if 'index' is -1.
+        """
+        definition = s._find(s.def_start, s.def_var, index + 1, var)
+        if definition < 0:
+            return []
+        return [s._use_site(s.du[i]) for i in
+                range(s.du_start[definition], s.du_start[definition + 1])]
+
+    def save(s, file_name: str):
+        """
+        Writes the index to a JSON file.
+
+        Example:
+            >>> import os, tempfile
+            >>> from parser import build_cfg
+            >>> program, env = build_cfg([
+            ...     '{"a": 1}',
+            ...     'x = add a a',
+            ...     'y = add x a',
+            ... ])
+            >>> chains = DefUseChains.build(program, env)
+            >>> file_name = os.path.join(tempfile.mkdtemp(), 'chains.json')
+            >>> chains.save(file_name)
+            >>> loaded = DefUseChains.load(file_name)
+            >>> loaded.def_use(-1, 'a'), loaded.use_def(1, 'x')
+            ([(0, 'a'), (1, 'a')], [(0, 'x')])
+        """
+        data = dict([(name, getattr(s, name).tolist()) for name in ARRAYS])
+        data['variables'] = s.variables
+        with open(file_name, 'w') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, file_name: str) -> 'DefUseChains':
+        """
+        Reads an index written by 'save'.
+        """
+        with open(file_name) as f:
+            data = json.load(f)
+        return cls(data['variables'], dict([(name, array('l', data[name]))
+                                            for name in ARRAYS]))
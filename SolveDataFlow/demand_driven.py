@@ -0,0 +1,151 @@
+"""
+Demand-driven liveness and reaching definitions.
+
+The data-flow analyses of 'static_analysis' solve every program point for
+every variable at once. When only a few questions matter, such as "is 'v'
+alive before instruction 'i'?", it is cheaper to answer each one with a
+search on the control flow graph, starting from the point in question:
+
+- 'v' is alive before 'i' if a path from 'i' reads 'v' before redefining it,
+  or reaches the end of the program, when 'v' is observable there. The
+  search follows the successors of 'i', and stops at definitions of 'v'.
+- The definitions of 'v' that reach 'i' are the first definitions of 'v'
+  found going back from 'i'. The search follows the predecessors of 'i', and
+  stops at definitions of 'v'. The environment defines its variables before
+  the first instruction, at index -1.
+
+Answers are memoized across queries. A liveness search that fails proves
+that 'v' is dead before every instruction that it visited, and a search that
+succeeds proves that 'v' is alive along the path that found the use. A
+reaching definitions search reuses the answers of earlier queries about the
+same variable, instead of going through their instructions again.
+"""
+import lang
+from typing import Dict, List, Set, Tuple
+
+
+class DemandDrivenAnalysis:
+    """
+    Answers liveness and reaching definitions queries about a program.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"a": 1, "b": 2, "t": true}',
+        ...     'x = add a b',
+        ...     'bt t 3',
+        ...     'a = add x x',
+        ...     'y = add x a',
+        ... ])
+        >>> queries = DemandDrivenAnalysis(program, env, {'y'})
+        >>> queries.is_live('a', 1), queries.is_live('a', 2)
+        (True, False)
+        >>> queries.is_live('b', 1), queries.is_live_out('y', 3)
+        (False, True)
+        >>> sorted(queries.reaching('a', 3))
+        [(-1, 'a'), (2, 'a')]
+        >>> sorted(queries.reaching('x', 3)), queries.reaching('y', 0)
+        ([(0, 'x')], set())
+
+    The answers agree with the analyses of the whole program:
+
+        >>> from static_analysis import Liveness, ReachingDefinitions
+        >>> live = Liveness.with_exit({'y'}).run(program, env)
+        >>> all([(var in live.get(f'IN_{i}')) == queries.is_live(var, i)
+        ...      for i in range(4) for var in 'abtxy'])
+        True
+        >>> reach = ReachingDefinitions.run(program, env)
+        >>> all([queries.reaching(var, i) ==
+        ...      set([d for d in reach.get(f'IN_{i}') if d[1] == var])
+        ...      for i in range(4) for var in 'abtxy'])
+        True
+    """
+    def __init__(s, program: List[lang.Inst], env: lang.Env,
+                 live_at_exit: Set[str] = set()):
+        s.program = program
+        s.env = env
+        s.live_at_exit = live_at_exit
+        s.live: Dict[str, Dict[int, bool]] = dict()
+        s.reach: Dict[Tuple[str, int], Set[Tuple[int, str]]] = dict()
+
+    def _ends(s, inst: lang.Inst) -> bool:
+        """
+        Tells if the program may end right after 'inst'.
+        """
+        nexts = [nxt for nxt in inst.NEXTS if nxt is not None]
+        return len(nexts) < len(inst.NEXTS) or len(nexts) == 0
+
+    def is_live(s, var: str, index: int) -> bool:
+        """
+        Tells if 'var' is alive right before the instruction 'index'.
+        """
+        known = s.live.setdefault(var, dict())
+        if index in known:
+            return known[index]
+        parent = {index: None}
+        worklist = [index]
+        found = None
+        while len(worklist) > 0 and found is None:
+            i = worklist.pop()
+            inst = s.program[i]
+            if var in inst.uses():
+                found = i
+                break
+            if var in inst.definition():
+                continue
+            if s._ends(inst) and var in s.live_at_exit:
+                found = i
+                break
+            for nxt in inst.NEXTS:
+                if nxt is None or nxt.index in parent:
+                    continue
+                parent[nxt.index] = i
+                if known.get(nxt.index) is True:
+                    found = nxt.index
+                    break
+                if nxt.index not in known:
+                    worklist.append(nxt.index)
+        if found is None:
+            for i in parent:
+                known[i] = False
+            return False
+        while found is not None:
+            known[found] = True
+            found = parent[found]
+        return True
+
+    def is_live_out(s, var: str, index: int) -> bool:
+        """
+        Tells if 'var' is alive right after the instruction 'index'.
+        """
+        inst = s.program[index]
+        if s._ends(inst) and var in s.live_at_exit:
+            return True
+        return any([s.is_live(var, nxt.index)
+                    for nxt in inst.NEXTS if nxt is not None])
+
+    def reaching(s, var: str, index: int) -> Set[Tuple[int, str]]:
+        """
+        Returns the definitions of 'var' that reach the instruction 'index',
+        as pairs (index, var).
+        """
+        if (var, index) in s.reach:
+            return s.reach[(var, index)]
+        found = set()
+        visited = set([index])
+        worklist = [index]
+        while len(worklist) > 0:
+            i = worklist.pop()
+            if i != index and (var, i) in s.reach:
+                found |= s.reach[(var, i)]
+                continue
+            if i == 0 and var in s.env.definitions():
+                found.add((-1, var))
+            for prev in s.program[i].PREVS:
+                if var in prev.definition():
+                    found.add((prev.index, var))
+                elif prev.index not in visited:
+                    visited.add(prev.index)
+                    worklist.append(prev.index)
+        s.reach[(var, index)] = found
+        return found
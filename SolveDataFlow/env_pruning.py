@@ -0,0 +1,117 @@
+"""
+Liveness-driven pruning of the environment.
+
+The interpreter keeps every binding that the program ever makes, so the
+environment grows with the number of instructions executed. This module
+provides an interpreter that drops the bindings of variables as soon as they
+are dead, so that the environment only holds the variables that may still be
+read. The dead variables of each instruction are computed once, before the
+program runs, from the Liveness analysis:
+
+- dead before an instruction: variables alive after some predecessor, but
+  not alive at the entry of the instruction, as control flow may have taken
+  another edge;
+- dead after an instruction: variables alive at its entry, or defined by it,
+  that are not alive at its exit.
+
+Variables in 'observable' keep their final values. The full history of
+bindings can still be kept for debugging.
+"""
+import lang
+from static_analysis import Liveness
+from typing import List, Set
+
+
+def dead_variables(program: List[lang.Inst], env: lang.Env,
+                   observable: Set[str] = set()) -> \
+        (List[Set[str]], List[Set[str]]):
+    """
+    Returns, for each instruction, the variables that are dead before and
+    after it runs. The variables of the environment that are dead at the
+    start of the program are dead before the first instruction.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"a": 1, "b": 2, "c": 3}',
+        ...     'x = add a b',
+        ...     'bt x 3',
+        ...     'y = add x a',
+        ...     'z = add x x',
+        ... ])
+        >>> before, after = dead_variables(program, env, {'z'})
+        >>> [sorted(d) for d in before]
+        [['c'], [], [], ['a']]
+        >>> [sorted(d) for d in after]
+        [['b'], [], ['a', 'y'], ['x']]
+
+    'a' is still alive after the branch, because 'y' reads it, but it is
+    dead if the branch jumps to 'z'.
+    """
+    result = Liveness.with_exit(observable).run(program, env)
+    before = []
+    after = []
+    for inst in program:
+        _in = result.get_in(inst.index)
+        out = result.get_out(inst.index)
+        arriving = set()
+        for prev in inst.PREVS:
+            arriving |= result.get_out(prev.index)
+        if inst.index == 0:
+            arriving |= env.definitions()
+        before.append(arriving - _in)
+        after.append((_in | inst.definition()) - out)
+    return before, after
+
+
+def interp_pruned(program: List[lang.Inst], env: lang.Env,
+                  observable: Set[str] = set(),
+                  history: bool = False) -> lang.Env:
+    """
+    Interprets a program, and returns its final environment. Unless
+    'history' is set, the environment only keeps the variables that are
+    alive, with their current values.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> lines = [
+        ...     '{"zero": 0, "one": 1, "three": 3, "iter": 9}',
+        ...     'count = add zero three',
+        ...     'pred = add zero one',
+        ...     'fib = add zero one',
+        ...     'aux = add zero fib',
+        ...     'fib = add pred fib',
+        ...     'pred = add zero aux',
+        ...     'count = add count one',
+        ...     'repeat = geq iter count',
+        ...     'bt repeat 3',
+        ...     'end = add zero zero',
+        ... ]
+        >>> program, env = build_cfg(lines)
+        >>> env = interp_pruned(program, env, {'fib'})
+        >>> env.bindings()
+        [('fib', 34)]
+        >>> program, env = build_cfg(lines)
+        >>> env = interp_pruned(program, env, {'fib'}, history=True)
+        >>> len(env.bindings()), env.get('fib')
+        (43, 34)
+    """
+    if history:
+        inst = program[0] if len(program) > 0 else None
+        while inst is not None:
+            inst.eval(env)
+            inst = inst.get_next()
+        return env
+    before, after = dead_variables(program, env, observable)
+    pruned = lang.Env(history=False)
+    for var in env.definitions():
+        pruned.set(var, env.get(var))
+    inst = program[0] if len(program) > 0 else None
+    while inst is not None:
+        for var in before[inst.index]:
+            pruned.remove(var)
+        inst.eval(pruned)
+        for var in after[inst.index]:
+            pruned.remove(var)
+        inst = inst.get_next()
+    return pruned
@@ -0,0 +1,240 @@
+"""
+Available expressions and very busy expressions.
+
+Both analyses track the expressions 'a op b' computed by the binary
+operations of a program:
+
+- an expression is available at a point if every path from the start of the
+  program to that point computes it, and none of its operands is redefined
+  afterwards (forward, must);
+- an expression is very busy at a point if every path from that point to the
+  end of the program computes it before any of its operands is redefined
+  (backward, must).
+
+Because 'add' and 'mul' are commutative, their operands are sorted, so that
+'a + b' and 'b + a' are the same expression. Each expression of the program
+is interned into a bit position, so sets of expressions are integers, and
+meets and transfer functions are bitwise operations. Both analyses are
+"must" analyses: their meet is the intersection, and every point except the
+boundary starts with the set of all expressions.
+"""
+import lang
+from parser import rev_match_instruction
+from static_analysis import ConstraintEnv, DataFlowAnalysis
+from typing import Dict, List, Optional, Type
+
+COMMUTATIVE = [lang.Add, lang.Mul]
+
+
+def expression(instruction: lang.Inst) -> Optional[tuple]:
+    """
+    Returns the expression computed by a binary operation, or None for other
+    instructions.
+
+    Example:
+        >>> expression(lang.Add('x', 'b', 'a'))
+        ('add', 'a', 'b')
+        >>> expression(lang.Lth('x', 'b', 'a'))
+        ('lth', 'b', 'a')
+    """
+    if not isinstance(instruction, lang.BinOp):
+        return None
+    operands = [instruction.src0, instruction.src1]
+    if type(instruction) in COMMUTATIVE:
+        operands.sort()
+    return (rev_match_instruction[type(instruction)], *operands)
+
+
+class ExpressionTable:
+    """
+    Interns the expressions of a program into bit positions.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"a": 1, "b": 2}',
+        ...     'x = add a b',
+        ...     'y = mul x a',
+        ...     'z = add b a',
+        ... ])
+        >>> table = ExpressionTable(program)
+        >>> table.expressions
+        [('add', 'a', 'b'), ('mul', 'a', 'x')]
+        >>> bin(table.uses['a']), bin(table.uses['x'])
+        ('0b11', '0b10')
+        >>> sorted(table.decode(0b11))
+        [('add', 'a', 'b'), ('mul', 'a', 'x')]
+    """
+    def __init__(s, program: List[lang.Inst]):
+        s.expressions: List[tuple] = []
+        s.bits: Dict[tuple, int] = dict()
+        s.uses: Dict[str, int] = dict()
+        for inst in program:
+            expr = expression(inst)
+            if expr is None or expr in s.bits:
+                continue
+            s.bits[expr] = 1 << len(s.expressions)
+            s.expressions.append(expr)
+            for var in expr[1:]:
+                s.uses[var] = s.uses.get(var, 0) | s.bits[expr]
+        s.all = (1 << len(s.expressions)) - 1
+
+    def bit(s, instruction: lang.Inst) -> int:
+        expr = expression(instruction)
+        return 0 if expr is None else s.bits[expr]
+
+    def killed_by(s, instruction: lang.Inst) -> int:
+        mask = 0
+        for var in instruction.definition():
+            mask |= s.uses.get(var, 0)
+        return mask
+
+    def decode(s, mask: int) -> set:
+        exprs = set()
+        while mask:
+            low = mask & -mask
+            exprs.add(s.expressions[low.bit_length() - 1])
+            mask ^= low
+        return exprs
+
+
+class ExpressionAnalysis(DataFlowAnalysis):
+    """
+    A must-analysis over the expressions of a program, encoded as bitsets.
+    Subclasses define 'gen'. The analysis needs the table of expressions of
+    the program, so the closure-based solvers must run on the class returned
+    by 'bind', and their results hold bitsets until 'decode' turns them into
+    sets of expressions. The worklist solver does both.
+    """
+
+    table: ExpressionTable = None
+
+    @classmethod
+    def bind(cls, program: List[lang.Inst]) -> Type['ExpressionAnalysis']:
+        class Bound(cls):
+            table = ExpressionTable(program)
+        return Bound
+
+    @classmethod
+    def meet(cls, a: int, b: int) -> int:
+        return a & b
+
+    @classmethod
+    def boundary(cls, env: lang.Env) -> int:
+        return 0
+
+    @classmethod
+    def top(cls, program: List[lang.Inst], env: lang.Env) -> int:
+        return cls.table.all
+
+    @classmethod
+    def kill(cls, instruction: lang.Inst, facts: int, env: lang.Env) -> int:
+        return cls.table.killed_by(instruction)
+
+    @classmethod
+    def transfer(cls, instruction: lang.Inst, facts: int,
+                 env: lang.Env) -> int:
+        return (facts & ~cls.kill(instruction, facts, env)) \
+            | cls.gen(instruction, env)
+
+    @classmethod
+    def decode(cls, bound: Type['ExpressionAnalysis'],
+               result: ConstraintEnv) -> ConstraintEnv:
+        return ConstraintEnv.from_lists(result.ins, result.outs,
+                                        bound.table.decode)
+
+
+class AvailableExpressions(ExpressionAnalysis):
+    """
+    Returns the available expressions analysis of a program.
+
+    For each instruction
+        p: v = E
+
+    The incoming and outgoing available expressions are defined as:
+        IN:  Intersection(OUT(ps)), ps in pred(p); nothing at the entry
+        OUT: Union(IN(p) - {expressions that use v}, {E}), if E does not
+             use v; IN(p) - {expressions that use v}, otherwise
+
+    >>> from parser import build_cfg
+    >>> program, env = build_cfg([
+    ...     '{"a": 1, "b": 2, "t": true}',
+    ...     'x = add a b',
+    ...     'bt t 4',
+    ...     'y = mul a b',
+    ...     'a = add x b',
+    ...     'z = add b a',
+    ... ])
+    >>> result = AvailableExpressions.run(program, env)
+    >>> sorted(result.get('IN_3'))
+    [('add', 'a', 'b'), ('mul', 'a', 'b')]
+    >>> sorted(result.get('OUT_3')), sorted(result.get('IN_4'))
+    ([('add', 'b', 'x')], [])
+
+    'mul a b' is not available at 4, because the branch may skip it, and
+    'add a b' is not available at 4 either, because 'a' may have been
+    redefined at 3. The closure-based solvers reach the same solution when
+    they start from the set of all expressions:
+
+    >>> from static_analysis import chaotic_iterations
+    >>> bound = AvailableExpressions.bind(program)
+    >>> cEnv = bound.build_constraint_env(program, env)
+    >>> constraints = bound.build_constraints(program, cEnv, env)
+    >>> solution = chaotic_iterations(constraints, cEnv)
+    >>> AvailableExpressions.decode(bound, solution) == result
+    True
+    >>> sorted(bound.run(program, env).get('IN_3'))
+    [('add', 'a', 'b'), ('mul', 'a', 'b')]
+
+    A bound analysis runs on other programs with their own expressions:
+
+    >>> program, env = build_cfg([
+    ...     '{"a": 1, "b": 2}',
+    ...     'x = mul b a',
+    ...     'y = add x a',
+    ... ])
+    >>> sorted(bound.run(program, env).get('IN_1'))
+    [('mul', 'a', 'b')]
+    """
+
+    @classmethod
+    def gen(cls, instruction: lang.Inst, env: lang.Env) -> int:
+        if instruction.definition() & instruction.uses():
+            return 0
+        return cls.table.bit(instruction)
+
+
+class VeryBusyExpressions(ExpressionAnalysis):
+    """
+    Returns the very busy expressions analysis of a program.
+
+    For each instruction
+        p: v = E
+
+    The incoming and outgoing very busy expressions are defined as:
+        IN:  Union(OUT(p) - {expressions that use v}, {E})
+        OUT: Intersection(IN(ps)), ps in succ(p); nothing at the exits
+
+    >>> from parser import build_cfg
+    >>> program, env = build_cfg([
+    ...     '{"a": 1, "b": 2, "t": true}',
+    ...     'bt t 2',
+    ...     'x = add a b',
+    ...     'a = mul a b',
+    ...     'y = add b a',
+    ... ])
+    >>> result = VeryBusyExpressions.run(program, env)
+    >>> sorted(result.get('IN_0'))
+    [('mul', 'a', 'b')]
+    >>> sorted(result.get('IN_1'))
+    [('add', 'a', 'b'), ('mul', 'a', 'b')]
+
+    'add a b' is computed at 1, but the branch may skip it, and 'a' is
+    redefined before 'add b a' runs, so it is not very busy at 0.
+    """
+
+    forward = False
+
+    @classmethod
+    def gen(cls, instruction: lang.Inst, env: lang.Env) -> int:
+        return cls.table.bit(instruction)
@@ -0,0 +1,285 @@
+"""
+Interval analysis.
+
+This analysis bounds the value of each variable, at each program point, by
+an interval [lo, hi] of integers, following the abstract interpretation of
+"Static Determination of Dynamic Properties of Programs" (Cousot and
+Cousot). Booleans are the integers 0 (false) and 1 (true), and infinite
+bounds are float('inf') and float('-inf'). The facts at a program point map
+variables to intervals; a variable that is not in the map may hold any
+value, and None stands for a point that the program never reaches.
+
+- The variables of the environment start with the exact values given in the
+  header of the program.
+- The edges that leave a branch refine the condition of the branch, and the
+  operands of the comparison that computed it, if the comparison comes
+  right before the branch.
+- Chains of intervals can grow forever around loops, so the values that
+  reach loop headers (targets of jumps back in the program) are widened:
+  bounds that keep growing jump to infinity. A few narrowing rounds then
+  recover the bounds that the loop conditions impose.
+
+The results can prune branches that can never be taken before the program
+runs.
+"""
+import lang
+from dead_code import relink
+from static_analysis import DataFlowAnalysis
+from typing import Dict, List, Optional, Set, Tuple
+
+INF = float('inf')
+Interval = Tuple[float, float]
+State = Optional[Dict[str, Interval]]
+
+
+def _add(a: Interval, b: Interval) -> Interval:
+    return (a[0] + b[0], a[1] + b[1])
+
+
+def _times(x: float, y: float) -> float:
+    # zero times infinity is zero for integers
+    return 0 if x == 0 or y == 0 else x * y
+
+
+def _mul(a: Interval, b: Interval) -> Interval:
+    products = [_times(x, y) for x in a for y in b]
+    return (min(products), max(products))
+
+
+def _lth(a: Interval, b: Interval) -> Interval:
+    if a[1] < b[0]:
+        return (1, 1)
+    if a[0] >= b[1]:
+        return (0, 0)
+    return (0, 1)
+
+
+def _geq(a: Interval, b: Interval) -> Interval:
+    (lo, hi) = _lth(a, b)
+    return (1 - hi, 1 - lo)
+
+
+OPERATIONS = {lang.Add: _add, lang.Mul: _mul, lang.Lth: _lth, lang.Geq: _geq}
+
+
+def abstract_value(value) -> Interval:
+    """
+    Returns the interval that holds a concrete value.
+
+    Example:
+        >>> abstract_value(3), abstract_value(True), abstract_value('x')
+        ((3, 3), (1, 1), (-inf, inf))
+    """
+    if type(value) in [int, bool]:
+        return (int(value), int(value))
+    return (-INF, INF)
+
+
+def _meet(a: Interval, b: Interval) -> Optional[Interval]:
+    """
+    Intersects two intervals, or returns None if they are disjoint.
+    """
+    lo = max(a[0], b[0])
+    hi = min(a[1], b[1])
+    return (lo, hi) if lo <= hi else None
+
+
+class IntervalAnalysis(DataFlowAnalysis):
+    """
+    Returns the interval analysis of a program. IN and OUT map each variable
+    to its interval before and after each instruction, or are None where the
+    program never gets to.
+
+    >>> from parser import build_cfg
+    >>> program, env = build_cfg([
+    ...     '{"zero": 0, "one": 1, "ten": 10}',
+    ...     'i = add zero zero',
+    ...     'i = add i one',
+    ...     'c = lth i ten',
+    ...     'bt c 1',
+    ...     'big = lth ten i',
+    ...     'bt big 7',
+    ...     'x = add i i',
+    ...     'y = mul i i',
+    ... ])
+    >>> result = IntervalAnalysis.run(program, env)
+    >>> result.get('OUT_1')['i'], result.get('OUT_4')['i']
+    ((1, 10), (10, 10))
+    >>> result.get('OUT_4')['big'], result.get('OUT_6')['x']
+    ((0, 0), (20, 20))
+
+    Without narrowing, widening would have left 'i' unbounded above in the
+    loop:
+
+    >>> class Widened(IntervalAnalysis):
+    ...     narrowing_rounds = 0
+    >>> Widened.run(program, env).get('OUT_1')['i']
+    (1, inf)
+    """
+
+    narrowing_rounds = 2
+
+    @classmethod
+    def meet(cls, a: State, b: State) -> State:
+        if a is None or b is None:
+            return b if a is None else a
+        return dict([(var, (min(a[var][0], b[var][0]),
+                            max(a[var][1], b[var][1])))
+                     for var in a.keys() & b.keys()])
+
+    @classmethod
+    def boundary(cls, env: lang.Env) -> State:
+        return dict([(var, abstract_value(env.get(var)))
+                     for var in env.definitions()])
+
+    @classmethod
+    def top(cls, program: List[lang.Inst], env: lang.Env) -> State:
+        return None
+
+    @classmethod
+    def transfer(cls, instruction: lang.Inst, facts: State,
+                 env: lang.Env) -> State:
+        if facts is None or type(instruction) not in OPERATIONS:
+            return facts
+        full = (-INF, INF)
+        facts = dict(facts)
+        facts[instruction.dst] = OPERATIONS[type(instruction)](
+            facts.get(instruction.src0, full),
+            facts.get(instruction.src1, full))
+        return facts
+
+    @classmethod
+    def edge(cls, tail: lang.Inst, head: lang.Inst, facts: State,
+             env: lang.Env) -> State:
+        if facts is None or type(tail) is not lang.Bt or \
+                tail.NEXTS[0] is tail.NEXTS[1]:
+            return facts
+        return refine(tail, head is tail.NEXTS[0], facts)
+
+    @classmethod
+    def widening_points(cls, program: List[lang.Inst]) -> Set[int]:
+        return set([inst.jump_to for inst in program
+                    if type(inst) is lang.Bt and inst.jump_to <= inst.index])
+
+    @classmethod
+    def widen(cls, old: State, new: State) -> State:
+        if old is None or new is None:
+            return new
+        widened = dict()
+        for var in old.keys() & new.keys():
+            lo = old[var][0] if new[var][0] >= old[var][0] else -INF
+            hi = old[var][1] if new[var][1] <= old[var][1] else INF
+            widened[var] = (lo, hi)
+        return widened
+
+    @classmethod
+    def narrow(cls, old: State, new: State) -> State:
+        if old is None or new is None:
+            return new
+        narrowed = dict()
+        for var in old.keys() & new.keys():
+            lo = new[var][0] if old[var][0] == -INF else old[var][0]
+            hi = new[var][1] if old[var][1] == INF else old[var][1]
+            narrowed[var] = (lo, hi)
+        return narrowed
+
+
+def refine(branch: lang.Bt, taken: bool, facts: Dict[str, Interval]) -> \
+        State:
+    """
+    Returns the facts that hold after the branch is taken (or not), or None
+    if that cannot happen.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"a": 0, "b": 5}',
+        ...     'c = lth a b',
+        ...     'bt c 0',
+        ... ])
+        >>> facts = {'a': (0, 9), 'b': (5, 5), 'c': (0, 1)}
+        >>> sorted(refine(program[1], True, facts).items())
+        [('a', (0, 4)), ('b', (5, 5)), ('c', (1, 1))]
+        >>> sorted(refine(program[1], False, facts).items())
+        [('a', (5, 9)), ('b', (5, 5)), ('c', (0, 0))]
+        >>> refine(program[1], False, {'c': (1, 1)}) is None
+        True
+    """
+    full = (-INF, INF)
+    facts = dict(facts)
+    cond = facts.get(branch.cond, full)
+    if taken:
+        if cond == (0, 0):
+            return None
+        cond = (1 if cond[0] == 0 else cond[0], -1 if cond[1] == 0
+                else cond[1])
+    else:
+        if not cond[0] <= 0 <= cond[1]:
+            return None
+        cond = (0, 0)
+    facts[branch.cond] = cond
+    # the comparison that computed the condition right before the branch
+    # tells how its operands relate
+    prev = branch.PREVS[0] if len(branch.PREVS) == 1 else None
+    if type(prev) not in [lang.Lth, lang.Geq] or prev.dst != branch.cond or \
+            prev.index != branch.index - 1 or \
+            branch.cond in [prev.src0, prev.src1]:
+        return facts
+    less = taken == (type(prev) is lang.Lth)
+    a = facts.get(prev.src0, full)
+    b = facts.get(prev.src1, full)
+    if less:
+        # src0 < src1
+        (a, b) = (_meet(a, (-INF, b[1] - 1)), _meet(b, (a[0] + 1, INF)))
+    else:
+        # src0 >= src1
+        (a, b) = (_meet(a, (b[0], INF)), _meet(b, (-INF, a[1])))
+    if a is None or b is None:
+        return None
+    facts[prev.src0] = a
+    facts[prev.src1] = b
+    if prev.src0 == prev.src1:
+        facts[prev.src0] = _meet(a, b)
+        if facts[prev.src0] is None:
+            return None
+    return facts
+
+
+def prune_branches(program: List[lang.Inst], env: lang.Env) -> \
+        List[lang.Inst]:
+    """
+    Removes the instructions that the interval analysis finds unreachable,
+    and the branches that are never taken. The instructions are updated in
+    place.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"zero": 0, "one": 1, "ten": 10}',
+        ...     'i = add zero zero',
+        ...     'i = add i one',
+        ...     'c = lth i ten',
+        ...     'bt c 1',
+        ...     'big = lth ten i',
+        ...     'bt big 7',
+        ...     'x = add i i',
+        ...     'y = mul i i',
+        ... ])
+        >>> program = prune_branches(program, env)
+        >>> [sorted(inst.definition() | inst.uses()) for inst in program]
+        [['i', 'zero'], ['i', 'one'], ['c', 'i', 'ten'], ['c'], \
+['big', 'i', 'ten'], ['i', 'x'], ['i', 'y']]
+    """
+    result = IntervalAnalysis.run(program, env)
+    kept = []
+    for inst in program:
+        facts = result.get_in(inst.index)
+        if facts is None:
+            continue
+        if type(inst) is lang.Bt and inst.NEXTS[0] is not None and \
+                refine(inst, True, facts) is None:
+            continue
+        kept.append(inst)
+    if len(kept) == len(program):
+        return program
+    return relink(kept)
@@ -40,17 +40,40 @@ class Env:
         >>> e.set("a", 2)
         >>> e.get("a") + e.get("b")
         7
+
+    Without history, the environment is a dictionary: a new binding replaces
+    the previous binding of the same variable, and bindings can be removed:
+
+        >>> e = Env({"a": 1, "b": 5, "c": 7}, history=False)
+        >>> e.set("a", 2)
+        >>> e.remove("b")
+        >>> e.bindings(), e.get_first(['a', 'c'])
+        ([('a', 2), ('c', 7)], 2)
     """
-    def __init__(s, initial_args={}):
-        s.env = deque()
+    def __init__(s, initial_args={}, history=True):
+        s.env = deque() if history else dict()
+        s.history = history
         for var, value in initial_args.items():
-            s.env.appendleft((var, value))
+            s.set(var, value)
+
+    def bindings(s):
+        """
+        Returns the bindings of the environment, the most recent first.
+        """
+        if s.history:
+            return list(s.env)
+        return list(reversed(s.env.items()))
 
     def get(s, var):
         """
         Finds the first occurrence of variable 'var' in the environment stack,
         and returns the value associated with it.
         """
+        if not s.history:
+            val = s.env.get(var)
+            if val is None:
+                raise LookupError(f"Absent key {val}")
+            return val
         return s.get_or_raise(lambda var_name: var_name == var)
 
     def get_first(s, vars):
@@ -70,7 +93,9 @@ class Env:
         'get_first'. It takes the predicate with the condition used to find the
         correct binding.
         """
-        val = next((value for (e_var, value) in self.env if pred(e_var)), None)
+        bindings = self.env if self.history else reversed(self.env.items())
+        val = next((value for (e_var, value) in bindings if pred(e_var)),
+                   None)
         if val is not None:
             return val
         else:
@@ -79,16 +104,32 @@ class Env:
     def set(s, var, value):
         """
         This method adds 'var' to the environment, by placing the binding
-        '(var, value)' onto the top of the environment stack.
+        '(var, value)' onto the top of the environment stack. If the
+        environment keeps no history, previous bindings of 'var' are removed.
+        """
+        if s.history:
+            s.env.appendleft((var, value))
+        else:
+            # the most recent binding goes last
+            s.env.pop(var, None)
+            s.env[var] = value
+
+    def remove(s, var):
+        """
+        Removes every binding of 'var' from the environment.
         """
-        s.env.appendleft((var, value))
+        if not s.history:
+            s.env.pop(var, None)
+            return
+        s.env = deque([(e_var, value) for (e_var, value) in s.env
+                       if e_var != var])
 
     def dump(s):
         """
         Prints the contents of the environment. This method is mostly used for
         debugging purposes.
         """
-        for (var, value) in s.env:
+        for (var, value) in s.bindings():
             print(f"{var}: {value}")
 
     def definitions(s):
@@ -96,7 +137,7 @@ class Env:
         Returns the set of variables that have been defined in the environment
         """
         vs = set()
-        for definition in s.env:
+        for definition in s.bindings():
             vs.add(definition[0])
         return vs
 
@@ -0,0 +1,212 @@
+"""
+Register allocation for interpreter slots.
+
+The environment of the interpreter keeps a binding for every assignment that
+the program ever made. Yet, at each point of the program, only the variables
+that are alive hold values that may still be read, so variables that are
+never alive at the same time can share the same storage. This module maps
+the variables of a program to a small number of slots, following the
+graph-coloring approach of "Register Allocation via Coloring" (Chaitin et
+al.):
+
+1. Two variables interfere if one of them is defined at a point where the
+   other is alive. The variables bound in the environment are defined
+   together, before the first instruction.
+2. The interference graph is colored greedily, in "smallest-last" order:
+   nodes of least degree are removed from the graph first, and colored last,
+   with the smallest color that none of their neighbors have.
+
+Slots are never exhausted, so no variable is spilled. Variables in
+'observable' hold their final values in their slots.
+"""
+import heapq
+import lang
+from static_analysis import Liveness
+from typing import Dict, List, Set
+
+
+def interference_graph(program: List[lang.Inst], env: lang.Env,
+                       observable: Set[str] = set()) -> Dict[str, Set[str]]:
+    """
+    Builds the interference graph of the variables of a program.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"a": 1, "b": 2}',
+        ...     'x = add a b',
+        ...     'y = add x a',
+        ...     'z = add y y',
+        ... ])
+        >>> graph = interference_graph(program, env, {'z'})
+        >>> [(var, sorted(graph[var])) for var in sorted(graph)]
+        [('a', ['b', 'x']), ('b', ['a']), ('x', ['a']), ('y', []), ('z', [])]
+    """
+    graph = dict()
+    for var in env.definitions() | observable:
+        graph[var] = set()
+    for inst in program:
+        for var in inst.definition() | inst.uses():
+            graph[var] = set()
+
+    def interfere(a, b):
+        if a != b:
+            graph[a].add(b)
+            graph[b].add(a)
+
+    result = Liveness.with_exit(observable).run(program, env)
+    for inst in program:
+        for d in inst.definition():
+            for v in result.get_out(inst.index):
+                interfere(d, v)
+    entry = result.get('IN_0') if len(program) > 0 else set(observable)
+    for a in entry:
+        for b in entry:
+            interfere(a, b)
+    return graph
+
+
+def color(graph: Dict[str, Set[str]]) -> Dict[str, int]:
+    """
+    Assigns a color to each node of the graph, so that neighbors have
+    different colors.
+
+    Example:
+        >>> graph = {'a': {'b', 'c'}, 'b': {'a', 'c'}, 'c': {'a', 'b', 'd'},
+        ...          'd': {'c'}}
+        >>> sorted(color(graph).items())
+        [('a', 2), ('b', 1), ('c', 0), ('d', 1)]
+    """
+    degree = dict([(var, len(neighbors))
+                   for (var, neighbors) in graph.items()])
+    # a heap of (degree, var); entries left behind when a degree drops are
+    # skipped when they come out
+    heap = [(d, var) for (var, d) in degree.items()]
+    heapq.heapify(heap)
+    stack = []
+    while len(heap) > 0:
+        (d, var) = heapq.heappop(heap)
+        if var not in degree or degree[var] != d:
+            continue
+        stack.append(var)
+        del degree[var]
+        for neighbor in graph[var]:
+            if neighbor in degree:
+                degree[neighbor] -= 1
+                heapq.heappush(heap, (degree[neighbor], neighbor))
+    colors = dict()
+    for var in reversed(stack):
+        # some color in 0..len(neighbors) is free
+        taken = [False] * (len(graph[var]) + 1)
+        for n in graph[var]:
+            if n in colors and colors[n] < len(taken):
+                taken[colors[n]] = True
+        colors[var] = taken.index(False)
+    return colors
+
+
+def allocate_slots(program: List[lang.Inst], env: lang.Env,
+                   observable: Set[str] = set()) -> Dict[str, int]:
+    """
+    Maps each variable of a program to a slot, so that variables that
+    interfere have different slots.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"zero": 0, "one": 1, "three": 3, "iter": 9}',
+        ...     'count = add zero three',
+        ...     'pred = add zero one',
+        ...     'fib = add zero one',
+        ...     'aux = add zero fib',
+        ...     'fib = add pred fib',
+        ...     'pred = add zero aux',
+        ...     'count = add count one',
+        ...     'repeat = geq iter count',
+        ...     'bt repeat 3',
+        ...     'end = add zero zero',
+        ... ])
+        >>> slots = allocate_slots(program, env, {'fib'})
+        >>> len(slots), len(set(slots.values()))
+        (10, 7)
+        >>> slots['aux'] == slots['repeat']
+        True
+    """
+    return color(interference_graph(program, env, observable))
+
+
+class SlotEnv:
+    """
+    An environment that stores the value of each variable in its slot. A
+    variable that shares a slot with another variable can only be read while
+    it is alive.
+
+    Example:
+        >>> e = SlotEnv({'a': 0, 'b': 0, 'c': 1}, lang.Env({'a': 2, 'c': 3}),
+        ...             {'a', 'c'})
+        >>> e.get('a') + e.get('c')
+        5
+        >>> e.set('b', 7)
+        >>> e.get('b'), e.values
+        (7, [7, 3])
+    """
+    def __init__(s, slots: Dict[str, int], initial: lang.Env,
+                 live: Set[str]):
+        s.slots = slots
+        s.values = [None for i in range(max(slots.values(), default=-1) + 1)]
+        for var in live & initial.definitions():
+            s.set(var, initial.get(var))
+
+    def get(s, var):
+        val = s.values[s.slots[var]]
+        if val is not None:
+            return val
+        else:
+            raise LookupError(f"Absent key {var}")
+
+    def set(s, var, value):
+        s.values[s.slots[var]] = value
+
+    def dump(s):
+        for (i, value) in enumerate(s.values):
+            print(f"{i}: {value}")
+
+
+def run_with_slots(program: List[lang.Inst], env: lang.Env,
+                   observable: Set[str]) -> Dict[str, object]:
+    """
+    Interprets a program on a slot environment, and returns the final values
+    of the variables in 'observable'.
+
+    Example:
+        >>> from parser import build_cfg
+        >>> program, env = build_cfg([
+        ...     '{"zero": 0, "one": 1, "three": 3, "iter": 9}',
+        ...     'count = add zero three',
+        ...     'pred = add zero one',
+        ...     'fib = add zero one',
+        ...     'aux = add zero fib',
+        ...     'fib = add pred fib',
+        ...     'pred = add zero aux',
+        ...     'count = add count one',
+        ...     'repeat = geq iter count',
+        ...     'bt repeat 3',
+        ...     'end = add zero zero',
+        ... ])
+        >>> run_with_slots(program, env, {'fib', 'count'})
+        {'count': 10, 'fib': 34}
+
+    A program without instructions returns the values in its environment:
+
+        >>> run_with_slots(*build_cfg(['{"a": 1}']), {'a'})
+        {'a': 1}
+    """
+    slots = allocate_slots(program, env, observable)
+    live = Liveness.with_exit(observable).run(program, env).get('IN_0') \
+        if len(program) > 0 else observable
+    slot_env = SlotEnv(slots, env, live)
+    inst = program[0] if len(program) > 0 else None
+    while inst is not None:
+        inst.eval(slot_env)
+        inst = inst.get_next()
+    return dict([(var, slot_env.get(var)) for var in sorted(observable)])
@@ -1,3 +1,4 @@
+import heapq
 import lang
 from parser import build_cfg
 from abc import ABC, abstractclassmethod
@@ -9,6 +10,10 @@ implementation.
 - The StaticAnalysis base class represents the interface that static analysis
   strategies should follow. One example is provided with the Liveness class.
 
+- DataFlowAnalysis derives the constraints of an analysis from a declaration
+  in the monotone framework: direction, meet, boundary and gen/kill sets.
+  Liveness and ReachingDefinitions are declared in this way.
+
 - ConstraintEnv
 
 """
@@ -149,33 +154,148 @@ class DependenceGraph:
         return set(nbs)
 
 
+def _slot(id: str):
+    """
+    Splits the id 'IN_i' into (True, i), and 'OUT_i' into (False, i).
+    Returns None for other ids.
+
+    Example:
+        >>> _slot('IN_3'), _slot('OUT_12'), _slot('x')
+        ((True, 3), (False, 12), None)
+    """
+    (kind, _, index) = id.partition('_')
+    if kind in ['IN', 'OUT'] and index.isdigit():
+        return (kind == 'IN', int(index))
+    return None
+
+
+# marks the entries of the lists of a ConstraintEnv that hold no value
+_ABSENT = object()
+
+
 class ConstraintEnv:
-    def __init__(s, env: dict):
-        s.env = env
+    """
+    Maps the ids of constraints to their values. The values of 'IN_i' and
+    'OUT_i' are kept in two lists indexed by instruction, which solvers read
+    and write with 'get_in', 'get_out', 'update_in' and 'update_out',
+    without formatting ids. Other ids are kept in a dictionary. If 'decode'
+    is given, values are stored in a compact form, such as bitsets, and
+    converted when they are read.
+
+    Example:
+        >>> cEnv = ConstraintEnv({'IN_0': {1}, 'OUT_0': {1, 2}, 'x': {3}})
+        >>> cEnv.get('OUT_0') is cEnv.get_out(0), cEnv.ins, cEnv.get('x')
+        (True, [{1}], {3})
+        >>> cEnv.update_in(0, {1}), cEnv.update('IN_0', {4})
+        (False, True)
+        >>> cEnv == ConstraintEnv({'IN_0': {4}, 'OUT_0': {1, 2}, 'x': {3}})
+        True
+        >>> bits = ConstraintEnv.from_lists([0b101], [0b1], lambda mask:
+        ...     set([b for b in range(mask.bit_length()) if mask >> b & 1]))
+        >>> bits.get('IN_0'), bits.get_out(0)
+        ({0, 2}, {0})
+    """
+    def __init__(s, env: dict = None, decode: Callable = None):
+        s.ins = []
+        s.outs = []
+        s.others = dict()
+        s.decoder = decode
+        for (id, value) in (env or dict()).items():
+            slot = _slot(id)
+            if slot is None:
+                s.others[id] = value
+                continue
+            values = s.ins if slot[0] else s.outs
+            while len(values) <= slot[1]:
+                values.append(_ABSENT)
+            values[slot[1]] = value
 
-    def get(s, id: str) -> set:
-        return s.env[id]
+    @classmethod
+    def from_lists(cls, ins: list, outs: list,
+                   decode: Callable = None) -> 'ConstraintEnv':
+        cEnv = cls(None, decode)
+        cEnv.ins = ins
+        cEnv.outs = outs
+        return cEnv
 
-    def update(s, id: str, value: set):
-        if s.env[id] == value:
+    def _read(s, value):
+        if value is _ABSENT:
+            raise KeyError(value)
+        return value if s.decoder is None else s.decoder(value)
+
+    def get_in(s, index: int):
+        return s._read(s.ins[index])
+
+    def get_out(s, index: int):
+        return s._read(s.outs[index])
+
+    def update_in(s, index: int, value) -> bool:
+        if s.ins[index] == value:
             return False
-        s.env[id] = value
+        s.ins[index] = value
         return True
 
+    def update_out(s, index: int, value) -> bool:
+        if s.outs[index] == value:
+            return False
+        s.outs[index] = value
+        return True
+
+    def get(s, id: str) -> set:
+        slot = _slot(id)
+        if slot is None:
+            return s._read(s.others[id])
+        return s.get_in(slot[1]) if slot[0] else s.get_out(slot[1])
+
+    def update(s, id: str, value: set):
+        slot = _slot(id)
+        if slot is None:
+            if s.others[id] == value:
+                return False
+            s.others[id] = value
+            return True
+        if slot[0]:
+            return s.update_in(slot[1], value)
+        return s.update_out(slot[1], value)
+
+    @property
+    def env(s) -> dict:
+        """
+        Returns every value of the environment, keyed by id.
+        """
+        env = dict()
+        for (prefix, values) in [('IN', s.ins), ('OUT', s.outs)]:
+            for (i, value) in enumerate(values):
+                if value is not _ABSENT:
+                    env[f'{prefix}_{i}'] = s._read(value)
+        for (id, value) in s.others.items():
+            env[id] = s._read(value)
+        return env
+
     def __eq__(s, o) -> bool:
+        if s.decoder is None and o.decoder is None:
+            return s.ins == o.ins and s.outs == o.outs and \
+                s.others == o.others
         return s.env == o.env
 
     def print(s):
-        size = int(len(s.env)/2)
-        for i in range(size):
-            ordered_values = list(s.env[f'IN_{i}'])
-            ordered_values.sort(key=lambda key: str(key))
-            ordered_values = map(str, ordered_values)
-            print(f'IN_{i}: {", ".join(ordered_values)}')
-            ordered_values = list(s.env[f'OUT_{i}'])
-            ordered_values.sort(key=lambda key: str(key))
-            ordered_values = map(str, ordered_values)
-            print(f'OUT_{i}: {", ".join(ordered_values)}')
+        """
+        Prints the IN and OUT values of each instruction, skipping the ones
+        that the environment does not hold.
+
+        Example:
+            >>> ConstraintEnv({'IN_0': {'b', 'a'}, 'OUT_1': {2}}).print()
+            IN_0: a, b
+            OUT_1: 2
+        """
+        for i in range(max(len(s.ins), len(s.outs))):
+            for (prefix, values) in [('IN', s.ins), ('OUT', s.outs)]:
+                if i >= len(values) or values[i] is _ABSENT:
+                    continue
+                ordered_values = list(s._read(values[i]))
+                ordered_values.sort(key=lambda key: str(key))
+                ordered_values = map(str, ordered_values)
+                print(f'{prefix}_{i}: {", ".join(ordered_values)}')
 
 
 class Constraint:
@@ -192,14 +312,113 @@ class Constraint:
     def __init__(s, id, eq):
         s.id = id
         s.eq = eq
+        s.slot = _slot(id)
 
     def eval(s, env):
-        return env.update(s.id, s.eq())
+        if s.slot is None:
+            return env.update(s.id, s.eq())
+        if s.slot[0]:
+            return env.update_in(s.slot[1], s.eq())
+        return env.update_out(s.slot[1], s.eq())
 
     def __str__(s):
         return f'{s.id}: {str(s.eq)}'
 
 
+def reachable(program: List[lang.Inst]) -> List[int]:
+    """
+    Returns the indices of the instructions reachable from the first one, in
+    program order. Both solvers skip the other instructions: their IN and
+    OUT keep the initial value of the analysis, which the meet operator
+    ignores, so dead code does not flow into live code.
+
+    Example:
+        >>> program, env = build_cfg(['{"a": 1}', 'x = add a a', 'bt a 0'])
+        >>> program[0].NEXTS = []
+        >>> reachable(program), reachable([])
+        ([0], [])
+    """
+    reached = set([0]) if len(program) > 0 else set()
+    worklist = list(reached)
+    while len(worklist) > 0:
+        inst = program[worklist.pop()]
+        for nxt in inst.NEXTS:
+            if nxt is not None and nxt.index not in reached:
+                reached.add(nxt.index)
+                worklist.append(nxt.index)
+    return sorted(reached)
+
+
+class LazyConstraints:
+    """
+    The constraints of a program, built when a solver first reads them. Only
+    the instructions that are 'reachable' get constraints, IN before OUT, in
+    program order.
+
+    Example:
+        >>> program, env = build_cfg([
+        ...     '{"a": 1, "t": true}',
+        ...     'x = add a a',
+        ...     'bt t 3',
+        ...     'z = add x x',
+        ...     'y = add x z',
+        ... ])
+        >>> # the branch now jumps to 'y' either way: 'z' is dead code
+        >>> program[1].NEXTS[1] = program[3]
+        >>> program[2].PREVS = []
+        >>> cEnv = ReachingDefinitions.build_constraint_env(program, env)
+        >>> constraints = ReachingDefinitions.build_constraints(
+        ...     program, cEnv, env)
+        >>> len(constraints), constraints.built()
+        (6, 0)
+        >>> [c.id for c in constraints][-2:], constraints.built()
+        (['IN_3', 'OUT_3'], 6)
+        >>> result = chaotic_iterations(constraints, cEnv)
+        >>> sorted(result.get('IN_3')), result.get('OUT_2')
+        ([(-1, 'a'), (-1, 't'), (0, 'x')], set())
+
+    The worklist solver skips the dead code too:
+
+        >>> result == ReachingDefinitions.run(program, env)
+        True
+        >>> cEnv = Liveness.build_constraint_env(program, env)
+        >>> chaotic_iterations(Liveness.build_constraints(program, cEnv, env),
+        ...                    cEnv) == Liveness.run(program, env)
+        True
+    """
+    def __init__(s, program: List[lang.Inst],
+                 IN: Callable, OUT: Callable):
+        s.IN = IN
+        s.OUT = OUT
+        s.instructions = [program[i] for i in reachable(program)]
+        s.constraints: List[Constraint] = \
+            [None] * (2 * len(s.instructions))
+
+    def __len__(s) -> int:
+        return len(s.constraints)
+
+    def __getitem__(s, i: int) -> Constraint:
+        i = range(len(s.constraints))[i]
+        if s.constraints[i] is None:
+            instruction = s.instructions[i // 2]
+            if i % 2 == 0:
+                s.constraints[i] = Constraint(f'IN_{instruction.index}',
+                                              s.IN(instruction))
+            else:
+                s.constraints[i] = Constraint(f'OUT_{instruction.index}',
+                                              s.OUT(instruction))
+        return s.constraints[i]
+
+    def __iter__(s):
+        return (s[i] for i in range(len(s.constraints)))
+
+    def built(s) -> int:
+        """
+        Returns how many constraints have been built so far.
+        """
+        return len([c for c in s.constraints if c is not None])
+
+
 class StaticAnalysis(ABC):
     @abstractclassmethod
     def IN(cls,
@@ -224,27 +443,17 @@ class StaticAnalysis(ABC):
 
     @classmethod
     def build_constraint_env(cls, program: List[lang.Inst]) -> ConstraintEnv:
-        env = dict()
-        for i in range(len(program)):
-            env[f'IN_{i}'] = set()
-            env[f'OUT_{i}'] = set()
-        return ConstraintEnv(env)
+        return ConstraintEnv.from_lists([set() for inst in program],
+                                        [set() for inst in program])
 
     @classmethod
     def build_constraints(cls, program: List[lang.Inst],
                           cEnv: ConstraintEnv,
-                          env: lang.Env) -> List[Constraint]:
-        constraints = []
-        for instruction in program:
-            _in = cls.IN(instruction, cEnv, env)
-            constraints.append(
-                Constraint(f'IN_{instruction.index}', _in)
-            )
-            _out = cls.OUT(instruction, cEnv, env)
-            constraints.append(
-                Constraint(f'OUT_{instruction.index}', _out)
-            )
-        return constraints
+                          env: lang.Env) -> LazyConstraints:
+        return LazyConstraints(
+            program,
+            lambda instruction: cls.IN(instruction, cEnv, env),
+            lambda instruction: cls.OUT(instruction, cEnv, env))
 
     # @classmethod
     # def definitions(cls, instruction):
@@ -276,7 +485,383 @@ def run_analysis_on_program(program: List[lang.Inst],
     return result
 
 
-class Liveness(StaticAnalysis):
+class DataFlowAnalysis(StaticAnalysis):
+    """
+    A data-flow analysis in the monotone framework. Instead of writing the
+    IN and OUT constraints by hand, an analysis declares:
+
+    - its direction: information flows from predecessors to successors if
+      'forward' is True, and from successors to predecessors otherwise;
+    - 'meet', which combines the information that reaches a point through
+      different edges: union for "may" analyses, intersection for "must"
+      analyses;
+    - 'boundary', the information at the entry of the program (forward) or
+      at its exits (backward);
+    - 'top', the starting value of every other point: the empty set for
+      "may" analyses, and the set of all facts for "must" analyses;
+    - 'gen' and 'kill', the facts that an instruction creates and destroys.
+
+    Analyses over richer lattices may also override 'transfer', refine the
+    facts along the edges of branches with 'edge', and ensure termination
+    with 'widen' and 'narrow'.
+
+    The constraints of the closure-based solvers are derived from these
+    declarations, and 'run' solves the analysis with a worklist over the
+    instructions, which creates no closures.
+
+    For an instruction p, the facts that reach it through its flow
+    predecessors, and the facts that it produces, are:
+        joined(p) = meet(result(ps)), ps in flow predecessors of p
+        result(p) = Union(joined(p) - kill(p), gen(p))
+    In a forward analysis, IN is 'joined' and OUT is 'result'; in a backward
+    analysis, OUT is 'joined' and IN is 'result'.
+    """
+
+    forward: bool = True
+    narrowing_rounds: int = 0
+
+    @classmethod
+    def meet(cls, a: set, b: set) -> set:
+        return a | b
+
+    @classmethod
+    def boundary(cls, env: lang.Env) -> set:
+        return set()
+
+    @classmethod
+    def top(cls, program: List[lang.Inst], env: lang.Env) -> set:
+        return set()
+
+    @classmethod
+    def gen(cls, instruction: lang.Inst, env: lang.Env) -> set:
+        raise NotImplementedError
+
+    @classmethod
+    def kill(cls, instruction: lang.Inst, facts: set, env: lang.Env) -> set:
+        """
+        Returns the facts, among 'facts', that 'instruction' destroys.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def transfer(cls, instruction: lang.Inst, facts: set,
+                 env: lang.Env) -> set:
+        return (facts - cls.kill(instruction, facts, env)) \
+            | cls.gen(instruction, env)
+
+    @classmethod
+    def sources(cls, instruction: lang.Inst) -> List[lang.Inst]:
+        """
+        Returns the instructions whose results flow into 'instruction'.
+        """
+        if cls.forward:
+            return instruction.PREVS
+        return [nxt for nxt in instruction.NEXTS if nxt is not None]
+
+    @classmethod
+    def targets(cls, instruction: lang.Inst) -> List[lang.Inst]:
+        """
+        Returns the instructions that 'instruction' flows into.
+        """
+        if cls.forward:
+            return [nxt for nxt in instruction.NEXTS if nxt is not None]
+        return instruction.PREVS
+
+    @classmethod
+    def on_boundary(cls, instruction: lang.Inst) -> bool:
+        if cls.forward:
+            return instruction.index == 0
+        # the program ends after the last instruction, and after a branch
+        # that is the last instruction, if it is not taken
+        nexts = [nxt for nxt in instruction.NEXTS if nxt is not None]
+        return len(nexts) < len(instruction.NEXTS) or len(nexts) == 0
+
+    @classmethod
+    def edge(cls, tail: lang.Inst, head: lang.Inst, facts,
+             env: lang.Env):
+        """
+        Returns the facts that flow along the edge from 'tail' to 'head', in
+        the direction of the flow of control, given the facts that leave the
+        flow predecessor. Analyses that learn something from the outcome of a
+        branch refine the facts here.
+        """
+        return facts
+
+    @classmethod
+    def join(cls, instruction: lang.Inst, results: Callable,
+             program: List[lang.Inst], env: lang.Env) -> set:
+        """
+        Combines the results of the flow predecessors of 'instruction', which
+        the function 'results' maps from their indices.
+        """
+        initial = [cls.boundary(env)] if cls.on_boundary(instruction) else []
+        return cls.combine(instruction, cls.sources(instruction), initial,
+                           results, program, env)
+
+    @classmethod
+    def combine(cls, instruction: lang.Inst, sources: List[lang.Inst],
+                initial: list, results: Callable,
+                program: List[lang.Inst], env: lang.Env) -> set:
+        """
+        Does the work of 'join', given the flow predecessors of
+        'instruction', and the boundary facts, if it is on the boundary.
+        The solver finds these once, and shares them between analyses.
+        """
+        joined = list(initial)
+        for src in sources:
+            (tail, head) = (src, instruction) if cls.forward \
+                else (instruction, src)
+            joined.append(cls.edge(tail, head, results(src.index), env))
+        if len(joined) == 0:
+            return cls.top(program, env)
+        value = joined[0]
+        for other in joined[1:]:
+            value = cls.meet(value, other)
+        return value
+
+    @classmethod
+    def widening_points(cls, program: List[lang.Inst]) -> Set[int]:
+        """
+        Returns the indices of the instructions where 'widen' combines the
+        successive values that reach them. Analyses over lattices of
+        infinite height use widening to terminate.
+        """
+        return set()
+
+    @classmethod
+    def widen(cls, old, new):
+        return new
+
+    @classmethod
+    def narrow(cls, old, new):
+        return new
+
+    @classmethod
+    def IN(cls, instruction: lang.Inst,
+           cEnv: ConstraintEnv,
+           env: lang.Env,
+           program: List[lang.Inst] = None) -> Callable:
+        """
+        'program' is only needed by analyses whose 'top' depends on it.
+        """
+        program = [] if program is None else program
+        if cls.forward:
+            return lambda: cls.join(instruction,
+                                    cEnv.get_out,
+                                    program, env)
+        return lambda: cls.transfer(
+            instruction, cEnv.get_out(instruction.index), env)
+
+    @classmethod
+    def OUT(cls, instruction: lang.Inst,
+            cEnv: ConstraintEnv,
+            env: lang.Env,
+            program: List[lang.Inst] = None) -> Callable:
+        program = [] if program is None else program
+        if cls.forward:
+            return lambda: cls.transfer(
+                instruction, cEnv.get_in(instruction.index), env)
+        return lambda: cls.join(instruction,
+                                cEnv.get_in,
+                                program, env)
+
+    @classmethod
+    def build_constraint_env(cls, program: List[lang.Inst],
+                             env: lang.Env = None) -> ConstraintEnv:
+        env = lang.Env() if env is None else env
+        return ConstraintEnv.from_lists(
+            [cls.top(program, env) for inst in program],
+            [cls.top(program, env) for inst in program])
+
+    @classmethod
+    def build_constraints(cls, program: List[lang.Inst],
+                          cEnv: ConstraintEnv,
+                          env: lang.Env) -> LazyConstraints:
+        return LazyConstraints(
+            program,
+            lambda instruction: cls.IN(instruction, cEnv, env, program),
+            lambda instruction: cls.OUT(instruction, cEnv, env, program))
+
+    @classmethod
+    def bind(cls, program: List[lang.Inst]) -> Type['DataFlowAnalysis']:
+        """
+        Returns the analysis that the solver runs on 'program'. Analyses
+        that index the facts of a program before they run override it.
+        """
+        return cls
+
+    @classmethod
+    def decode(cls, bound: Type['DataFlowAnalysis'],
+               result: ConstraintEnv) -> ConstraintEnv:
+        """
+        Converts the result of the analysis returned by 'bind' into the
+        result of this analysis.
+        """
+        return result
+
+    @classmethod
+    def run(cls, program: List[lang.Inst], env: lang.Env) -> ConstraintEnv:
+        """
+        Solves the analysis with a worklist of instructions; see 'run_fused'.
+        """
+        return run_fused([cls], program, env)[0]
+
+
+def _flow_order(targets: List[List[int]], on_boundary: List[bool],
+                forward: bool) -> List[int]:
+    """
+    Returns the indices of the instructions in reverse post-order of the
+    flow graph, starting from the boundary: the entry of the program in a
+    forward analysis, and its exits in a backward analysis.
+
+    Example:
+        >>> _flow_order([[1, 2], [3], [3], []], [True, False, False, False],
+        ...             True)
+        [0, 2, 1, 3]
+    """
+    indices = list(range(len(targets)))
+    roots = [i for i in indices if on_boundary[i]] + \
+        (indices if forward else indices[::-1])
+    visited = set()
+    post_order = []
+    for root in roots:
+        if root in visited:
+            continue
+        visited.add(root)
+        stack = [(root, iter(targets[root]))]
+        while len(stack) > 0:
+            (node, successors) = stack[-1]
+            nxt = next(successors, None)
+            if nxt is None:
+                stack.pop()
+                post_order.append(node)
+            elif nxt not in visited:
+                visited.add(nxt)
+                stack.append((nxt, iter(targets[nxt])))
+    return post_order[::-1]
+
+
+def run_fused(analyses: List[Type[DataFlowAnalysis]],
+              program: List[lang.Inst], env: lang.Env) -> \
+        List[ConstraintEnv]:
+    """
+    Solves several analyses with the same direction in one pass, as if they
+    were the components of a product analysis, and returns the result of
+    each one of them. The analyses share the worklist, the flow predecessors
+    and successors of each instruction, and the boundary.
+
+    Each 'reachable' instruction is visited once, and then again whenever
+    the result of one of its flow predecessors changes, for the components
+    where it changed. Unreachable instructions keep the initial value. If an
+    analysis has widening points, up to 'narrowing_rounds' passes over the
+    program then refine its solution, combining values at those points with
+    'narrow'.
+
+    Example:
+        >>> program, env = build_cfg([
+        ...     '{"a": 1, "b": 2}',
+        ...     'x = add a b',
+        ...     'a = add x a',
+        ...     'b = add a x',
+        ... ])
+        >>> from expressions import AvailableExpressions
+        >>> reaching, available = run_fused(
+        ...     [ReachingDefinitions, AvailableExpressions], program, env)
+        >>> reaching == ReachingDefinitions.run(program, env)
+        True
+        >>> available.get('IN_1'), available.get('IN_2')
+        ({('add', 'a', 'b')}, set())
+        >>> run_fused([Liveness, ReachingDefinitions], program, env)
+        Traceback (most recent call last):
+        ...
+        ValueError: the analyses must have the same direction
+    """
+    if len(set([analysis.forward for analysis in analyses])) > 1:
+        raise ValueError('the analyses must have the same direction')
+    bound = [analysis.bind(program) for analysis in analyses]
+    if len(bound) == 0:
+        return []
+    flow = bound[0]
+    live = reachable(program)
+    alive = [False for inst in program]
+    for i in live:
+        alive[i] = True
+    sources = [[src for src in flow.sources(inst) if alive[src.index]]
+               for inst in program]
+    targets = [[target.index for target in flow.targets(inst)
+                if alive[target.index]] for inst in program]
+    on_boundary = [flow.on_boundary(inst) for inst in program]
+    initials = []
+    for analysis in bound:
+        boundary = [analysis.boundary(env)]
+        initials.append([boundary if on_boundary[i] else []
+                         for i in range(len(program))])
+    widening = [analysis.widening_points(program) for analysis in bound]
+    joined = []
+    results = []
+    for analysis in bound:
+        top = analysis.top(program, env)
+        joined.append([top for inst in program])
+        results.append([top for inst in program])
+    # instructions leave the worklist in reverse post-order of the flow
+    # graph, so that most of them are visited after their flow predecessors
+    rank = [0 for inst in program]
+    for (position, i) in enumerate(_flow_order(targets, on_boundary,
+                                               flow.forward)):
+        rank[i] = position
+    worklist = [(rank[i], i) for i in live]
+    heapq.heapify(worklist)
+    # the components of each pending instruction that must be visited again
+    pending = dict([(i, (1 << len(bound)) - 1) for i in live])
+    lookups = [values.__getitem__ for values in results]
+    while len(worklist) > 0:
+        (_, i) = heapq.heappop(worklist)
+        components = pending.pop(i)
+        inst = program[i]
+        for (k, analysis) in enumerate(bound):
+            if not components >> k & 1:
+                continue
+            value = analysis.combine(inst, sources[i], initials[k][i],
+                                     lookups[k], program, env)
+            joined[k][i] = analysis.widen(joined[k][i], value) \
+                if i in widening[k] else value
+            result = analysis.transfer(inst, joined[k][i], env)
+            if result != results[k][i]:
+                results[k][i] = result
+                for target in targets[i]:
+                    if target not in pending:
+                        pending[target] = 0
+                        heapq.heappush(worklist, (rank[target], target))
+                    pending[target] |= 1 << k
+    order = list(live)
+    if not flow.forward:
+        order.reverse()
+    for (k, analysis) in enumerate(bound):
+        rounds = analysis.narrowing_rounds if widening[k] else 0
+        for round in range(rounds):
+            changed = False
+            for i in order:
+                inst = program[i]
+                value = analysis.combine(inst, sources[i], initials[k][i],
+                                         lookups[k], program, env)
+                if i in widening[k]:
+                    value = analysis.narrow(joined[k][i], value)
+                result = analysis.transfer(inst, value, env)
+                if value != joined[k][i] or result != results[k][i]:
+                    (joined[k][i], results[k][i]) = (value, result)
+                    changed = True
+            if not changed:
+                break
+    envs = []
+    for (k, analysis) in enumerate(analyses):
+        (ins, outs) = (joined[k], results[k]) if flow.forward \
+            else (results[k], joined[k])
+        envs.append(analysis.decode(bound[k],
+                                    ConstraintEnv.from_lists(ins, outs)))
+    return envs
+
+
+class Liveness(DataFlowAnalysis):
     """
     Returns the liveness analysis of a program.
     A variable is "alive" at a certain point in the code if it has been
@@ -292,6 +877,9 @@ class Liveness(StaticAnalysis):
 
     (read more in https://homepages.dcc.ufmg.br/~fernando/classes/dcc888/ementa/slides/IntroDataFlow.pdf)
 
+    The variables in 'live_at_exit' are alive once the program ends. By
+    default, no variable is observed after the program ends.
+
     >>> program_lines = [
     ... '{"a": 1, "b": 2}',
     ... 'x = add a b',
@@ -310,34 +898,96 @@ class Liveness(StaticAnalysis):
     >>> result = Liveness.run(program, env)
     >>> result == expected_result
     True
+
+    The constraints derived from the declaration reach the same solution:
+
+    >>> cEnv = Liveness.build_constraint_env(program, env)
+    >>> constraints = Liveness.build_constraints(program, cEnv, env)
+    >>> chaotic_iterations(constraints, cEnv) == expected_result
+    True
     """
 
+    forward = False
+    live_at_exit: Set[str] = set()
+
     @classmethod
-    def IN(cls, instruction: lang.Inst,
-           cEnv: ConstraintEnv,
-           env: lang.Env) -> Callable:
-        def _in():
-            return (cEnv.get(f'OUT_{instruction.index}')
-                    - instruction.definition()) \
-                    | instruction.uses()
-        return _in
+    def with_exit(cls, observable: Set[str]) -> Type['Liveness']:
+        """
+        Returns the analysis where the variables in 'observable' are alive
+        once the program ends, because its caller reads them afterwards.
+
+        Example:
+            >>> program, env = build_cfg(['{"a": 1}', 'x = add a a'])
+            >>> Liveness.with_exit({'x'}).run(program, env).get('IN_0')
+            {'a'}
+            >>> Liveness.with_exit({'x'}).run(program, env).get('OUT_0')
+            {'x'}
+        """
+        class ObservableLiveness(cls):
+            live_at_exit = set(observable)
+        return ObservableLiveness
 
     @classmethod
-    def OUT(cls, instruction: lang.Inst,
-            cEnv: ConstraintEnv,
-            env: lang.Env) -> Callable:
-        if len(instruction.NEXTS) == 0:
-            return lambda: set()
+    def boundary(cls, env: lang.Env) -> set:
+        return set(cls.live_at_exit)
 
-        elif len(instruction.NEXTS) == 1:
-            nxt = instruction.NEXTS[0]
-            return lambda: cEnv.get(f'IN_{nxt.index}')
+    @classmethod
+    def gen(cls, instruction: lang.Inst, env: lang.Env) -> set:
+        return instruction.uses()
 
-        else:
-            first = instruction.NEXTS[0]
-            second = instruction.NEXTS[1]
-            return lambda: cEnv.get(f'IN_{first.index}') \
-                | cEnv.get(f'IN_{second.index}')
+    @classmethod
+    def kill(cls, instruction: lang.Inst, facts: set, env: lang.Env) -> set:
+        return instruction.definition()
+
+
+class ReachingDefinitions(DataFlowAnalysis):
+    """
+    Returns the Reaching Definitions analysis of a program.
+    The definition of a variable reaches a program point if said variable has
+    been defined prior and does not "die" via a new assignment along the way.
+
+    For each instruction
+        p: v = E(s)
+
+    The incoming and outgoing reaching definitions are defined as:
+        IN:  Union(OUT(ps)), ps in pred(p)
+        OUT: Union((IN(p) - {definitions(v)}), {(p, v)})
+
+    Since the program starts with a set environment, definitions from said
+    environment are said to come from instruction -1.
+
+    >>> program_lines = [
+    ... '{"a": 1, "b": 2}',
+    ... 'x = add a b',
+    ... 'a = add x a',
+    ... 'b = add a x',
+    ... ]
+    >>> expected_result = ConstraintEnv({
+    ... 'IN_0': {(-1, 'a'), (-1, 'b')},
+    ... 'OUT_0': {(-1, 'a'), (-1, 'b'), (0, 'x')},
+    ... 'IN_1': {(-1, 'a'), (-1, 'b'), (0, 'x')},
+    ... 'OUT_1': {(-1, 'b'), (0, 'x'), (1, 'a')},
+    ... 'IN_2': {(-1, 'b'), (0, 'x'), (1, 'a')},
+    ... 'OUT_2':{(0, 'x'), (1, 'a'), (2, 'b')},
+    ... })
+    >>> program, env = build_cfg(program_lines)
+    >>> ReachingDefinitions.run(program, env) == expected_result
+    True
+    """
+
+    @classmethod
+    def boundary(cls, env: lang.Env) -> set:
+        return set([(-1, var) for var in env.definitions()])
+
+    @classmethod
+    def gen(cls, instruction: lang.Inst, env: lang.Env) -> set:
+        return set([(instruction.index, var)
+                    for var in instruction.definition()])
+
+    @classmethod
+    def kill(cls, instruction: lang.Inst, facts: set, env: lang.Env) -> set:
+        defs = instruction.definition()
+        return set([fact for fact in facts if fact[1] in defs])
 
 
 def chaotic_iterations(constraints, env):